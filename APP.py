@@ -1,8 +1,8 @@
 import streamlit as st
 from streamlit_lottie import st_lottie
-import requests
-from utils.db import init_db, ensure_default_users, set_password
+from utils.db import init_db, ensure_default_users
 from utils.auth import hash_password
+from utils.assets import load_lottie, LOTTIE_HEALTH_URL, LOTTIE_AI_URL
 
 # -------------------------
 # Page Config
@@ -10,19 +10,10 @@ from utils.auth import hash_password
 st.set_page_config(page_title="Healthcare Recommender", page_icon="🩺", layout="wide")
 
 # -------------------------
-# Lottie loader
+# Lottie assets (disk cache, never blocks on the network)
 # -------------------------
-def load_lottie(url: str):
-    try:
-        r = requests.get(url, timeout=6)
-        if r.status_code == 200:
-            return r.json()
-    except Exception:
-        return None
-    return None
-
-lottie_health = load_lottie("https://assets9.lottiefiles.com/packages/lf20_jcikwtux.json")
-lottie_ai = load_lottie("https://assets7.lottiefiles.com/packages/lf20_q5pk6p1k.json")
+lottie_health = load_lottie(LOTTIE_HEALTH_URL)
+lottie_ai = load_lottie(LOTTIE_AI_URL)
 
 # -------------------------
 # Global CSS (Dark/Light adaptive)
@@ -231,11 +222,14 @@ st.markdown('<div class="footer">⚠️ Demo only — synthetic data. Not a medi
 # -------------------------
 # DB init & demo users
 # -------------------------
-try:
+@st.cache_resource(show_spinner=False)
+def bootstrap_db():
+    # Runs once per process; seed passwords are only hashed while still placeholders
     init_db()
-    ensure_default_users()
-    set_password("admin@demo.com", hash_password("admin123"))
-    set_password("analyst@demo.com", hash_password("analyst123"))
-    set_password("user@demo.com", hash_password("user123"))
+    ensure_default_users(hash_password)
+    return True
+
+try:
+    bootstrap_db()
 except Exception:
     pass
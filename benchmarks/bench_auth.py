@@ -0,0 +1,42 @@
+"""Per-rerun auth overhead: uncached vs cached JWT verification.
+
+Run from the repo root:
+    python -m benchmarks.bench_auth --calls 20000
+"""
+import argparse
+import json
+import time
+
+from utils import auth
+
+
+def _per_call_us(fn, token: str, calls: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        fn(token)
+    return (time.perf_counter() - t0) / calls * 1e6
+
+
+def run(calls: int) -> dict:
+    token = auth.create_jwt({"sub": "1", "email": "user@demo.com", "role": "User"})
+    assert auth.decode_jwt(token, use_cache=False) is not None
+    uncached = _per_call_us(lambda t: auth.decode_jwt(t, use_cache=False), token, calls)
+    auth.decode_jwt(token)
+    cached = _per_call_us(auth.decode_jwt, token, calls)
+    return {
+        "calls": calls,
+        "uncached_us_per_call": round(uncached, 3),
+        "cached_us_per_call": round(cached, 3),
+        "cache": auth.token_cache_stats(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--calls", type=int, default=20000)
+    args = ap.parse_args()
+    print(json.dumps(run(args.calls)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Login throughput benchmark.
+
+Run from the repo root:
+    python -m benchmarks.bench_login --iterations 100000 --workers 4 --logins 200
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import auth
+
+
+def _rate(n: int, seconds: float) -> float:
+    return n / seconds if seconds > 0 else float("inf")
+
+
+def run(iterations: int, workers: int, logins: int, users: int) -> dict:
+    passwords = [f"pw-{i}" for i in range(users)]
+    stored = [auth.hash_password(p, iterations=iterations) for p in passwords]
+    jobs = [(passwords[i % users], stored[i % users]) for i in range(logins)]
+
+    # Baseline: verification inline on the calling thread
+    t0 = time.perf_counter()
+    for pw, h in jobs:
+        assert auth.verify_password(pw, h, iterations=iterations)
+    sync_s = time.perf_counter() - t0
+
+    # Bounded pool; many concurrent callers as in a login storm
+    auth.configure_hash_pool(workers=workers, max_pending=logins)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(workers * 4, 1)) as callers:
+        results = list(callers.map(
+            lambda job: auth.verify_password_async(job[0], job[1], iterations=iterations).result(), jobs))
+    pool_s = time.perf_counter() - t0
+    assert all(results)
+
+    return {
+        "iterations": iterations,
+        "workers": workers,
+        "logins": logins,
+        "distinct_users": users,
+        "sync_logins_per_sec": round(_rate(logins, sync_s), 2),
+        "pooled_logins_per_sec": round(_rate(logins, pool_s), 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--iterations", type=int, nargs="+", default=[auth.PBKDF2_ITERATIONS])
+    ap.add_argument("--workers", type=int, default=auth.HASH_WORKERS)
+    ap.add_argument("--logins", type=int, default=100)
+    ap.add_argument("--users", type=int, default=10)
+    args = ap.parse_args()
+    for it in args.iterations:
+        print(json.dumps(run(it, args.workers, args.logins, args.users)))
+
+
+if __name__ == "__main__":
+    main()
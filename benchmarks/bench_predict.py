@@ -0,0 +1,83 @@
+"""Disease model serving: sklearn pipeline vs the exported NumPy forward pass.
+
+Checks that NumpyMLP.predict_proba matches pipe.predict_proba (exits
+non-zero if not), then reports cold import+load time and per-call latency
+for single rows and batches. Run from the repo root:
+    python -m benchmarks.bench_predict --batch 10000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utils import disease_model
+
+_COLD_NUMPY = "from utils.disease_model import NumpyMLP; NumpyMLP.load()"
+_COLD_SKLEARN = "import joblib; joblib.load('models/disease_model.pkl')"
+
+
+def _cold_seconds(code: str, repeats: int) -> float:
+    # Fresh interpreter each time, so imports are really paid
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-W", "ignore", "-c", code], check=True)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _per_call_us(fn, X, calls: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        fn(X)
+    return (time.perf_counter() - t0) / calls * 1e6
+
+
+def run(batch: int, calls: int, repeats: int, tol: float) -> dict:
+    import joblib
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        pipe = joblib.load(disease_model.MODEL_PKL)
+    model = disease_model.NumpyMLP.load()
+
+    df = pd.read_csv(disease_model.DATA_CSV)
+    rng = np.random.default_rng(0)
+    lo, hi = df[disease_model.FEATURES].min().to_numpy(), df[disease_model.FEATURES].max().to_numpy()
+    X = np.vstack([df[disease_model.FEATURES].to_numpy(dtype=float), rng.uniform(lo, hi, size=(batch, len(lo)))])
+    # sklearn warns when fitted on a DataFrame and given an array; give it the same frame it saw
+    Xdf = pd.DataFrame(X, columns=disease_model.FEATURES)
+
+    diff = float(np.abs(model.predict_proba(X) - pipe.predict_proba(Xdf)).max())
+    same_labels = bool((model.predict(X) == pipe.predict(Xdf)).all())
+    one, one_df = X[:1], Xdf.iloc[:1]
+    return {
+        "parity": {"rows": len(X), "max_abs_proba_diff": diff, "labels_equal": same_labels, "ok": diff <= tol and same_labels},
+        "cold_import_load_s": {"numpy": round(_cold_seconds(_COLD_NUMPY, repeats), 3),
+                               "sklearn": round(_cold_seconds(_COLD_SKLEARN, repeats), 3)},
+        "single_row_us": {"numpy": round(_per_call_us(model.predict_proba, one, calls), 2),
+                          "sklearn": round(_per_call_us(pipe.predict_proba, one_df, calls), 2)},
+        f"batch_{len(X)}_ms": {"numpy": round(_per_call_us(model.predict_proba, X, 20) / 1000, 3),
+                               "sklearn": round(_per_call_us(pipe.predict_proba, Xdf, 20) / 1000, 3)},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--batch", type=int, default=10_000, help="random rows added to the parity/batch set")
+    ap.add_argument("--calls", type=int, default=2000, help="single-row calls timed")
+    ap.add_argument("--repeats", type=int, default=3, help="cold-start runs (best is reported)")
+    ap.add_argument("--tol", type=float, default=1e-9)
+    args = ap.parse_args()
+    out = run(args.batch, args.calls, args.repeats, args.tol)
+    print(json.dumps(out, indent=2))
+    if not out["parity"]["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
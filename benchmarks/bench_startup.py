@@ -0,0 +1,46 @@
+"""Landing page (APP.py) render latency, measured with Streamlit's AppTest.
+
+Run from the repo root:
+    python -m benchmarks.bench_startup --runs 20
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+import utils.db as db
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def run(runs: int) -> dict:
+    # Keep the benchmark away from data/app.db
+    db.DB_PATH = Path(tempfile.mkdtemp()) / "bench.db"
+    times = []
+    for _ in range(runs):
+        at = AppTest.from_file(str(ROOT / "APP.py"), default_timeout=60)
+        t0 = time.perf_counter()
+        at.run()
+        times.append((time.perf_counter() - t0) * 1000)
+        assert not at.exception, at.exception
+    return {
+        "runs": runs,
+        "first_ms": round(times[0], 2),
+        "median_ms": round(statistics.median(times), 2),
+        "max_ms": round(max(times), 2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=20)
+    args = ap.parse_args()
+    print(json.dumps(run(args.runs)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Latency/memory benchmark for every recommender path.
+
+Generates (or reuses) a synthetic dataset, points the app modules at it and
+reports p50/p95/p99 latency plus peak allocation per case as JSON:
+
+    python -m benchmarks.run --items 100000 --ratings 1000000 --out bench.json
+    python -m benchmarks.run --data-dir /tmp/synth --baseline bench.json --max-regression 1.25
+
+With --baseline the run exits non-zero if any case's p95 grew by more than
+--max-regression times.
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synth
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _point_at(paths: dict):
+    import utils.db as db
+    import utils.graph_rec as graph_rec
+    import utils.recommender as rec
+    db.DB_PATH = paths["db"]
+    rec.ITEMS_CSV = paths["items"]
+    graph_rec.ITEMS_CSV = paths["items"]
+    graph_rec.MEDICINES_CSV = paths["medicines"]
+    rec.load_items()
+
+
+def _cases(rng: np.random.Generator):
+    """name -> zero-arg callable drawing fresh random inputs on every call."""
+    import utils.db as db
+    import utils.recommender as rec
+    from utils.analytics import kpis
+    from utils.graph_rec import graph_recommend
+
+    items = rec.get_items_df()
+    item_ids = items["item_id"].to_numpy()
+    conditions = items["condition"].unique()
+    ratings = pd.DataFrame([dict(r) for r in db.fetch_ratings()])
+    users = ratings["user_id"].unique() if not ratings.empty else np.array([1])
+    queries = ["plan", "routine", "heart", "sleep", "diet", "walk"]
+
+    def liked():
+        return rng.choice(item_ids, size=min(5, len(item_ids)), replace=False).tolist()
+
+    def recs():
+        return rec.content_based_for_user(liked(), top_k=20)
+
+    return {
+        "content_similar_items": lambda: rec.content_similar_items(int(rng.choice(item_ids)), top_k=10),
+        "content_based_for_user": lambda: rec.content_based_for_user(liked(), top_k=10),
+        "user_user_collab": lambda: rec.user_user_collab(ratings.copy(), int(rng.choice(users)), top_k=10),
+        "hybrid_recommendation": lambda: rec.hybrid_recommendation(liked(), ratings.copy(), int(rng.choice(users)), top_k=10),
+        "context_adjust": (lambda r: lambda: rec.context_adjust(r, time_of_day="morning"))(recs()),
+        "graph_recommend": lambda: graph_recommend(str(rng.choice(conditions)), top_k=10),
+        "simple_search": lambda: rec.simple_search(str(rng.choice(queries)), top_k=10),
+        "kpis": kpis,
+    }
+
+
+def _measure(fn, runs: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        fn()
+    times = np.empty(runs)
+    for i in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times[i] = (time.perf_counter() - t0) * 1000
+    # Peak allocation from one extra traced call (tracing slows everything down)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {"runs": runs, "mean_ms": round(float(times.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+            "peak_alloc_mb": round(peak / 2**20, 3)}
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list:
+    regressions = []
+    for name, cur in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old and old["p95_ms"] > 0 and cur["p95_ms"] / old["p95_ms"] > max_regression:
+            regressions.append({"case": name, "baseline_p95_ms": old["p95_ms"], "p95_ms": cur["p95_ms"]})
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    synth.add_size_args(ap)
+    ap.add_argument("--data-dir", type=Path, help="reuse a dataset written by benchmarks.synth")
+    ap.add_argument("--runs", type=int, default=50)
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--only", nargs="*", help="subset of case names")
+    ap.add_argument("--out", type=Path, help="write the JSON report here (default: stdout)")
+    ap.add_argument("--baseline", type=Path)
+    ap.add_argument("--max-regression", type=float, default=1.25)
+    args = ap.parse_args()
+
+    sizes = {k: getattr(args, k) for k in ("items", "medicines", "users", "ratings", "activities")}
+    if args.data_dir:
+        paths = {"items": args.data_dir / "items.csv", "medicines": args.data_dir / "medicines.csv",
+                 "db": args.data_dir / "app.db"}
+        sizes = {"data_dir": str(args.data_dir)}
+    else:
+        t0 = time.perf_counter()
+        paths = synth.generate(Path(tempfile.mkdtemp(prefix="healthrec-bench-")), seed=args.seed, **sizes)
+        sizes["generate_s"] = round(time.perf_counter() - t0, 2)
+
+    t0 = time.perf_counter()
+    _point_at(paths)
+    load_s = time.perf_counter() - t0
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for name, fn in _cases(rng).items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = _measure(fn, args.runs, args.warmup)
+        print(f"{name:24s} p50={results[name]['p50_ms']:.2f}ms p99={results[name]['p99_ms']:.2f}ms", file=sys.stderr)
+
+    report = {
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "sizes": sizes,
+        "catalog_load_s": round(load_s, 3),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": results,
+    }
+    code = 0
+    if args.baseline:
+        report["regressions"] = compare(report, json.loads(args.baseline.read_text()), args.max_regression)
+        code = 1 if report["regressions"] else 0
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(text)
+    else:
+        print(text)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
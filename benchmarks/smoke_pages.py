@@ -0,0 +1,65 @@
+"""Render the landing page and every Streamlit page once per role with AppTest.
+
+Fails (exit 1) if any render raises, so a page crash is caught before it
+ships. Runs against a scratch copy of data/app.db. From the repo root:
+    python -m benchmarks.smoke_pages
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+import utils.db as db
+
+ROOT = Path(__file__).resolve().parents[1]
+ROLES = (None, "User", "Analyst", "Admin")
+
+
+def _scripts():
+    return [ROOT / "APP.py"] + sorted((ROOT / "pages").glob("*.py"))
+
+
+def run(timeout: float) -> list:
+    # Keep renders (and the catalog they build) away from data/app.db
+    scratch = Path(tempfile.mkdtemp()) / "app.db"
+    if db.DB_PATH.exists():
+        shutil.copy(db.DB_PATH, scratch)
+    db.DB_PATH = scratch
+    db.init_db()
+    from utils.auth import create_jwt
+
+    failures = []
+    for script in _scripts():
+        for role in ROLES:
+            # Absolute path: AppTest resolves relative ones against this file
+            at = AppTest.from_file(str(script), default_timeout=timeout)
+            if role:
+                at.session_state["token"] = create_jwt({"sub": "1", "email": f"{role.lower()}@smoke.test", "role": role})
+            try:
+                at.run()
+                errors = [e.message for e in at.exception]
+            except Exception as e:
+                errors = [f"{type(e).__name__}: {e}"]
+            status = "FAIL" if errors else "ok"
+            print(f"{status:4s} {script.name} as {role or 'anonymous'}", file=sys.stderr)
+            if errors:
+                failures.append({"page": script.name, "role": role, "errors": errors})
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--timeout", type=float, default=60.0, help="seconds allowed per render")
+    args = ap.parse_args()
+    failures = run(args.timeout)
+    print(json.dumps({"failures": failures}, indent=2))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
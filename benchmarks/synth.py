@@ -0,0 +1,133 @@
+"""Synthetic data generator for the benchmarks.
+
+Writes items.csv, medicines.csv and an app.db (users, ratings, activities)
+shaped like the files in data/, scaled to the requested sizes:
+
+    python -m benchmarks.synth --out /tmp/synth --items 100000 --ratings 1000000
+"""
+import argparse
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import utils.db as db
+
+CONDITIONS = ["hypertension", "diabetes", "asthma", "insomnia", "anxiety", "obesity",
+              "arthritis", "migraine", "depression", "cholesterol"]
+TIMESLOTS = ["morning", "afternoon", "evening", "night", "any"]
+KINDS = ["diet", "exercise", "education", "sleep", "meditation", "tracking", "recipe", "routine"]
+WORDS = ["plan", "guide", "routine", "heart", "sugar", "breathing", "walk", "stretch", "calm",
+         "sodium", "fiber", "protein", "tips", "weekly", "daily", "gentle", "support", "health",
+         "blood", "pressure", "stress", "relief", "habit", "focus", "energy", "balance"]
+EVENT_TYPES = ["view", "like", "skip"]
+CHUNK = 200_000
+
+
+def _text(rng: np.random.Generator, n: int, words: int) -> np.ndarray:
+    # Mix a fixed vocabulary with numbered tokens so the TF-IDF vocabulary grows with n
+    vocab = np.array(WORDS + [f"term{i}" for i in range(max(100, n // 20))])
+    picks = vocab[rng.integers(0, len(vocab), size=(n, words))]
+    return np.array([" ".join(r) for r in picks])
+
+
+def write_items(path: Path, n: int, rng: np.random.Generator):
+    first = True
+    for start in range(0, n, CHUNK):
+        m = min(CHUNK, n - start)
+        cond = np.array(CONDITIONS)[rng.integers(0, len(CONDITIONS), m)]
+        kind = np.array(KINDS)[rng.integers(0, len(KINDS), m)]
+        slot = np.array(TIMESLOTS)[rng.integers(0, len(TIMESLOTS), m)]
+        df = pd.DataFrame({
+            "item_id": np.arange(start + 1, start + m + 1),
+            "title": np.char.add(np.char.add(np.char.capitalize(kind.astype(str)), " "), _text(rng, m, 3)),
+            "tags": np.char.add(np.char.add(np.char.add(kind.astype(str), ","), np.char.add(cond.astype(str), ",")), slot.astype(str)),
+            "description": _text(rng, m, 12),
+            "condition": cond,
+            "timeslot": slot,
+            "popularity": rng.integers(0, 100, m),
+        })
+        df.to_csv(path, mode="w" if first else "a", header=first, index=False)
+        first = False
+
+
+def write_medicines(path: Path, n: int, rng: np.random.Generator):
+    cond = np.array(CONDITIONS)[rng.integers(0, len(CONDITIONS), n)]
+    df = pd.DataFrame({
+        "medicine_id": np.arange(101, 101 + n),
+        "name": [f"Med{i}" for i in range(n)],
+        "for_condition": cond,
+        "contraindications": [f"allergy-{i % 50}" for i in range(n)],
+        "common_side_effects": "nausea,dizziness",
+        "description": _text(rng, n, 8),
+    })
+    df.to_csv(path, index=False)
+
+
+def write_db(path: Path, users: int, items: int, ratings: int, activities: int, rng: np.random.Generator):
+    old = db.DB_PATH
+    db.DB_PATH = path
+    try:
+        db.init_db()
+    finally:
+        db.DB_PATH = old
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany("INSERT INTO users(id, email, password_hash, role) VALUES(?,?,?,?)",
+                     ((i, f"user{i}@synth", "x", "User") for i in range(1, users + 1)))
+    # Zipf-ish item choice so a few items are popular, like real traffic
+    def item_ids(m):
+        return np.minimum(rng.zipf(1.3, m), items).astype(int)
+    for start in range(0, ratings, CHUNK):
+        m = min(CHUNK, ratings - start)
+        rows = zip(rng.integers(1, users + 1, m).tolist(), item_ids(m).tolist(),
+                   rng.choice([1, -1], m, p=[0.7, 0.3]).tolist())
+        conn.executemany("INSERT OR IGNORE INTO ratings(user_id, item_id, rating) VALUES(?,?,?)", rows)
+    base = np.datetime64("2025-01-01T00:00:00")
+    for start in range(0, activities, CHUNK):
+        m = min(CHUNK, activities - start)
+        ts = (base + rng.integers(0, 365 * 86400, m).astype("timedelta64[s]")).astype(str)
+        rows = zip(rng.integers(1, users + 1, m).tolist(),
+                   np.array(EVENT_TYPES)[rng.integers(0, 3, m)].tolist(),
+                   item_ids(m).tolist(), [t.replace("T", " ") for t in ts], [""] * m)
+        conn.executemany("INSERT INTO activities(user_id, type, item_id, timestamp, meta) VALUES(?,?,?,?,?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def generate(out: Path, items: int = 10_000, medicines: int = 1_000, users: int = 1_000,
+             ratings: int = 10_000, activities: int = 10_000, seed: int = 0) -> dict:
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = {"items": out / "items.csv", "medicines": out / "medicines.csv", "db": out / "app.db"}
+    if paths["db"].exists():
+        paths["db"].unlink()
+    write_items(paths["items"], items, rng)
+    write_medicines(paths["medicines"], medicines, rng)
+    write_db(paths["db"], users, items, ratings, activities, rng)
+    return paths
+
+
+def add_size_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--items", type=int, default=10_000)
+    ap.add_argument("--medicines", type=int, default=1_000)
+    ap.add_argument("--users", type=int, default=1_000)
+    ap.add_argument("--ratings", type=int, default=10_000)
+    ap.add_argument("--activities", type=int, default=10_000)
+    ap.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--out", type=Path, required=True)
+    add_size_args(ap)
+    args = ap.parse_args()
+    paths = generate(args.out, args.items, args.medicines, args.users, args.ratings, args.activities, args.seed)
+    print({k: str(v) for k, v in paths.items()})
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import streamlit as st
 from utils.db import init_db, get_user_by_email, insert_user
-from utils.auth import hash_password, verify_password, create_jwt, decode_jwt
+from utils.auth import hash_password_async, verify_password_async, create_jwt
+from utils.session import current_user, logout
 
 st.title("👤 Login / Signup")
 
@@ -17,7 +18,10 @@ if mode == "Signup":
         if not email or not password:
             st.error("Please provide email and password.")
         else:
-            ok, err = insert_user(email, hash_password(password), role)
+            try:
+                ok, err = insert_user(email, hash_password_async(password).result(), role)
+            except RuntimeError as e:
+                ok, err = False, str(e)
             if ok:
                 st.success("Account created. You can Login now.")
             else:
@@ -28,19 +32,22 @@ else:
         if not user:
             st.error("No such user")
         else:
-            if verify_password(password, user["password_hash"]):
-                token = create_jwt({"sub": user["id"], "email": user["email"], "role": user["role"]})
+            try:
+                valid = verify_password_async(password, user["password_hash"]).result()
+            except RuntimeError as e:
+                st.error(str(e))
+                st.stop()
+            if valid:
+                token = create_jwt({"sub": str(user["id"]), "email": user["email"], "role": user["role"]})
                 st.session_state["token"] = token
                 st.session_state["user"] = {"id": user["id"], "email": user["email"], "role": user["role"]}
                 st.success(f"Welcome {user['email']}! Use the sidebar to navigate.")
             else:
                 st.error("Invalid password")
 
-if "token" in st.session_state:
-    dec = decode_jwt(st.session_state["token"])
-    if dec:
-        st.info(f"Logged in as **{dec.get('email')}** ({dec.get('role')})")
-        if st.button("Logout"):
-            for k in ["token","user"]:
-                st.session_state.pop(k, None)
-            st.rerun()
+me = current_user()
+if me:
+    st.info(f"Logged in as **{me['email']}** ({me['role']})")
+    if st.button("Logout"):
+        logout()
+        st.rerun()
@@ -1,11 +1,14 @@
 import streamlit as st
-import pandas as pd
-from pathlib import Path
 from utils.sentiment import sentiment_score
+from utils.db import init_db, add_review, medicine_sentiment
+from utils.session import current_user
+from utils.catalog_store import medicines_frame
 
 st.title("💊 Medicine Recommendation")
 
-meds = pd.read_csv(Path(__file__).resolve().parents[1] / "data" / "medicines.csv")
+init_db()
+
+meds = medicines_frame()
 
 condition = st.selectbox("Select condition", sorted(meds["for_condition"].unique().tolist()))
 allergies = st.text_input("Known allergies (comma separated, e.g., allergy-ace, allergy-metformin)")
@@ -21,6 +24,26 @@ if allergies:
         return contras.isdisjoint(bad)
     rec = rec[rec.apply(safe, axis=1)]
 
+# Order by aggregated review sentiment (one indexed lookup per medicine)
+agg = medicine_sentiment(rec["medicine_id"].tolist())
+rec["sentiment"] = rec["medicine_id"].map(lambda m: agg[m]["decayed_mean"] if m in agg else 0.0)
+rec["reviews"] = rec["medicine_id"].map(lambda m: agg[m]["n"] if m in agg else 0)
+rec = rec.sort_values(["sentiment", "reviews"], ascending=False)
+
+def submit_review(medicine_id: int, key: str):
+    # Saved once: the input is cleared, and the same text is never stored twice for a medicine
+    review = st.session_state.get(key, "").strip()
+    submitted = st.session_state.setdefault("reviews_submitted", set())
+    if review and (medicine_id, review) not in submitted:
+        user = current_user()
+        add_review(user["id"] if user else None, medicine_id, review, sentiment_score(review))
+        submitted.add((medicine_id, review))
+        st.session_state["review_saved"] = True
+    st.session_state[key] = ""
+
+if st.session_state.pop("review_saved", False):
+    st.success("Review saved.")
+
 st.write("### Recommendations")
 if rec.empty:
     st.info("No safe medicines found given current filters.")
@@ -30,9 +53,13 @@ else:
             st.subheader(row["name"])
             st.caption(f"For: {row['for_condition']} | Contraindications: {row['contraindications']}")
             st.write(row["description"])
+            if row["reviews"]:
+                st.caption(f"Review sentiment: {row['sentiment']:.2f} (−1..+1) from {int(row['reviews'])} review(s)")
             review = st.text_input(f"Write an optional review for {row['name']}:", key=f"rv_{row['medicine_id']}")
             if review:
                 s = sentiment_score(review)
                 st.caption(f"Detected sentiment score: {s:.2f} (−1..+1)")
+                st.button("Submit review", key=f"rvsub_{row['medicine_id']}", on_click=submit_review,
+                          args=(int(row["medicine_id"]), f"rv_{row['medicine_id']}"))
 
 st.warning("This demo is **not** medical advice. Always consult a qualified doctor or pharmacist.")
@@ -1,25 +1,22 @@
 import streamlit as st
-import pandas as pd
+import tempfile
 from pathlib import Path
+from utils.session import require_user
+from utils.catalog_store import get_catalog
+from utils.db import init_db, upsert_item, delete_item, import_catalog_csv, export_catalog_csv, catalog_version
 
 st.title("🛠️ Admin Panel")
 
 # -------------------------
 # Admin check
 # -------------------------
-user = st.session_state.get("user")
-if not user or user.get("role") != "Admin":
-    st.warning("Admin only. Please login with an Admin account.")
-    st.stop()
+user = require_user(roles=("Admin",), message="Admin only. Please login with an Admin account.")
 
 # -------------------------
-# CSV path and load
+# Load (items live in SQLite; the admin waits for the shared catalog to catch up with their writes)
 # -------------------------
-items_path = Path(__file__).resolve().parents[1] / "data" / "items.csv"
-df = pd.read_csv(items_path, dtype={
-    "item_id": int, "title": str, "tags": str, "description": str,
-    "condition": str, "timeslot": str, "popularity": int
-})
+init_db()
+df = get_catalog(wait=True).items_frame()
 
 # -------------------------
 # Display current items
@@ -56,11 +53,8 @@ with st.form("item_form"):
             "timeslot": timeslot,
             "popularity": int(popularity)
         }
-        # Remove old item if editing
-        df = df[df["item_id"] != int(item_id)]
-        # Append new row
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-        df.to_csv(items_path, index=False)
+        # Insert, or replace if editing
+        upsert_item(new_row)
         st.success(f"Item {item_id} saved successfully.")
         st.rerun()  # stable rerun
 
@@ -71,10 +65,39 @@ st.write("### Delete Item")
 del_id = st.number_input("item_id to delete", value=1, min_value=1, step=1)
 
 if st.button("Delete Item"):
-    if del_id in df["item_id"].values:
-        df = df[df["item_id"] != del_id]
-        df.to_csv(items_path, index=False)
+    if delete_item(int(del_id)):
         st.success(f"Deleted item_id {del_id}.")
         st.rerun()
     else:
         st.warning("No such item_id exists.")
+
+# -------------------------
+# Import / Export
+# -------------------------
+st.write("### Import / Export")
+items_file = st.file_uploader("Items CSV", type="csv", key="items_csv")
+meds_file = st.file_uploader("Medicines CSV", type="csv", key="meds_csv")
+replace = st.checkbox("Replace existing rows (otherwise upsert by id)")
+if st.button("Import", disabled=not (items_file or meds_file)):
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for name, f in (("items", items_file), ("medicines", meds_file)):
+            if f is not None:
+                paths[name] = Path(tmp) / f"{name}.csv"
+                paths[name].write_bytes(f.getvalue())
+        n_items, n_meds = import_catalog_csv(paths.get("items"), paths.get("medicines"), replace=replace)
+    st.success(f"Imported {n_items} item rows and {n_meds} medicine rows.")
+    st.rerun()
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def export_csv(version: int):
+    # Regenerated only when the catalog changes, not on every rerun
+    with tempfile.TemporaryDirectory() as tmp:
+        out_items, out_meds = Path(tmp) / "items.csv", Path(tmp) / "medicines.csv"
+        export_catalog_csv(out_items, out_meds)
+        return out_items.read_bytes(), out_meds.read_bytes()
+
+items_csv, meds_csv = export_csv(catalog_version())
+c1, c2 = st.columns(2)
+c1.download_button("Export items CSV", items_csv, file_name="items.csv", mime="text/csv")
+c2.download_button("Export medicines CSV", meds_csv, file_name="medicines.csv", mime="text/csv")
@@ -2,14 +2,13 @@ import streamlit as st
 import pandas as pd
 from utils.db import fetch_user_events, fetch_ratings
 from utils.analytics import kpis
+from utils.session import require_user
+from utils import metrics as stage_metrics
 
 st.title("📊 Analytics Dashboard")
 
 # check user permissions
-user = st.session_state.get("user")
-if not user or user["role"] not in ("Admin", "Analyst"):
-    st.warning("Analyst/Admin only. Please login with sufficient permissions.")
-    st.stop()
+user = require_user(roles=("Admin", "Analyst"), message="Analyst/Admin only. Please login with sufficient permissions.")
 
 # --- Key Metrics ---
 st.write("### Key Metrics")
@@ -31,3 +30,22 @@ if ratings.empty:
     st.info("No ratings recorded yet.")
 else:
     st.dataframe(ratings)
+
+# --- Performance ---
+st.write("### Performance (this server process)")
+on = st.toggle("Collect stage timings", value=stage_metrics.enabled())
+if on != stage_metrics.enabled():
+    stage_metrics.enable(on)
+stages = pd.DataFrame(stage_metrics.snapshot())
+if stages.empty:
+    st.info("No timings recorded yet. Enable collection and use the recommendation pages.")
+else:
+    st.dataframe(stages, use_container_width=True)
+    counts = stage_metrics.counters()
+    if counts:
+        st.json(counts)
+    st.download_button("Download Prometheus metrics", stage_metrics.prometheus_text(),
+                       file_name="healthrec_metrics.prom", mime="text/plain")
+    if st.button("Reset timings"):
+        stage_metrics.reset()
+        st.rerun()
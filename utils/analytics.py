@@ -1,5 +1,6 @@
 import pandas as pd
 from .db import fetch_user_events, fetch_ratings
+from .metrics import timed
 
 def _find_col(df: pd.DataFrame, candidates):
     """Return actual column name from df that matches any candidate (case-insensitive), or None."""
@@ -11,6 +12,7 @@ def _find_col(df: pd.DataFrame, candidates):
             return cols_map[cand.lower()]
     return None
 
+@timed()
 def kpis():
     events = pd.DataFrame(fetch_user_events())
     ratings = pd.DataFrame(fetch_ratings())
@@ -55,6 +57,7 @@ def kpis():
         "Unique users (approx)": int(total_users),
     }
 
+@timed()
 def algo_performance():
     ratings = pd.DataFrame(fetch_ratings())
     if ratings.empty:
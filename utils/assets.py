@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+LOTTIE_DIR = ROOT / "data" / "lottie"
+# url -> sha256 of the cached JSON; the JSON itself lives in <sha256>.json
+LOTTIE_INDEX = LOTTIE_DIR / "index.json"
+
+LOTTIE_HEALTH_URL = "https://assets9.lottiefiles.com/packages/lf20_jcikwtux.json"
+LOTTIE_AI_URL = "https://assets7.lottiefiles.com/packages/lf20_q5pk6p1k.json"
+
+# Seconds before a failed download of a url is tried again
+RETRY_SECONDS = 60.0
+
+_loaded: Dict[str, dict] = {}
+_refreshing = set()
+_failed_at: Dict[str, float] = {}
+_lock = threading.Lock()
+
+def _read_index() -> Dict[str, str]:
+    try:
+        return json.loads(LOTTIE_INDEX.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def _atomic_write(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def _read_cached(url: str) -> Optional[dict]:
+    digest = _read_index().get(url)
+    if not digest:
+        return None
+    try:
+        raw = (LOTTIE_DIR / f"{digest}.json").read_bytes()
+    except OSError:
+        return None
+    # Ignore a corrupted or partially written file
+    if hashlib.sha256(raw).hexdigest() != digest:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+def _fetch(url: str, timeout: float):
+    try:
+        import requests
+        r = requests.get(url, timeout=timeout)
+        if r.status_code != 200:
+            return
+        raw = r.content
+        data = json.loads(raw)
+        digest = hashlib.sha256(raw).hexdigest()
+        LOTTIE_DIR.mkdir(parents=True, exist_ok=True)
+        _atomic_write(LOTTIE_DIR / f"{digest}.json", raw)
+        with _lock:
+            index = _read_index()
+            index[url] = digest
+            _atomic_write(LOTTIE_INDEX, json.dumps(index, indent=2).encode("utf-8"))
+            _loaded[url] = data
+            _failed_at.pop(url, None)
+    except Exception:
+        pass
+    finally:
+        with _lock:
+            _refreshing.discard(url)
+
+def refresh_lottie(url: str, timeout: float = 6.0, force: bool = False):
+    """Fetch `url` into the on-disk cache on a background thread (at most one per url).
+
+    After a failed fetch the url is retried only once RETRY_SECONDS have passed, unless `force`.
+    """
+    with _lock:
+        if url in _refreshing:
+            return
+        if not force and time.monotonic() - _failed_at.get(url, -RETRY_SECONDS) < RETRY_SECONDS:
+            return
+        _refreshing.add(url)
+        # Cleared again by a successful fetch
+        _failed_at[url] = time.monotonic()
+    threading.Thread(target=_fetch, args=(url, timeout), daemon=True, name="lottie-refresh").start()
+
+def load_lottie(url: str, fetch_missing: bool = True) -> Optional[dict]:
+    """Return Lottie JSON from the process/disk cache without touching the network.
+
+    A cache miss returns None and, if `fetch_missing`, starts a background
+    download so a later render can show the animation. Misses are not
+    cached, so a url whose download failed is fetched again later.
+    """
+    with _lock:
+        if url in _loaded:
+            return _loaded[url]
+    data = _read_cached(url)
+    if data is not None:
+        with _lock:
+            data = _loaded.setdefault(url, data)
+    elif fetch_missing:
+        refresh_lottie(url)
+    return data
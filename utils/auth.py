@@ -1,4 +1,6 @@
-import os, time, base64, json, hashlib, hmac
+import os, time, base64, json, hashlib, hmac, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
 from typing import Optional, Dict
 import jwt
 
@@ -6,24 +8,72 @@ import jwt
 SECRET = os.environ.get("JWT_SECRET", "dev_secret_change_me")
 ALG = "HS256"
 
-def _pbkdf2_hash(password: str, salt: Optional[bytes] = None) -> str:
+PBKDF2_ITERATIONS = 100_000
+# hashlib releases the GIL while hashing, so a small thread pool gives real parallelism
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", min(4, os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", HASH_WORKERS * 4))
+HASH_QUEUE_TIMEOUT = 5.0
+
+def _pbkdf2_hash(password: str, salt: Optional[bytes] = None, iterations: int = PBKDF2_ITERATIONS) -> str:
     if salt is None:
         salt = os.urandom(16)
-    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, 100_000)
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
     return base64.b64encode(salt + dk).decode("utf-8")
 
 def _split_hash(stored: str):
     raw = base64.b64decode(stored.encode("utf-8"))
     return raw[:16], raw[16:]
 
-def hash_password(password: str) -> str:
-    return _pbkdf2_hash(password)
+def hash_password(password: str, iterations: int = PBKDF2_ITERATIONS) -> str:
+    return _pbkdf2_hash(password, iterations=iterations)
 
-def verify_password(password: str, stored: str) -> bool:
-    salt, dk = _split_hash(stored)
-    candidate = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, 100_000)
+def verify_password(password: str, stored: str, iterations: int = PBKDF2_ITERATIONS) -> bool:
+    # Deliberately uncached: every attempt pays the full PBKDF2 cost. Repeat
+    # requests from a logged-in user are served by the token cache instead.
+    try:
+        salt, dk = _split_hash(stored)
+    except Exception:
+        return False
+    candidate = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
     return hmac.compare_digest(candidate, dk)
 
+# -------------------------
+# Bounded hashing pool
+# -------------------------
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_slots: Optional[threading.BoundedSemaphore] = None
+_pool_lock = threading.Lock()
+
+def configure_hash_pool(workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+    """(Re)create the worker pool; at most `max_pending` jobs may be queued or running."""
+    global _pool, _pool_slots
+    with _pool_lock:
+        old = _pool
+        _pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="pbkdf2")
+        _pool_slots = threading.BoundedSemaphore(max(1, max_pending))
+    if old is not None:
+        old.shutdown(wait=False)
+
+def _submit(fn, *args, **kwargs) -> Future:
+    if _pool is None:
+        configure_hash_pool()
+    pool, slots = _pool, _pool_slots
+    if not slots.acquire(timeout=HASH_QUEUE_TIMEOUT):
+        raise RuntimeError("Password hashing pool is saturated, try again shortly")
+    try:
+        fut = pool.submit(fn, *args, **kwargs)
+    except Exception:
+        slots.release()
+        raise
+    fut.add_done_callback(lambda _: slots.release())
+    return fut
+
+def hash_password_async(password: str, iterations: int = PBKDF2_ITERATIONS) -> Future:
+    return _submit(hash_password, password, iterations=iterations)
+
+def verify_password_async(password: str, stored: str, iterations: int = PBKDF2_ITERATIONS) -> Future:
+    return _submit(verify_password, password, stored, iterations=iterations)
+
 def create_jwt(payload: Dict, exp_seconds: int = 60*60*8) -> str:
     now = int(time.time())
     token = jwt.encode(
@@ -33,8 +83,54 @@ def create_jwt(payload: Dict, exp_seconds: int = 60*60*8) -> str:
     )
     return token
 
-def decode_jwt(token: str) -> Optional[Dict]:
+# Verified-token cache: sha256(token) -> claims. Entries are dropped once their
+# `exp` passes, and the whole cache is cleared when the signing key rotates.
+TOKEN_CACHE_SIZE = 4096
+_token_cache: "OrderedDict[bytes, Dict]" = OrderedDict()
+_token_lock = threading.Lock()
+_token_stats = {"hits": 0, "misses": 0}
+
+def _decode_jwt_uncached(token: str) -> Optional[Dict]:
     try:
         return jwt.decode(token, SECRET, algorithms=[ALG])
     except Exception:
         return None
+
+def decode_jwt(token: str, use_cache: bool = True) -> Optional[Dict]:
+    if not token:
+        return None
+    if not use_cache:
+        return _decode_jwt_uncached(token)
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    now = time.time()
+    with _token_lock:
+        claims = _token_cache.get(key)
+        if claims is not None:
+            if claims.get("exp", now + 1) > now:
+                _token_cache.move_to_end(key)
+                _token_stats["hits"] += 1
+                return dict(claims)
+            del _token_cache[key]
+        _token_stats["misses"] += 1
+        secret = SECRET
+    claims = _decode_jwt_uncached(token)
+    if claims is not None:
+        with _token_lock:
+            # Don't cache a result verified with a key rotated out meanwhile
+            if secret == SECRET:
+                _token_cache[key] = claims
+                if len(_token_cache) > TOKEN_CACHE_SIZE:
+                    _token_cache.popitem(last=False)
+        claims = dict(claims)
+    return claims
+
+def rotate_secret(new_secret: str):
+    """Switch the JWT signing key; tokens signed with the old key stop verifying."""
+    global SECRET
+    with _token_lock:
+        SECRET = new_secret
+        _token_cache.clear()
+
+def token_cache_stats() -> Dict[str, int]:
+    with _token_lock:
+        return {**_token_stats, "size": len(_token_cache)}
@@ -0,0 +1,255 @@
+"""Bulk CSV / JSONL import and export for ratings, activities, users and the catalog.
+
+    python -m utils.bulk import ratings history.csv
+    python -m utils.bulk import activities events.jsonl.gz --batch-size 100000
+    python -m utils.bulk export ratings backup/ratings.csv.gz
+
+Imports stream the file in batches through executemany inside large
+transactions, with durability pragmas relaxed; on offline or new databases
+--defer-indexes also drops secondary indexes for the load and rebuilds them
+once at the end. Exports stream rows from the cursor, so neither direction
+holds the table in memory.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from . import db
+
+TABLES = ["ratings", "activities", "users", "items", "medicines"]
+# How rows that collide with an existing key are handled
+CONFLICT = {"ratings": "OR REPLACE", "activities": "", "users": "OR IGNORE",
+            "items": "OR REPLACE", "medicines": "OR REPLACE"}
+CATALOG_TABLES = ("items", "medicines")
+
+BATCH_SIZE = 50_000
+# Rows per transaction; bounds the rollback journal during very large loads
+COMMIT_EVERY = 2_000_000
+
+ProgressFn = Callable[[int, float], None]
+
+
+def _open(path: Path, mode: str, gz: Optional[bool] = None):
+    if str(path).endswith(".gz") if gz is None else gz:
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _fmt(path: Path, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    name = str(path).lower().removesuffix(".gz")
+    if name.endswith(".jsonl") or name.endswith(".ndjson"):
+        return "jsonl"
+    return "csv"
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r["name"] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+Record = Tuple[Tuple[str, ...], tuple]  # (columns, values)
+
+
+def _read_rows(f: io.TextIOBase, fmt: str, allowed: List[str], name: str = "input") -> Iterator[Record]:
+    """(columns, values) per record, restricted to the table's columns.
+
+    CSV records all share the header's columns. A JSONL record has whichever
+    of the table's columns it sets, so keys missing from it keep their defaults.
+    """
+    if fmt == "csv":
+        reader = csv.reader(f)
+        header = next(reader, [])
+        keep = [(n, c.strip()) for n, c in enumerate(header) if c.strip() in allowed]
+        cols = tuple(c for _, c in keep)
+        idx = [n for n, _ in keep]
+        if not cols:
+            raise ValueError(f"{name} has no columns matching the table")
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(header):
+                raise ValueError(f"{name} line {reader.line_num}: expected {len(header)} fields, got {len(row)}")
+            yield cols, tuple(row[i] if row[i] != "" else None for i in idx)
+        return
+    for line_no, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        rec = json.loads(line)
+        if not isinstance(rec, dict):
+            raise ValueError(f"{name} line {line_no}: expected a JSON object")
+        cols = tuple(c for c in allowed if c in rec)
+        if not cols:
+            raise ValueError(f"{name} line {line_no}: no keys matching the table")
+        yield cols, tuple(rec[c] for c in cols)
+
+
+def _by_columns(batch: List[Record]):
+    """Group a batch by column set, so each group is one executemany."""
+    groups = {}
+    for cols, values in batch:
+        groups.setdefault(cols, []).append(values)
+    return groups.items()
+
+
+def _batches(rows: Iterator, size: int) -> Iterator[List]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _secondary_indexes(conn: sqlite3.Connection, table: str) -> List[Tuple[str, str]]:
+    # Explicit CREATE INDEX statements only; PRIMARY KEY / UNIQUE autoindexes have sql NULL
+    return [(r["name"], r["sql"]) for r in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,))]
+
+
+def _print_progress(rows: int, elapsed: float):
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"\r{rows:,} rows  {rate:,.0f} rows/s", end="", file=sys.stderr, flush=True)
+
+
+def bulk_import(table: str, path: Path, fmt: Optional[str] = None, batch_size: int = BATCH_SIZE,
+                defer_indexes: bool = False, progress: Optional[ProgressFn] = None) -> int:
+    """Stream `path` into `table`; returns the number of rows read.
+
+    Rows are committed every COMMIT_EVERY, so the live app sees the load progress.
+    `defer_indexes` (offline or new databases) drops the table's secondary indexes
+    and rebuilds them once at the end, all inside one transaction: a failure or
+    crash rolls back to the old rows with their indexes, but writers are locked
+    out for the whole load.
+    """
+    if table not in TABLES:
+        raise ValueError(f"Unknown table {table!r}; expected one of {TABLES}")
+    path = Path(path)
+    db.init_db()
+    conn = db.get_conn()
+    conn.isolation_level = None  # explicit transactions below
+    # Relaxed durability for this connection only; a crash mid-load leaves a partial import, not corruption
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MiB
+    total = 0
+    t0 = time.perf_counter()
+    try:
+        with _open(path, "r") as f:
+            rows = _read_rows(f, _fmt(path, fmt), _table_columns(conn, table), name=str(path))
+            sql = {}
+            conn.execute("BEGIN")
+            dropped = _secondary_indexes(conn, table) if defer_indexes else []
+            for name, _ in dropped:
+                conn.execute(f"DROP INDEX {name}")
+            in_txn = 0
+            for batch in _batches(rows, batch_size):
+                for cols, values in _by_columns(batch):
+                    if cols not in sql:
+                        sql[cols] = (f"INSERT {CONFLICT[table]} INTO {table}({', '.join(cols)}) "
+                                     f"VALUES({', '.join('?' * len(cols))})")
+                    conn.executemany(sql[cols], values)
+                total += len(batch)
+                in_txn += len(batch)
+                if in_txn >= COMMIT_EVERY and not dropped:
+                    conn.execute("COMMIT")
+                    conn.execute("BEGIN")
+                    in_txn = 0
+                if progress:
+                    progress(total, time.perf_counter() - t0)
+            # Rebuild deferred indexes once, in a single sorted pass each, before the commit
+            for _, index_sql in dropped:
+                conn.execute(index_sql)
+            if table in CATALOG_TABLES:
+                db._bump_catalog_version(conn)
+            conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return total
+
+
+def bulk_export(table: str, path: Path, fmt: Optional[str] = None, batch_size: int = BATCH_SIZE,
+                progress: Optional[ProgressFn] = None) -> int:
+    """Stream `table` to CSV / JSONL (gzipped if `path` ends in .gz); returns rows written."""
+    if table not in TABLES:
+        raise ValueError(f"Unknown table {table!r}; expected one of {TABLES}")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fmt = _fmt(path, fmt)
+    tmp = path.with_name(path.name + ".tmp")
+    conn = db.get_conn()
+    total = 0
+    done = False
+    t0 = time.perf_counter()
+    try:
+        cur = conn.execute(f"SELECT * FROM {table} ORDER BY rowid")
+        cols = [d[0] for d in cur.description]
+        with _open(tmp, "w", gz=str(path).endswith(".gz")) as f:
+            writer = csv.writer(f) if fmt == "csv" else None
+            if writer:
+                writer.writerow(cols)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                if writer:
+                    writer.writerows(rows)
+                else:
+                    f.writelines(json.dumps(dict(zip(cols, r))) + "\n" for r in rows)
+                total += len(rows)
+                if progress:
+                    progress(total, time.perf_counter() - t0)
+        tmp.replace(path)
+        done = True
+    finally:
+        conn.close()
+        if not done:
+            # Never leave a partial export behind
+            tmp.unlink(missing_ok=True)
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bulk import/export for the app database")
+    ap.add_argument("action", choices=["import", "export"])
+    ap.add_argument("table", choices=TABLES)
+    ap.add_argument("path", type=Path)
+    ap.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--defer-indexes", action="store_true",
+                    help="drop secondary indexes during import and rebuild them at the end, in one transaction "
+                         "(offline or new databases: writers wait for the whole load)")
+    ap.add_argument("--db", type=Path, help=f"database path (default: {db.DB_PATH})")
+    ap.add_argument("--quiet", action="store_true")
+    args = ap.parse_args()
+    if args.db:
+        db.DB_PATH = args.db
+    progress = None if args.quiet else _print_progress
+    t0 = time.perf_counter()
+    if args.action == "import":
+        n = bulk_import(args.table, args.path, args.format, args.batch_size,
+                        defer_indexes=args.defer_indexes, progress=progress)
+    else:
+        n = bulk_export(args.table, args.path, args.format, args.batch_size, progress=progress)
+    elapsed = time.perf_counter() - t0
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(json.dumps({"action": args.action, "table": args.table, "rows": n, "seconds": round(elapsed, 2),
+                      "rows_per_sec": round(n / elapsed) if elapsed > 0 else None}))
+
+
+if __name__ == "__main__":
+    main()
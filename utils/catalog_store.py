@@ -0,0 +1,323 @@
+"""Binary, memory-mapped item/medicine catalog shared by all worker processes.
+
+The source of truth is the items/medicines tables in SQLite (utils.db).
+`build()` turns them into a versioned directory of .npy files beside the
+database (data/catalog/): numeric columns as plain arrays, text columns
+interned (unique UTF-8 strings + int32 codes) and the TF-IDF matrix as CSR
+arrays. data/catalog/CURRENT names the live version and is switched with
+os.replace, so readers never see a half-written catalog. `get_catalog()`
+maps the live version read-only, so every process shares the pages through
+the OS page cache; text stays as mapped UTF-8 and is decoded only for the
+rows a caller asks for (StringColumn). Once the database's catalog_version counter has moved on,
+a new version is built on a background thread while the current one keeps
+serving; only a missing catalog is built inline.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from . import db
+from .metrics import timed, incr
+
+# Default seed files; modules pointed at other CSVs bypass the store
+ITEMS_CSV = db.ITEMS_CSV
+MEDICINES_CSV = db.MEDICINES_CSV
+# Superseded versions kept around for readers still mapping them
+KEEP_VERSIONS = 3
+
+ITEM_TEXT_COLS = ["title", "tags", "description", "condition", "timeslot"]
+MEDICINE_TEXT_COLS = ["name", "for_condition", "contraindications", "common_side_effects", "description"]
+
+
+def _intern(values) -> tuple:
+    # Interned column: codes into a table of unique strings stored as one UTF-8 blob + offsets
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna("").astype(str), sort=False)
+    encoded = [u.encode("utf-8") for u in uniques]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+    return codes.astype(np.int32), offsets, b"".join(encoded)
+
+
+def _write_strings(out: Path, name: str, values: pd.Series):
+    codes, offsets, blob = _intern(values)
+    np.save(out / f"{name}.codes.npy", codes)
+    np.save(out / f"{name}.offsets.npy", offsets)
+    np.save(out / f"{name}.blob.npy", np.frombuffer(blob, dtype=np.uint8))
+
+
+class StringColumn:
+    """Interned text column. Only codes, offsets and the UTF-8 blob are held (mapped
+    from the catalog, or in memory for from_values); strings are decoded on demand."""
+
+    def __init__(self, codes: np.ndarray, offsets: np.ndarray, blob):
+        self.codes = codes
+        self.offsets = offsets
+        self._blob = memoryview(blob)
+
+    @classmethod
+    def load(cls, path: Path, name: str) -> "StringColumn":
+        return cls(np.load(path / f"{name}.codes.npy", mmap_mode="r"),
+                   np.load(path / f"{name}.offsets.npy", mmap_mode="r"),
+                   np.load(path / f"{name}.blob.npy", mmap_mode="r"))
+
+    @classmethod
+    def from_values(cls, values) -> "StringColumn":
+        return cls(*_intern(values))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def _decode(self, i: int) -> str:
+        return str(self._blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def take(self, rows) -> np.ndarray:
+        """Values at `rows` as an object array; each distinct value is decoded once."""
+        codes = np.asarray(self.codes[np.asarray(rows, dtype=np.int64)])
+        if not len(codes):
+            return np.empty(0, dtype=object)
+        uniq, inv = np.unique(codes, return_inverse=True)
+        table = np.empty(len(uniq), dtype=object)
+        table[:] = [self._decode(int(i)) for i in uniq]
+        return table[inv.ravel()]
+
+    def to_numpy(self) -> np.ndarray:
+        return self.take(np.arange(len(self)))
+
+    def contains(self, q: str) -> np.ndarray:
+        """Row mask: value contains `q` (lowercase) case-insensitively."""
+        n = len(self.offsets) - 1
+        if not n:
+            return np.zeros(len(self), dtype=bool)
+        hit = np.fromiter((q in self._decode(i).lower() for i in range(n)), dtype=bool, count=n)
+        return hit[np.asarray(self.codes)]
+
+
+def item_text(items: pd.DataFrame) -> pd.Series:
+    return (items["title"].fillna("") + " " +
+            items["tags"].fillna("") + " " +
+            items["description"].fillna(""))
+
+
+def _catalog_dir(catalog_dir: Optional[Path] = None) -> Path:
+    # Kept beside the database it mirrors
+    return Path(catalog_dir or db.DB_PATH.parent / "catalog")
+
+
+@timed()
+def build(items: pd.DataFrame, meds: pd.DataFrame, catalog_dir: Optional[Path] = None,
+          source: Optional[dict] = None) -> Path:
+    """Write a new catalog version and make it live; returns its directory."""
+    catalog_dir = _catalog_dir(catalog_dir)
+    version = time.strftime("%Y%m%d%H%M%S") + f"-{uuid.uuid4().hex[:8]}"
+    out = catalog_dir / f".building-{version}"
+    out.mkdir(parents=True, exist_ok=True)
+
+    np.save(out / "item_id.npy", items["item_id"].to_numpy(dtype=np.int64))
+    pop = pd.to_numeric(items["popularity"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    np.save(out / "popularity.npy", pop.astype(np.int64) if np.all(pop == np.round(pop)) else pop)
+    for col in ITEM_TEXT_COLS:
+        _write_strings(out, f"items.{col}", items[col])
+    np.save(out / "medicine_id.npy", meds["medicine_id"].to_numpy(dtype=np.int64))
+    for col in MEDICINE_TEXT_COLS:
+        _write_strings(out, f"meds.{col}", meds[col])
+
+    vectorizer = TfidfVectorizer(stop_words="english")
+    try:
+        X = vectorizer.fit_transform(item_text(items).values).tocsr()
+        idf, vocab = vectorizer.idf_, vectorizer.get_feature_names_out()
+    except ValueError:
+        # No items (or only stop words): an empty vocabulary, not a failed build
+        X, idf, vocab = sparse.csr_matrix((len(items), 0)), np.empty(0), np.empty(0, dtype=object)
+    X.sort_indices()
+    np.save(out / "tfidf.data.npy", X.data.astype(np.float64))
+    np.save(out / "tfidf.indices.npy", X.indices.astype(np.int32))
+    np.save(out / "tfidf.indptr.npy", X.indptr.astype(np.int64))
+    np.save(out / "tfidf.idf.npy", idf)
+    _write_strings(out, "tfidf.vocab", pd.Series(vocab, dtype=object))
+
+    (out / "meta.json").write_text(json.dumps({
+        "version": version, "items": len(items), "medicines": len(meds),
+        "n_features": int(X.shape[1]), "source": source or {},
+    }, indent=2))
+    final = catalog_dir / version
+    os.replace(out, final)
+    tmp = catalog_dir / f".CURRENT.{version}"
+    tmp.write_text(version)
+    os.replace(tmp, catalog_dir / "CURRENT")
+    _prune(catalog_dir, version)
+    return final
+
+
+def _prune(catalog_dir: Path, live: str):
+    versions = sorted(p for p in catalog_dir.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for p in versions[:-KEEP_VERSIONS]:
+        if p.name != live:
+            shutil.rmtree(p, ignore_errors=True)
+
+
+def build_from_db(catalog_dir: Optional[Path] = None) -> Path:
+    db.ensure_catalog()
+    version, items, meds = db.catalog_snapshot()
+    return build(pd.DataFrame([tuple(r) for r in items], columns=db.ITEM_COLUMNS),
+                 pd.DataFrame([tuple(r) for r in meds], columns=db.MEDICINE_COLUMNS),
+                 catalog_dir, source={"catalog_version": version})
+
+
+class Catalog:
+    """Read-only view of one catalog version.
+
+    Every file is mapped when the version is opened, so a reader keeps working
+    after _prune deletes the directory (the mappings outlive the paths).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text())
+        self.version = self.meta["version"]
+        # The database catalog_version this was built from (None if not built from the database)
+        self.db_version = self.meta.get("source", {}).get("catalog_version")
+        self.item_ids = np.load(path / "item_id.npy", mmap_mode="r")
+        self.popularity = np.load(path / "popularity.npy", mmap_mode="r")
+        self.medicine_ids = np.load(path / "medicine_id.npy", mmap_mode="r")
+        n = len(self.item_ids)
+        # scipy keeps references to the mapped arrays (no copy for matching dtypes)
+        self.item_vectors = sparse.csr_matrix(
+            (np.load(path / "tfidf.data.npy", mmap_mode="r"),
+             np.load(path / "tfidf.indices.npy", mmap_mode="r"),
+             np.load(path / "tfidf.indptr.npy", mmap_mode="r")),
+            shape=(n, self.meta["n_features"]), copy=False)
+        self.item_text = {col: StringColumn.load(path, f"items.{col}") for col in ITEM_TEXT_COLS}
+        self.medicine_text = {col: StringColumn.load(path, f"meds.{col}") for col in MEDICINE_TEXT_COLS}
+        self._vocab = StringColumn.load(path, "tfidf.vocab")
+        self._idf = np.load(path / "tfidf.idf.npy", mmap_mode="r")
+        self._vectorizer = None
+        self._lock = threading.Lock()
+
+    def items_at(self, rows) -> pd.DataFrame:
+        """Items at `rows`, decoding only their text; columns as in items.csv."""
+        rows = np.asarray(rows, dtype=np.int64)
+        df = pd.DataFrame({"item_id": np.asarray(self.item_ids[rows])})
+        for col in ITEM_TEXT_COLS:
+            df[col] = self.item_text[col].take(rows)
+        df["popularity"] = np.asarray(self.popularity[rows])
+        return df
+
+    def items_frame(self) -> pd.DataFrame:
+        """The whole item table, decoded now; not kept, so hold on to it if reused."""
+        return self.items_at(np.arange(len(self.item_ids)))
+
+    def medicines_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame({"medicine_id": np.asarray(self.medicine_ids)})
+        for col in MEDICINE_TEXT_COLS:
+            df[col] = self.medicine_text[col].to_numpy()
+        return df
+
+    def vectorizer(self) -> TfidfVectorizer:
+        """TF-IDF vectorizer equivalent to the one used at build time (for queries)."""
+        with self._lock:
+            if self._vectorizer is None:
+                vocab = self._vocab.to_numpy()
+                vec = TfidfVectorizer(stop_words="english", vocabulary={t: i for i, t in enumerate(vocab)})
+                if len(vocab):
+                    vec.idf_ = np.asarray(self._idf, dtype=np.float64)
+                self._vectorizer = vec
+            return self._vectorizer
+
+
+_catalogs: Dict[str, Catalog] = {}
+_catalog_lock = threading.Lock()
+# Builds run one at a time, outside _catalog_lock so readers never wait on one
+_build_lock = threading.Lock()
+_rebuilding = set()
+
+
+def current_version(catalog_dir: Optional[Path] = None) -> Optional[str]:
+    try:
+        return (_catalog_dir(catalog_dir) / "CURRENT").read_text().strip()
+    except OSError:
+        return None
+
+
+def _stale(cat: Catalog) -> bool:
+    try:
+        return cat.db_version != db.catalog_version()
+    except sqlite3.OperationalError:
+        # Database without the catalog tables yet
+        return True
+
+
+def _open_current(catalog_dir: Path) -> Optional[Catalog]:
+    with _catalog_lock:
+        version = current_version(catalog_dir)
+        if not version:
+            return None
+        cat = _catalogs.get(str(catalog_dir / version))
+        if cat is None:
+            try:
+                cat = Catalog(catalog_dir / version)
+            except OSError:
+                return None
+            _catalogs.clear()
+            _catalogs[str(cat.path)] = cat
+        return cat
+
+
+def _rebuild(catalog_dir: Path):
+    with _build_lock:
+        # Another thread may have caught up while this one waited
+        cat = _open_current(catalog_dir)
+        if cat is None or _stale(cat):
+            build_from_db(catalog_dir)
+
+
+def rebuild_async(catalog_dir: Optional[Path] = None) -> bool:
+    """Rebuild from the database on a background thread; False if one is already running."""
+    catalog_dir = _catalog_dir(catalog_dir)
+    with _catalog_lock:
+        if str(catalog_dir) in _rebuilding:
+            return False
+        _rebuilding.add(str(catalog_dir))
+
+    def run():
+        try:
+            _rebuild(catalog_dir)
+        except Exception:
+            incr("catalog_store.rebuild_error")
+        finally:
+            with _catalog_lock:
+                _rebuilding.discard(str(catalog_dir))
+
+    threading.Thread(target=run, daemon=True, name="catalog-rebuild").start()
+    return True
+
+
+def get_catalog(catalog_dir: Optional[Path] = None, rebuild_stale: bool = True, wait: bool = False) -> Catalog:
+    """The live catalog. A missing one is built now; one behind the database keeps
+    serving while a rebuild runs in the background (or is rebuilt now, with `wait`)."""
+    catalog_dir = _catalog_dir(catalog_dir)
+    cat = _open_current(catalog_dir)
+    if cat is None or (wait and rebuild_stale and _stale(cat)):
+        _rebuild(catalog_dir)
+        cat = _open_current(catalog_dir)
+    elif rebuild_stale and _stale(cat):
+        rebuild_async(catalog_dir)
+    return cat
+
+
+def items_frame() -> pd.DataFrame:
+    return get_catalog().items_frame()
+
+
+def medicines_frame() -> pd.DataFrame:
+    return get_catalog().medicines_frame()
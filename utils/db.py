@@ -1,18 +1,83 @@
+import csv
+import os
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Tuple, Dict, Any, List
+from typing import Optional, Tuple, Dict, Any, List, Callable
+from .metrics import timed
 
 ROOT = Path(__file__).resolve().parents[1]
 DB_PATH = ROOT / "data" / "app.db"
+ITEMS_CSV = ROOT / "data" / "items.csv"
+MEDICINES_CSV = ROOT / "data" / "medicines.csv"
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+# Half-life of a review's weight in the decayed sentiment mean
+REVIEW_HALF_LIFE_DAYS = 30.0
+
+def get_conn(check_same_thread: bool = True):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     return conn
 
+class ConnectionPool:
+    """Fixed-size pool of long-lived connections for callers outside Streamlit
+    (e.g. the recommendation service). A connection is used by one thread at a time."""
+
+    def __init__(self, size: int = 4, timeout: float = 10.0):
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    conn = get_conn(check_same_thread=False)
+            if conn is None:
+                conn = self._idle.get(timeout=self.timeout)
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+@contextmanager
+def _use_conn(conn: Optional[sqlite3.Connection] = None):
+    # Borrow the caller's (pooled) connection, or open a short-lived one
+    if conn is not None:
+        yield conn
+        return
+    conn = get_conn()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+@timed()
 def init_db():
     conn = get_conn()
     cur = conn.cursor()
+    # Only takes effect on a new database (existing ones: utils.retention --enable-incremental-vacuum)
+    cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -32,6 +97,18 @@ def init_db():
         FOREIGN KEY(user_id) REFERENCES users(id)
     )
     """)
+    # Recent-events reads and retention cutoffs both range over timestamp
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_activities_timestamp ON activities(timestamp)")
+    # Per-day counts of activities compacted by utils.retention (item_id 0 = no item)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS activity_rollups(
+        day TEXT NOT NULL,
+        item_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY(day, item_id, type)
+    ) WITHOUT ROWID
+    """)
     cur.execute("""
     CREATE TABLE IF NOT EXISTS ratings(
         user_id INTEGER,
@@ -41,6 +118,9 @@ def init_db():
         PRIMARY KEY(user_id, item_id)
     )
     """)
+    # Covering indexes for per-user and per-item rating lookups
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings(user_id, rating, item_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ratings_item ON ratings(item_id, user_id, rating)")
     cur.execute("""
     CREATE TABLE IF NOT EXISTS bandit(
         algorithm TEXT PRIMARY KEY,
@@ -48,31 +128,80 @@ def init_db():
         wins INTEGER DEFAULT 0
     )
     """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS reviews(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        medicine_id INTEGER NOT NULL,
+        text TEXT,
+        sentiment REAL NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reviews_medicine ON reviews(medicine_id)")
+    # One row per medicine, maintained incrementally by add_review()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS medicine_sentiment(
+        medicine_id INTEGER PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0,
+        mean REAL NOT NULL DEFAULT 0,
+        decayed_mean REAL NOT NULL DEFAULT 0,
+        decayed_weight REAL NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL DEFAULT 0
+    )
+    """)
+    # Latest utils.trending snapshot: decayed count arrays plus the activity id they cover
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS trending_checkpoint(
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_activity_id INTEGER NOT NULL,
+        ref_time REAL NOT NULL,
+        half_life_hours REAL NOT NULL,
+        state BLOB NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    _create_catalog_tables(cur)
     conn.commit()
     conn.close()
 
-def ensure_default_users():
+# Demo accounts: (email, password, role)
+DEFAULT_USERS = [
+    ("admin@demo.com", "admin123", "Admin"),
+    ("analyst@demo.com", "analyst123", "Analyst"),
+    ("user@demo.com", "user123", "User"),
+]
+
+@timed()
+def ensure_default_users(hash_fn: Optional[Callable[[str], str]] = None):
     conn = get_conn()
     cur = conn.cursor()
     # Check if any user exists
     cur.execute("SELECT COUNT(*) as c FROM users")
     if cur.fetchone()["c"] == 0:
-        # Insert default users (passwords: admin123, analyst123, user123)
-        cur.execute("INSERT OR IGNORE INTO users(email, password_hash, role) VALUES(?,?,?)",
-                    ("admin@demo.com", "TO_SET_ADMIN", "Admin"))
-        cur.execute("INSERT OR IGNORE INTO users(email, password_hash, role) VALUES(?,?,?)",
-                    ("analyst@demo.com", "TO_SET_ANALYST", "Analyst"))
-        cur.execute("INSERT OR IGNORE INTO users(email, password_hash, role) VALUES(?,?,?)",
-                    ("user@demo.com", "TO_SET_USER", "User"))
+        # Insert default users with placeholder hashes
+        for email, _, role in DEFAULT_USERS:
+            cur.execute("INSERT OR IGNORE INTO users(email, password_hash, role) VALUES(?,?,?)",
+                        (email, f"TO_SET_{role.upper()}", role))
+        conn.commit()
+    if hash_fn is not None:
+        # Only hash passwords that are still placeholders, so repeat calls are free
+        for email, password, _ in DEFAULT_USERS:
+            cur.execute("SELECT password_hash FROM users WHERE email=?", (email,))
+            row = cur.fetchone()
+            if row is not None and row["password_hash"].startswith("TO_SET_"):
+                cur.execute("UPDATE users SET password_hash=? WHERE email=?", (hash_fn(password), email))
         conn.commit()
     conn.close()
 
+@timed()
 def set_password(email: str, password_hash: str):
     conn = get_conn()
     conn.execute("UPDATE users SET password_hash=? WHERE email=?", (password_hash, email))
     conn.commit()
     conn.close()
 
+@timed()
 def get_user_by_email(email: str) -> Optional[sqlite3.Row]:
     conn = get_conn()
     cur = conn.cursor()
@@ -81,6 +210,7 @@ def get_user_by_email(email: str) -> Optional[sqlite3.Row]:
     conn.close()
     return row
 
+@timed()
 def insert_user(email: str, password_hash: str, role: str = "User") -> Tuple[bool, Optional[str]]:
     try:
         conn = get_conn()
@@ -92,20 +222,83 @@ def insert_user(email: str, password_hash: str, role: str = "User") -> Tuple[boo
     except Exception as e:
         return False, str(e)
 
-def log_activity(user_id: int, type_: str, item_id: Optional[int] = None, meta: str = ""):
-    conn = get_conn()
-    conn.execute("INSERT INTO activities(user_id, type, item_id, meta) VALUES(?,?,?,?)",
-                 (user_id, type_, item_id, meta))
-    conn.commit()
-    conn.close()
+@timed()
+def log_activity(user_id: int, type_: str, item_id: Optional[int] = None, meta: str = "", conn: Optional[sqlite3.Connection] = None):
+    with _use_conn(conn) as conn:
+        conn.execute("INSERT INTO activities(user_id, type, item_id, meta) VALUES(?,?,?,?)",
+                     (user_id, type_, item_id, meta))
+        conn.commit()
 
-def rate_item(user_id: int, item_id: int, rating: int):
-    conn = get_conn()
-    conn.execute("INSERT OR REPLACE INTO ratings(user_id, item_id, rating) VALUES(?,?,?)",
-                 (user_id, item_id, rating))
-    conn.commit()
-    conn.close()
+@timed()
+def activities_after(activity_id: int, limit: int = 10_000, types: Tuple[str, ...] = ("view", "like", "skip"),
+                     conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    """Item activities with id > `activity_id`, oldest first."""
+    with _use_conn(conn) as conn:
+        return conn.execute(
+            f"SELECT id, user_id, type, item_id, timestamp FROM activities WHERE id > ? AND item_id IS NOT NULL "
+            f"AND type IN ({','.join('?' * len(types))}) ORDER BY id LIMIT ?",
+            (activity_id, *types, limit)).fetchall()
+
+def save_trending_checkpoint(last_activity_id: int, ref_time: float, half_life_hours: float, state: bytes,
+                             conn: Optional[sqlite3.Connection] = None):
+    with _use_conn(conn) as conn:
+        conn.execute("INSERT OR REPLACE INTO trending_checkpoint(id, last_activity_id, ref_time, half_life_hours, state) "
+                     "VALUES(1,?,?,?,?)", (last_activity_id, ref_time, half_life_hours, sqlite3.Binary(state)))
+        conn.commit()
+
+def load_trending_checkpoint(conn: Optional[sqlite3.Connection] = None) -> Optional[sqlite3.Row]:
+    with _use_conn(conn) as conn:
+        return conn.execute("SELECT * FROM trending_checkpoint WHERE id=1").fetchone()
+
+# Callbacks run after each committed rate_item: fn(user_id, item_id, rating, previous_rating_or_None, rowid)
+_rating_listeners: List[Callable[[int, int, int, Optional[int], int], None]] = []
+
+def on_rating(fn: Callable[[int, int, int, Optional[int], int], None]):
+    """Subscribe to rating writes made through rate_item (usable as a decorator).
+
+    Listeners get (user_id, item_id, rating, previous, rowid); the rowid is the
+    one ratings_after() reports for the write.
+    """
+    _rating_listeners.append(fn)
+    return fn
+
+@timed()
+def rate_item(user_id: int, item_id: int, rating: int, conn: Optional[sqlite3.Connection] = None):
+    with _use_conn(conn) as conn:
+        prev = None
+        # Read the replaced value and write under one write lock, so listeners get the true previous rating
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            if _rating_listeners:
+                row = conn.execute("SELECT rating FROM ratings WHERE user_id=? AND item_id=?",
+                                   (user_id, item_id)).fetchone()
+                prev = row[0] if row else None
+            rowid = conn.execute("INSERT OR REPLACE INTO ratings(user_id, item_id, rating) VALUES(?,?,?)",
+                                 (user_id, item_id, rating)).lastrowid
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    for fn in list(_rating_listeners):
+        try:
+            fn(user_id, item_id, rating, prev, rowid)
+        except Exception:
+            # A failing listener must not fail the write; it can catch up via ratings_after()
+            pass
 
+def last_rating_rowid(conn: Optional[sqlite3.Connection] = None) -> int:
+    with _use_conn(conn) as conn:
+        return conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM ratings").fetchone()[0]
+
+@timed()
+def ratings_after(rowid: int, limit: int = 100_000, conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    """Ratings written after `rowid` (INSERT OR REPLACE assigns a new rowid), oldest first."""
+    with _use_conn(conn) as conn:
+        return conn.execute("SELECT rowid, user_id, item_id, rating FROM ratings WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                            (rowid, limit)).fetchall()
+
+@timed()
 def fetch_user_events() -> List[sqlite3.Row]:
     conn = get_conn()
     cur = conn.cursor()
@@ -114,14 +307,106 @@ def fetch_user_events() -> List[sqlite3.Row]:
     conn.close()
     return rows
 
-def fetch_ratings() -> List[sqlite3.Row]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM ratings")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+@timed()
+def fetch_ratings(conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    with _use_conn(conn) as conn:
+        return conn.execute("SELECT * FROM ratings").fetchall()
 
+@timed()
+def ratings_timeline(conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    """All ratings oldest first (timestamp, then rowid for ties); for offline evaluation."""
+    with _use_conn(conn) as conn:
+        return conn.execute("SELECT user_id, item_id, rating, timestamp FROM ratings ORDER BY timestamp, rowid").fetchall()
+
+# Stay well below SQLite's bound-parameter limit
+_IN_CHUNK = 500
+
+def _chunks(ids: List[int]):
+    ids = [int(i) for i in ids]
+    for i in range(0, len(ids), _IN_CHUNK):
+        yield ids[i:i + _IN_CHUNK]
+
+@timed()
+def liked_items(user_id: int, conn: Optional[sqlite3.Connection] = None) -> List[int]:
+    with _use_conn(conn) as conn:
+        rows = conn.execute("SELECT item_id FROM ratings WHERE user_id=? AND rating > 0", (user_id,)).fetchall()
+    return [r["item_id"] for r in rows]
+
+@timed()
+def ratings_for_users(user_ids: List[int], conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    out = []
+    with _use_conn(conn) as conn:
+        for chunk in _chunks(user_ids):
+            out.extend(conn.execute(
+                f"SELECT user_id, item_id, rating FROM ratings WHERE user_id IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall())
+    return out
+
+@timed()
+def ratings_for_items(item_ids: List[int], conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    out = []
+    with _use_conn(conn) as conn:
+        for chunk in _chunks(item_ids):
+            out.extend(conn.execute(
+                f"SELECT user_id, item_id, rating FROM ratings WHERE item_id IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall())
+    return out
+
+@timed()
+def rating_totals(item_ids: Optional[List[int]] = None, conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    """Per-item like (rating > 0) and skip (rating < 0) counts, for all items or just `item_ids`."""
+    sql = "SELECT item_id, SUM(rating > 0) AS likes, SUM(rating < 0) AS skips FROM ratings"
+    with _use_conn(conn) as conn:
+        if item_ids is None:
+            return conn.execute(sql + " GROUP BY item_id").fetchall()
+        out = []
+        for chunk in _chunks(item_ids):
+            out.extend(conn.execute(sql + f" WHERE item_id IN ({','.join('?' * len(chunk))}) GROUP BY item_id",
+                                    chunk).fetchall())
+        return out
+
+@timed()
+def co_raters(item_ids: List[int], exclude_user: Optional[int] = None, limit: Optional[int] = None,
+              conn: Optional[sqlite3.Connection] = None) -> List[int]:
+    """Users who rated any of `item_ids`, most overlapping first."""
+    overlap: Dict[int, int] = {}
+    with _use_conn(conn) as conn:
+        for chunk in _chunks(item_ids):
+            rows = conn.execute(
+                f"SELECT user_id, COUNT(*) AS n FROM ratings WHERE item_id IN ({','.join('?' * len(chunk))}) GROUP BY user_id",
+                chunk).fetchall()
+            for r in rows:
+                overlap[r["user_id"]] = overlap.get(r["user_id"], 0) + r["n"]
+    overlap.pop(exclude_user, None)
+    users = sorted(overlap, key=overlap.get, reverse=True)
+    return users[:limit] if limit is not None else users
+
+@timed()
+def rating_norms(user_ids: List[int], conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    """Per-user squared rating norm (sum of rating^2) for `user_ids`."""
+    out = []
+    with _use_conn(conn) as conn:
+        for chunk in _chunks(user_ids):
+            out.extend(conn.execute(
+                f"SELECT user_id, SUM(rating * rating) AS norm_sq FROM ratings "
+                f"WHERE user_id IN ({','.join('?' * len(chunk))}) GROUP BY user_id", chunk).fetchall())
+    return out
+
+@timed()
+def rated_after(user_id: int, rowid: int, conn: Optional[sqlite3.Connection] = None) -> bool:
+    """Whether the user has a rating written after ratings rowid `rowid` (see ratings_after)."""
+    with _use_conn(conn) as conn:
+        row = conn.execute("SELECT 1 FROM ratings WHERE user_id=? AND rowid > ? LIMIT 1", (user_id, rowid)).fetchone()
+    return row is not None
+
+@timed()
+def rated_since(user_id: int, since: str, conn: Optional[sqlite3.Connection] = None) -> bool:
+    """Whether the user has rated anything after `since` ('YYYY-MM-DD HH:MM:SS', UTC)."""
+    with _use_conn(conn) as conn:
+        row = conn.execute("SELECT 1 FROM ratings WHERE user_id=? AND timestamp > ? LIMIT 1", (user_id, since)).fetchone()
+    return row is not None
+
+@timed()
 def bandit_stats():
     conn = get_conn()
     cur = conn.cursor()
@@ -130,10 +415,259 @@ def bandit_stats():
     conn.close()
     return rows
 
-def bandit_update(algorithm: str, won: bool):
+@timed()
+def bandit_update(algorithm: str, won: bool, conn: Optional[sqlite3.Connection] = None):
+    with _use_conn(conn) as conn:
+        cur = conn.cursor()
+        cur.execute("INSERT OR IGNORE INTO bandit(algorithm, plays, wins) VALUES(?, 0, 0)", (algorithm,))
+        cur.execute("UPDATE bandit SET plays = plays + 1, wins = wins + ? WHERE algorithm=?", (1 if won else 0, algorithm))
+        conn.commit()
+
+@timed()
+def add_review(user_id: Optional[int], medicine_id: int, text: str, sentiment: float):
+    now = time.time()
+    conn = get_conn()
+    try:
+        # Take the write lock up front so concurrent reviews can't lose updates
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO reviews(user_id, medicine_id, text, sentiment) VALUES(?,?,?,?)",
+                     (user_id, medicine_id, text, sentiment))
+        row = conn.execute("SELECT * FROM medicine_sentiment WHERE medicine_id=?", (medicine_id,)).fetchone()
+        if row is None:
+            n, mean, dmean, dweight = 1, sentiment, sentiment, 1.0
+        else:
+            n = row["n"] + 1
+            mean = row["mean"] + (sentiment - row["mean"]) / n
+            # Older reviews lose weight exponentially; the new one enters with weight 1
+            age_days = max(0.0, now - row["updated_at"]) / 86400.0
+            decay = 0.5 ** (age_days / REVIEW_HALF_LIFE_DAYS)
+            old_weight = row["decayed_weight"] * decay
+            dweight = old_weight + 1.0
+            dmean = (row["decayed_mean"] * old_weight + sentiment) / dweight
+        conn.execute("""
+            INSERT OR REPLACE INTO medicine_sentiment(medicine_id, n, mean, decayed_mean, decayed_weight, updated_at)
+            VALUES(?,?,?,?,?,?)
+        """, (medicine_id, n, mean, dmean, dweight, now))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@timed()
+def medicine_sentiment(medicine_ids: List[int]) -> Dict[int, sqlite3.Row]:
+    ids = [int(i) for i in medicine_ids]
+    if not ids:
+        return {}
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("INSERT OR IGNORE INTO bandit(algorithm, plays, wins) VALUES(?, 0, 0)", (algorithm,))
-    cur.execute("UPDATE bandit SET plays = plays + 1, wins = wins + ? WHERE algorithm=?", (1 if won else 0, algorithm))
-    conn.commit()
+    cur.execute(f"SELECT * FROM medicine_sentiment WHERE medicine_id IN ({','.join('?' * len(ids))})", ids)
+    rows = cur.fetchall()
     conn.close()
+    return {r["medicine_id"]: r for r in rows}
+
+# -------------------------
+# Item / medicine catalog
+# -------------------------
+ITEM_COLUMNS = ["item_id", "title", "tags", "description", "condition", "timeslot", "popularity"]
+MEDICINE_COLUMNS = ["medicine_id", "name", "for_condition", "contraindications", "common_side_effects", "description"]
+
+def _create_catalog_tables(cur: sqlite3.Cursor):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS items(
+        item_id INTEGER PRIMARY KEY,
+        title TEXT,
+        tags TEXT,
+        description TEXT,
+        condition TEXT,
+        timeslot TEXT,
+        popularity INTEGER DEFAULT 0
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_condition ON items(condition)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS medicines(
+        medicine_id INTEGER PRIMARY KEY,
+        name TEXT,
+        for_condition TEXT,
+        contraindications TEXT,
+        common_side_effects TEXT,
+        description TEXT
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_medicines_condition ON medicines(for_condition)")
+    # Single-row change counter, bumped by every catalog write; caches poll it
+    cur.execute("CREATE TABLE IF NOT EXISTS catalog_version(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+    cur.execute("INSERT OR IGNORE INTO catalog_version(id, version) VALUES(1, 0)")
+    # What each version changed: one row per single-row write, or table/key NULL for a bulk load
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS catalog_changes(
+        version INTEGER PRIMARY KEY,
+        table_name TEXT,
+        key INTEGER
+    )
+    """)
+
+# Versions kept in catalog_changes; caches further behind than this reload fully
+CATALOG_CHANGES_KEPT = 1000
+
+def _bump_catalog_version(conn: sqlite3.Connection, table: Optional[str] = None, key: Optional[int] = None):
+    conn.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    version = conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()[0]
+    conn.execute("INSERT OR REPLACE INTO catalog_changes(version, table_name, key) VALUES(?,?,?)", (version, table, key))
+    conn.execute("DELETE FROM catalog_changes WHERE version <= ?", (version - CATALOG_CHANGES_KEPT,))
+
+def _read_csv_rows(path: Path, columns: List[str]):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield tuple((row.get(c) or "").strip() or None for c in columns)
+
+def _upsert_sql(table: str, columns: List[str]) -> str:
+    return f"INSERT OR REPLACE INTO {table}({', '.join(columns)}) VALUES({', '.join('?' * len(columns))})"
+
+@timed()
+def catalog_version(conn: Optional[sqlite3.Connection] = None) -> int:
+    with _use_conn(conn) as conn:
+        row = conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+    return row["version"] if row else 0
+
+@timed()
+def catalog_changes(since: int, conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    """(version, table_name, key) of catalog writes after version `since`, oldest first."""
+    with _use_conn(conn) as conn:
+        return conn.execute("SELECT version, table_name, key FROM catalog_changes WHERE version > ? ORDER BY version",
+                            (since,)).fetchall()
+
+@timed()
+def import_catalog_csv(items_csv: Optional[Path] = None, medicines_csv: Optional[Path] = None,
+                       replace: bool = False) -> Tuple[int, int]:
+    """Upsert items/medicines from CSV in one transaction; `replace` drops rows not in the files."""
+    conn = get_conn()
+    counts = [0, 0]
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for n, (path, table, columns) in enumerate([(items_csv, "items", ITEM_COLUMNS),
+                                                     (medicines_csv, "medicines", MEDICINE_COLUMNS)]):
+            if path is None:
+                continue
+            if replace:
+                conn.execute(f"DELETE FROM {table}")
+            cur = conn.executemany(_upsert_sql(table, columns), _read_csv_rows(Path(path), columns))
+            counts[n] = cur.rowcount
+        _bump_catalog_version(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return counts[0], counts[1]
+
+@timed()
+def export_catalog_csv(items_csv: Optional[Path] = None, medicines_csv: Optional[Path] = None):
+    conn = get_conn()
+    try:
+        for path, table, columns, key in [(items_csv, "items", ITEM_COLUMNS, "item_id"),
+                                          (medicines_csv, "medicines", MEDICINE_COLUMNS, "medicine_id")]:
+            if path is None:
+                continue
+            tmp = Path(path).with_suffix(".csv.tmp")
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(columns)
+                # Stream rows straight from the cursor
+                w.writerows(conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {key}"))
+            os.replace(tmp, path)
+    finally:
+        conn.close()
+
+def ensure_catalog():
+    """Create the catalog tables and seed them from the bundled CSVs once.
+
+    Seeding is tracked by catalog_version (still 0 = never written), so a
+    catalog an admin has emptied stays empty.
+    """
+    conn = get_conn()
+    try:
+        _create_catalog_tables(conn.cursor())
+        conn.commit()
+        unseeded = catalog_version(conn) == 0
+    finally:
+        conn.close()
+    if unseeded:
+        import_catalog_csv(ITEMS_CSV, MEDICINES_CSV)
+
+@timed()
+def catalog_snapshot() -> Tuple[int, List[sqlite3.Row], List[sqlite3.Row]]:
+    """(version, items, medicines) read in one transaction, so they are mutually consistent."""
+    conn = get_conn()
+    try:
+        conn.execute("BEGIN")
+        version = catalog_version(conn)
+        items = conn.execute(f"SELECT {', '.join(ITEM_COLUMNS)} FROM items ORDER BY item_id").fetchall()
+        meds = conn.execute(f"SELECT {', '.join(MEDICINE_COLUMNS)} FROM medicines ORDER BY medicine_id").fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    return version, items, meds
+
+def _upsert_row(table: str, columns: List[str], row: Dict[str, Any]):
+    conn = get_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(_upsert_sql(table, columns), tuple(row.get(c) for c in columns))
+        _bump_catalog_version(conn, table, int(row[columns[0]]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _delete_row(table: str, key: str, value: int) -> bool:
+    conn = get_conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        deleted = conn.execute(f"DELETE FROM {table} WHERE {key}=?", (value,)).rowcount > 0
+        if deleted:
+            _bump_catalog_version(conn, table, value)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return deleted
+
+@timed()
+def upsert_item(item: Dict[str, Any]):
+    _upsert_row("items", ITEM_COLUMNS, item)
+
+@timed()
+def delete_item(item_id: int) -> bool:
+    return _delete_row("items", "item_id", int(item_id))
+
+@timed()
+def upsert_medicine(medicine: Dict[str, Any]):
+    _upsert_row("medicines", MEDICINE_COLUMNS, medicine)
+
+@timed()
+def delete_medicine(medicine_id: int) -> bool:
+    return _delete_row("medicines", "medicine_id", int(medicine_id))
+
+@timed()
+def get_item(item_id: int) -> Optional[sqlite3.Row]:
+    with _use_conn() as conn:
+        return conn.execute("SELECT * FROM items WHERE item_id=?", (int(item_id),)).fetchone()
+
+@timed()
+def get_items(item_ids: List[int], conn: Optional[sqlite3.Connection] = None) -> List[sqlite3.Row]:
+    """Catalog rows (ITEM_COLUMNS) for the `item_ids` that exist."""
+    out = []
+    with _use_conn(conn) as conn:
+        for chunk in _chunks(item_ids):
+            out.extend(conn.execute(
+                f"SELECT {', '.join(ITEM_COLUMNS)} FROM items WHERE item_id IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall())
+    return out
@@ -0,0 +1,157 @@
+"""Disease prediction model: sklearn for training, plain NumPy for serving.
+
+Training still fits the Pipeline(StandardScaler, MLPClassifier) used by the
+prediction page, but the fitted scaler statistics and MLP weights are then
+exported to a small .npz (models/disease_model.npz). NumpyMLP runs the
+forward pass from that file with vectorised batches, so serving needs
+neither sklearn nor unpickling:
+
+    python -m utils.disease_model export      # .pkl -> .npz
+    python -m utils.disease_model train       # fit on data/medical_records.csv, write both
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_CSV = ROOT / "data" / "medical_records.csv"
+MODEL_PKL = ROOT / "models" / "disease_model.pkl"
+MODEL_NPZ = ROOT / "models" / "disease_model.npz"
+FEATURES = ["age", "blood_pressure", "glucose_level", "heart_rate"]
+HIDDEN_LAYERS = (16, 8)
+
+_ACTIVATIONS = {
+    "identity": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": lambda x: np.tanh(x, out=x),
+    "logistic": lambda x: np.divide(1.0, 1.0 + np.exp(-x), out=x),
+}
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    x = x - x.max(axis=1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=1, keepdims=True)
+    return x
+
+
+class NumpyMLP:
+    """Forward pass of an exported StandardScaler + MLPClassifier pipeline."""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, weights, biases, activation: str,
+                 out_activation: str, classes: np.ndarray):
+        self.mean, self.scale = mean, scale
+        self.weights, self.biases = list(weights), list(biases)
+        self.activation, self.out_activation = activation, out_activation
+        self.classes = classes
+
+    @classmethod
+    def load(cls, path: Path = MODEL_NPZ) -> "NumpyMLP":
+        with np.load(path, allow_pickle=False) as z:
+            n = int(z["n_layers"])
+            return cls(z["mean"], z["scale"], [z[f"W{i}"] for i in range(n)], [z[f"b{i}"] for i in range(n)],
+                       str(z["activation"]), str(z["out_activation"]), z["classes"])
+
+    def predict_proba(self, X) -> np.ndarray:
+        h = (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+        if h.ndim == 1:
+            h = h[None, :]
+        act = _ACTIVATIONS[self.activation]
+        last = len(self.weights) - 1
+        for i, (W, b) in enumerate(zip(self.weights, self.biases)):
+            h = h @ W
+            h += b
+            if i < last:
+                h = act(h)
+        if self.out_activation == "softmax":
+            return _softmax(h)
+        # Binary output: one logistic unit, expanded to two columns like sklearn
+        p = 1.0 / (1.0 + np.exp(-h[:, 0]))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
+
+
+def export(pipe, path: Path = MODEL_NPZ) -> Path:
+    """Write a fitted Pipeline(scaler, clf)'s parameters to `path` (atomically)."""
+    scaler, clf = pipe.named_steps["scaler"], pipe.named_steps["clf"]
+    arrays = {f"W{i}": w for i, w in enumerate(clf.coefs_)}
+    arrays.update({f"b{i}": b for i, b in enumerate(clf.intercepts_)})
+    # StandardScaler leaves scale_ as None when with_std=False
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones_like(scaler.mean_)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp, mean=scaler.mean_, scale=scale, n_layers=len(clf.coefs_), activation=clf.activation,
+             out_activation=clf.out_activation_, classes=np.asarray(clf.classes_).astype(str), **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def train(df=None, test_size: Optional[float] = 0.2) -> Tuple[object, Optional[float]]:
+    """Fit the sklearn pipeline; returns (pipe, held-out accuracy or None without a split)."""
+    import pandas as pd
+    from sklearn.metrics import accuracy_score
+    from sklearn.model_selection import train_test_split
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    df = pd.read_csv(DATA_CSV) if df is None else df
+    X, y = df[FEATURES], df["diagnosis"]
+    pipe = Pipeline([
+        ("scaler", StandardScaler()),
+        ("clf", MLPClassifier(hidden_layer_sizes=HIDDEN_LAYERS, random_state=42, max_iter=500))
+    ])
+    if not test_size:
+        return pipe.fit(X, y), None
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42, stratify=y)
+    pipe.fit(X_train, y_train)
+    return pipe, accuracy_score(y_test, pipe.predict(X_test))
+
+
+def save(pipe, pkl: Path = MODEL_PKL, npz: Path = MODEL_NPZ):
+    """Persist the sklearn pipeline (for retraining / inspection) and its NumPy export."""
+    import joblib
+    Path(pkl).parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(pipe, pkl)
+    export(pipe, npz)
+
+
+_cached: Tuple[Optional[int], Optional[NumpyMLP]] = (None, None)
+
+
+def load_predictor(path: Path = MODEL_NPZ) -> Optional[NumpyMLP]:
+    """The exported model, reloaded only when the file changes; None if not exported yet."""
+    global _cached
+    try:
+        mtime = Path(path).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _cached[0] != mtime:
+        _cached = (mtime, NumpyMLP.load(path))
+    return _cached[1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Train or export the disease prediction model")
+    ap.add_argument("command", choices=["train", "export"])
+    ap.add_argument("--pkl", type=Path, default=MODEL_PKL)
+    ap.add_argument("--out", type=Path, default=MODEL_NPZ)
+    args = ap.parse_args()
+    if args.command == "train":
+        pipe, acc = train()
+        save(pipe, args.pkl, args.out)
+        print(json.dumps({"accuracy": round(acc, 4), "pkl": str(args.pkl), "npz": str(args.out)}))
+    else:
+        import joblib
+        print(json.dumps({"npz": str(export(joblib.load(args.pkl), args.out))}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Offline evaluation of the recommenders on a temporal split.
+
+Interactions (the ratings table, or like/skip activities) are split in time
+order: the earlier part is the training history, and the positives after
+the cut are what each user should have been recommended. Every algorithm
+then builds top-k lists from the training data only and is scored on
+
+- precision@k, recall@k and NDCG@k against the held-out positives,
+- catalog coverage (distinct items recommended / catalog size),
+- per-call latency (p50 / p95 / p99).
+
+Users are scored in parallel on a process pool. The report is written as
+JSON and printed as a markdown table, with deltas against a baseline
+report when one is given:
+
+    python -m utils.evaluation --k 10 --alphas 0.3,0.6,0.9 --out eval.json
+    python -m utils.evaluation --compare eval.json --out eval_new.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import db
+from . import recommender as rec
+
+DEFAULT_ALGORITHMS = ("popular", "content", "content-mean", "collab", "hybrid", "mf")
+# Most-overlapping co-raters handed to user-user CF, as the service does
+MAX_NEIGHBORS = 2000
+_COLUMNS = ["user_id", "item_id", "rating"]
+_NO_POS = np.empty(0, dtype=np.int64)
+
+
+# -------------------------
+# Data
+# -------------------------
+def load_interactions(source: str = "ratings") -> pd.DataFrame:
+    """user_id, item_id, rating oldest first; activities count like as +1 and skip as -1."""
+    if source == "ratings":
+        rows = db.ratings_timeline()
+        return pd.DataFrame([dict(r) for r in rows], columns=_COLUMNS + ["timestamp"])[_COLUMNS]
+    if source == "activities":
+        rows = db.activities_after(0, limit=-1, types=("like", "skip"))
+        df = pd.DataFrame([dict(r) for r in rows], columns=["id", "user_id", "type", "item_id", "timestamp"])
+        df["rating"] = np.where(df["type"] == "like", 1, -1)
+        # The latest action on an item is the user's rating of it, as rate_item would have stored
+        return df.drop_duplicates(["user_id", "item_id"], keep="last")[_COLUMNS].reset_index(drop=True)
+    raise ValueError(f"Unknown source {source!r}; expected 'ratings' or 'activities'")
+
+
+def temporal_split(df: pd.DataFrame, test_fraction: float = 0.2, by: str = "global"
+                   ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(train, test) of time-ordered interactions: the last `test_fraction` overall, or per user."""
+    if by == "global":
+        cut = int(round(len(df) * (1 - test_fraction)))
+        return df.iloc[:cut], df.iloc[cut:]
+    if by == "user":
+        pos = df.groupby("user_id").cumcount()
+        size = df.groupby("user_id")["user_id"].transform("size")
+        test = pos >= np.ceil(size * (1 - test_fraction))
+        return df[~test], df[test]
+    raise ValueError(f"Unknown split {by!r}; expected 'global' or 'user'")
+
+
+class _Context:
+    """Training interactions indexed by user and item, held once per worker."""
+
+    def __init__(self, train: pd.DataFrame, mf_dir: Optional[str] = None):
+        self.train = train[_COLUMNS].reset_index(drop=True)
+        self.users = self.train["user_id"].to_numpy()
+        self.items = self.train["item_id"].to_numpy()
+        self.ratings = self.train["rating"].to_numpy(dtype=float)
+        self.by_user = self.train.groupby("user_id").indices
+        self.by_item = self.train.groupby("item_id").indices
+        self.mf_model = None
+        if mf_dir is not None:
+            from . import mf
+            self.mf_model = mf.load_model(Path(mf_dir))
+
+    def history(self, user_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        pos = self.by_user.get(user_id, _NO_POS)
+        return self.items[pos], self.ratings[pos]
+
+    def liked(self, user_id: int) -> List[int]:
+        items, ratings = self.history(user_id)
+        return items[ratings > 0].tolist()
+
+    def neighborhood(self, user_id: int) -> pd.DataFrame:
+        """The user's ratings plus those of their most-overlapping co-raters."""
+        own = self.by_user.get(user_id, _NO_POS)
+        if not len(own):
+            return pd.DataFrame(columns=_COLUMNS)
+        co = self.users[np.concatenate([self.by_item[i] for i in self.items[own]])]
+        users, counts = np.unique(co[co != user_id], return_counts=True)
+        if len(users) > MAX_NEIGHBORS:
+            users = users[np.argsort(-counts, kind="stable")[:MAX_NEIGHBORS]]
+        return self.train.iloc[np.concatenate([own] + [self.by_user[v] for v in users])]
+
+
+# -------------------------
+# Algorithms: (context, user_id, n) -> ranked item ids
+# -------------------------
+def _ids(df: Optional[pd.DataFrame]) -> np.ndarray:
+    if df is None or df.empty:
+        return _NO_POS
+    return df["item_id"].to_numpy()
+
+def _popular(ctx: _Context, user_id: int, n: int) -> np.ndarray:
+    return _ids(rec._popular(n))
+
+def _content(ctx: _Context, user_id: int, n: int) -> np.ndarray:
+    return _ids(rec.content_based_for_user(ctx.liked(user_id), top_k=n))
+
+def _content_mean(ctx: _Context, user_id: int, n: int) -> np.ndarray:
+    # Mean pooling over the liked items, as utils.online scores content
+    rows = rec.item_rows(ctx.liked(user_id))
+    if not len(rows):
+        return _popular(ctx, user_id, n)
+    return _ids(rec.items_at(*rec._profile_scores(rec.item_vector_sum(rows), len(rows), n, exclude=rows)))
+
+def _collab(ctx: _Context, user_id: int, n: int) -> np.ndarray:
+    return _ids(rec.user_user_collab(ctx.neighborhood(user_id), user_id, top_k=n))
+
+def _hybrid(alpha: float, method: str):
+    def run(ctx: _Context, user_id: int, n: int) -> np.ndarray:
+        return _ids(rec.hybrid_recommendation(ctx.liked(user_id), ctx.neighborhood(user_id), user_id,
+                                              top_k=n, alpha=alpha, method=method))
+    return run
+
+def _mf(ctx: _Context, user_id: int, n: int) -> np.ndarray:
+    model = ctx.mf_model
+    if model is None:
+        return _NO_POS
+    if model.has_user(user_id):
+        vec = model.user_vector(user_id)
+    else:
+        items, ratings = ctx.history(user_id)
+        if not len(items):
+            return _NO_POS
+        vec = model.fold_in(items, ratings)
+    return model.recommend(vec, n, exclude=ctx.liked(user_id))[0]
+
+
+def algorithms(names: Sequence[str] = DEFAULT_ALGORITHMS, alphas: Sequence[float] = (0.6,),
+               methods: Sequence[str] = ("linear",)) -> Dict[str, Callable]:
+    """Name -> scorer. "hybrid" expands to one entry per (method, alpha) when several are given."""
+    fixed = {"popular": _popular, "content": _content, "content-mean": _content_mean,
+             "collab": _collab, "mf": _mf}
+    out = {}
+    for name in names:
+        if name == "hybrid":
+            grid = [(m, a) for m in methods for a in alphas]
+            for m, a in grid:
+                out["hybrid" if len(grid) == 1 else f"hybrid[{m},a={a:g}]"] = _hybrid(a, m)
+        elif name in fixed:
+            out[name] = fixed[name]
+        else:
+            raise ValueError(f"Unknown algorithm {name!r}; expected one of {DEFAULT_ALGORITHMS}")
+    return out
+
+
+# -------------------------
+# Metrics
+# -------------------------
+def ranking_metrics(recommended: Sequence[int], relevant: set, k: int) -> Tuple[float, float, float]:
+    """(precision@k, recall@k, NDCG@k) with binary relevance."""
+    hits = np.array([i in relevant for i in recommended[:k]], dtype=float)
+    if not len(relevant):
+        return 0.0, 0.0, 0.0
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = float((hits * discounts[:len(hits)]).sum())
+    idcg = float(discounts[:min(k, len(relevant))].sum())
+    return hits.sum() / k, hits.sum() / len(relevant), dcg / idcg
+
+
+# -------------------------
+# Workers
+# -------------------------
+_ctx: Optional[_Context] = None
+
+def _init_worker(paths: Dict[str, str], train: pd.DataFrame, mf_dir: Optional[str]):
+    global _ctx
+    # Spawned workers start from the defaults: point them at the caller's database and catalog
+    if (str(db.DB_PATH), str(rec.ITEMS_CSV)) != (paths["db"], paths["items"]):
+        db.DB_PATH, rec.ITEMS_CSV = Path(paths["db"]), Path(paths["items"])
+        rec.load_items()
+    _ctx = _Context(train, mf_dir)
+
+def _evaluate_users(task) -> Dict[str, Dict[str, list]]:
+    users, relevant, names, alphas, methods, k = task
+    algos = algorithms(names, alphas, methods)
+    out = {name: {"precision": [], "recall": [], "ndcg": [], "latency": [], "items": set()} for name in algos}
+    for user_id, rel in zip(users, relevant):
+        rated = set(_ctx.history(user_id)[0].tolist())
+        rel = set(rel)
+        for name, fn in algos.items():
+            t0 = time.perf_counter()
+            ids = fn(_ctx, user_id, k + len(rated))
+            elapsed = time.perf_counter() - t0
+            # Items from the training history are never a useful recommendation
+            top = [int(i) for i in ids if int(i) not in rated][:k]
+            p, r, ndcg = ranking_metrics(top, rel, k)
+            res = out[name]
+            res["precision"].append(p)
+            res["recall"].append(r)
+            res["ndcg"].append(ndcg)
+            res["latency"].append(elapsed)
+            res["items"].update(top)
+    for res in out.values():
+        res["items"] = list(res["items"])
+    return out
+
+
+# -------------------------
+# Driver
+# -------------------------
+def evaluate(k: int = 10, names: Sequence[str] = DEFAULT_ALGORITHMS, alphas: Sequence[float] = (0.6,),
+             methods: Sequence[str] = ("linear",), source: str = "ratings", split: str = "global",
+             test_fraction: float = 0.2, min_train: int = 1, max_users: Optional[int] = None,
+             workers: Optional[int] = None, seed: int = 0, mf_factors: int = 32, mf_iterations: int = 10) -> dict:
+    """Run the evaluation and return the report dict (see module docstring)."""
+    t0 = time.perf_counter()
+    df = load_interactions(source)
+    train, test = temporal_split(df, test_fraction, split)
+    positives = test[test["rating"] > 0].groupby("user_id")["item_id"].apply(list)
+    train_counts = train.groupby("user_id").size()
+    users = [int(u) for u in positives.index if train_counts.get(u, 0) >= min_train]
+    if max_users is not None and len(users) > max_users:
+        users = sorted(np.random.default_rng(seed).choice(users, size=max_users, replace=False).tolist())
+    algos = algorithms(names, alphas, methods)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+
+    results: Dict[str, Dict[str, list]] = {n: {"precision": [], "recall": [], "ndcg": [], "latency": [], "items": []}
+                                           for n in algos}
+    with tempfile.TemporaryDirectory() as tmp:
+        mf_dir = None
+        if "mf" in algos and len(train):
+            # Trained on the training split only, so MF sees no held-out data either
+            from . import mf
+            mf.save(mf.train(train.to_dict("records"), factors=mf_factors, iterations=mf_iterations), Path(tmp))
+            mf_dir = tmp
+        paths = {"db": str(db.DB_PATH), "items": str(rec.ITEMS_CSV)}
+        n_chunks = max(1, min(len(users), max(1, workers) * 4))
+        tasks = [(chunk.tolist(), [positives[u] for u in chunk], list(names), list(alphas), list(methods), k)
+                 for chunk in np.array_split(np.array(users, dtype=np.int64), n_chunks) if len(chunk)]
+        if workers <= 1:
+            _init_worker(paths, train, mf_dir)
+            parts = [_evaluate_users(t) for t in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(paths, train, mf_dir)) as ex:
+                parts = list(ex.map(_evaluate_users, tasks))
+    for part in parts:
+        for name, res in part.items():
+            for key, vals in res.items():
+                results[name][key].extend(vals)
+
+    n_catalog = len(rec.get_items_df())
+    summary = {}
+    for name, res in results.items():
+        lat = np.array(res["latency"]) * 1000
+        summary[name] = {
+            f"precision@{k}": float(np.mean(res["precision"])) if res["precision"] else 0.0,
+            f"recall@{k}": float(np.mean(res["recall"])) if res["recall"] else 0.0,
+            f"ndcg@{k}": float(np.mean(res["ndcg"])) if res["ndcg"] else 0.0,
+            "coverage": len(set(res["items"])) / n_catalog if n_catalog else 0.0,
+            "latency_ms": {q: float(np.percentile(lat, p)) if len(lat) else 0.0
+                           for q, p in (("p50", 50), ("p95", 95), ("p99", 99))},
+        }
+    return {
+        "config": {"k": k, "algorithms": list(algos), "source": source, "split": split,
+                   "test_fraction": test_fraction, "min_train": min_train, "max_users": max_users,
+                   "workers": workers, "seed": seed},
+        "data": {"interactions": len(df), "train": len(train), "test": len(test), "users": len(users),
+                 "catalog": n_catalog},
+        "results": summary,
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+
+
+def report_markdown(report: dict, baseline: Optional[dict] = None) -> str:
+    """Comparison table; with a baseline, each metric shows its change in parentheses."""
+    k = report["config"]["k"]
+    metrics = [f"precision@{k}", f"recall@{k}", f"ndcg@{k}", "coverage"]
+    header = ["algorithm"] + metrics + ["p50 ms", "p99 ms"]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    base = (baseline or {}).get("results", {})
+    for name, res in report["results"].items():
+        old = base.get(name)
+        cells = [name]
+        for m in metrics:
+            cell = f"{res[m]:.4f}"
+            if old and m in old:
+                cell += f" ({res[m] - old[m]:+.4f})"
+            cells.append(cell)
+        for q in ("p50", "p99"):
+            cell = f"{res['latency_ms'][q]:.2f}"
+            if old:
+                cell += f" ({res['latency_ms'][q] - old['latency_ms'][q]:+.2f})"
+            cells.append(cell)
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def _floats(s: str) -> List[float]:
+    return [float(x) for x in s.split(",") if x]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline accuracy/latency evaluation of the recommenders")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--algorithms", default=",".join(DEFAULT_ALGORITHMS))
+    ap.add_argument("--alphas", type=_floats, default=[0.6], help="hybrid alphas, comma separated")
+    ap.add_argument("--methods", default="linear", help=f"hybrid fusion methods from {rec.FUSION_METHODS}")
+    ap.add_argument("--source", choices=["ratings", "activities"], default="ratings")
+    ap.add_argument("--split", choices=["global", "user"], default="global")
+    ap.add_argument("--test-fraction", type=float, default=0.2)
+    ap.add_argument("--min-train", type=int, default=1)
+    ap.add_argument("--max-users", type=int, default=None)
+    ap.add_argument("--workers", type=int, default=None, help="processes (1 runs in-process)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--db", type=Path, default=None, help="database to evaluate (default: the app's)")
+    ap.add_argument("--items", type=Path, default=None, help="items CSV to evaluate against (default: the catalog)")
+    ap.add_argument("--out", type=Path, default=None)
+    ap.add_argument("--compare", type=Path, default=None, help="baseline report to diff against")
+    args = ap.parse_args()
+    if args.db is not None or args.items is not None:
+        db.DB_PATH = args.db or db.DB_PATH
+        rec.ITEMS_CSV = args.items or rec.ITEMS_CSV
+        rec.load_items()
+    report = evaluate(k=args.k, names=[a for a in args.algorithms.split(",") if a], alphas=args.alphas,
+                      methods=[m for m in args.methods.split(",") if m], source=args.source, split=args.split,
+                      test_fraction=args.test_fraction, min_train=args.min_train, max_users=args.max_users,
+                      workers=args.workers, seed=args.seed)
+    if args.out is not None:
+        args.out.write_text(json.dumps(report, indent=2))
+    baseline = json.loads(args.compare.read_text()) if args.compare is not None else None
+    print(report_markdown(report, baseline))
+    print(f"\n{report['data']['users']} users, {report['data']['train']} train / {report['data']['test']} test "
+          f"interactions, {report['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
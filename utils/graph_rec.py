@@ -1,12 +1,37 @@
 from pathlib import Path
+import threading
 import pandas as pd
 import networkx as nx
+from . import catalog_store
+from .metrics import timed
 
 ROOT = Path(__file__).resolve().parents[1]
+ITEMS_CSV = ROOT / "data" / "items.csv"
+MEDICINES_CSV = ROOT / "data" / "medicines.csv"
 
-def build_graph():
-    items = pd.read_csv(ROOT / "data" / "items.csv")
-    meds = pd.read_csv(ROOT / "data" / "medicines.csv")
+# catalog version -> (graph, items, meds); rebuilt only when the catalog changes
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _source():
+    """(cache key, loader) for the current catalog: the shared binary catalog by
+    default, or the CSVs directly when the paths were pointed elsewhere."""
+    if ITEMS_CSV == catalog_store.ITEMS_CSV and MEDICINES_CSV == catalog_store.MEDICINES_CSV:
+        cat = catalog_store.get_catalog()
+        return cat.version, lambda: (cat.items_frame(), cat.medicines_frame())
+    key = (ITEMS_CSV.stat().st_mtime_ns, MEDICINES_CSV.stat().st_mtime_ns)
+    return key, lambda: (pd.read_csv(ITEMS_CSV), pd.read_csv(MEDICINES_CSV))
+
+def _load():
+    key, loader = _source()
+    with _cache_lock:
+        if _cache.get("key") != key:
+            items, meds = loader()
+            _cache.update(key=key, graph=_build(items, meds), items=items, meds=meds)
+        return _cache["graph"], _cache["items"], _cache["meds"]
+
+@timed()
+def _build(items: pd.DataFrame, meds: pd.DataFrame) -> nx.Graph:
     G = nx.Graph()
     # Add condition nodes, item nodes, medicine nodes
     for _, row in items.iterrows():
@@ -19,16 +44,17 @@ def build_graph():
         G.add_edge(f"cond:{row['for_condition']}", f"med:{row['medicine_id']}")
     return G
 
+def build_graph():
+    return _load()[0]
+
+@timed()
 def graph_recommend(condition: str, top_k: int = 5):
-    import pandas as pd
-    G = build_graph()
+    G, items, meds = _load()
     # Rank neighbors of condition by degree centrality (toy example)
     neighbors = list(G.neighbors(f"cond:{condition}")) if G.has_node(f"cond:{condition}") else []
     deg = {n: G.degree(n) for n in neighbors}
     top = sorted(neighbors, key=lambda n: deg[n], reverse=True)[:top_k]
     # Map back to items
-    items = pd.read_csv(ROOT / "data" / "items.csv")
-    meds = pd.read_csv(ROOT / "data" / "medicines.csv")
     item_ids, med_ids = [], []
     for n in top:
         if n.startswith("item:"):
@@ -0,0 +1,164 @@
+"""In-process timers and counters for the recommendation hot paths.
+
+Collection is off unless HEALTHREC_METRICS=1 or `enable()` is called; when
+off, `timed` and `timer` cost one flag check. Stage durations are kept in
+fixed-bucket histograms and can be exported with `prometheus_text()`.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Histogram upper bounds in seconds (Prometheus `le` labels)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get("HEALTHREC_METRICS", "0") == "1"
+_lock = threading.Lock()
+_histograms: Dict[str, "Histogram"] = {}
+_counters: Dict[str, float] = {}
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Bucket upper bound containing the q-th observation (an upper estimate)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def observe(name: str, seconds: float):
+    if not _enabled:
+        return
+    with _lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = Histogram()
+        h.observe(seconds)
+
+
+def incr(name: str, n: float = 1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class timer:
+    """Context manager recording the enclosed block under `name`."""
+    __slots__ = ("name", "_t0")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._t0 = None
+
+    def __enter__(self):
+        if _enabled:
+            self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._t0 is not None:
+            observe(self.name, time.perf_counter() - self._t0)
+        return False
+
+
+def timed(name: Optional[str] = None):
+    """Decorator recording each call of the function under `name` (default: module.qualname)."""
+    def deco(fn):
+        label = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(label, time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+
+def snapshot() -> List[Dict]:
+    """One row per timed stage, slowest total first (for tables and JSON)."""
+    with _lock:
+        rows = [{
+            "stage": name,
+            "calls": h.count,
+            "total_ms": round(h.total * 1000, 3),
+            "mean_ms": round(h.total / h.count * 1000, 3) if h.count else 0.0,
+            "p50_ms": round(h.quantile(0.50) * 1000, 3),
+            "p95_ms": round(h.quantile(0.95) * 1000, 3),
+            "p99_ms": round(h.quantile(0.99) * 1000, 3),
+            "max_ms": round(h.max * 1000, 3),
+        } for name, h in _histograms.items()]
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+
+def counters() -> Dict[str, float]:
+    with _lock:
+        return dict(_counters)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(prefix: str = "healthrec") -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = [f"# HELP {prefix}_stage_duration_seconds Time spent per instrumented stage.",
+             f"# TYPE {prefix}_stage_duration_seconds histogram"]
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            stage = _label(name)
+            cumulative = 0
+            for bound, c in zip(BUCKETS + (float("inf"),), h.counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {h.total!r}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {h.count}')
+        lines.append(f"# HELP {prefix}_events_total Instrumented event counters.")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, v in sorted(_counters.items()):
+            lines.append(f'{prefix}_events_total{{name="{_label(name)}"}} {v}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,275 @@
+"""Implicit-feedback matrix factorization (ALS) over the ratings table.
+
+Likes (+1) become preference 1 and skips (-1) preference 0, both with
+confidence 1 + alpha. Training runs offline:
+
+    python -m utils.mf --factors 32 --iterations 15 --workers 4
+
+and writes float32 factor arrays under models/mf/<version>/, switching
+models/mf/CURRENT atomically and keeping the newest KEEP_VERSIONS versions.
+Serving memory-maps those arrays, so a
+top-k query is one dot product plus argpartition. Users who are new or
+have rated since training are folded in against the fixed item factors.
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from . import db
+from .db import fetch_ratings, last_rating_rowid, rated_after, rated_since
+from .metrics import timed
+
+ROOT = Path(__file__).resolve().parents[1]
+MODEL_DIR = ROOT / "models" / "mf"
+# Model versions kept on disk (CURRENT is always kept)
+KEEP_VERSIONS = 3
+# float64 cells per padded block of factor rows (32 MB) in the batched ALS solve
+SOLVE_CELLS = 1 << 22
+
+
+def _ratings_matrix(rows):
+    users = np.fromiter((r["user_id"] for r in rows), dtype=np.int64, count=len(rows))
+    items = np.fromiter((r["item_id"] for r in rows), dtype=np.int64, count=len(rows))
+    vals = np.fromiter((r["rating"] for r in rows), dtype=np.float32, count=len(rows))
+    user_ids, u = np.unique(users, return_inverse=True)
+    item_ids, i = np.unique(items, return_inverse=True)
+    R = sparse.csr_matrix((vals, (u, i)), shape=(len(user_ids), len(item_ids)), dtype=np.float32)
+    R.sum_duplicates()
+    return R, user_ids, item_ids
+
+
+def _solve_rows(R: sparse.csr_matrix, Y: np.ndarray, YtY: np.ndarray, rows: range,
+                reg: float, alpha: float) -> np.ndarray:
+    # Hu/Koren/Volinsky closed-form step: x = (YtY + Yt(C-I)Y + reg*I)^-1 Yt C p, for many
+    # users at once: their entries are zero-padded to (users, m, k), so the normal equations
+    # are one batched matmul and one stacked np.linalg.solve instead of a Python loop
+    k = Y.shape[1]
+    out = np.zeros((len(rows), k), dtype=np.float64)
+    counts = np.diff(R.indptr[rows.start:rows.stop + 1])
+    # Similar counts together keep the padding small
+    order = np.flatnonzero(counts)
+    order = order[np.argsort(counts[order], kind="stable")]
+    budget = max(1, SOLVE_CELLS // k)
+    start = 0
+    while start < len(order):
+        # Grow the group while users * longest row fits the budget (at least one user)
+        end = start + 1
+        while end < len(order) and (end + 1 - start) * counts[order[end]] <= budget:
+            end += 1
+        sel = order[start:end]
+        c = counts[sel]
+        n, m = len(sel), int(c[-1])
+        # (user, position) of each entry in the padded block, and its index into R
+        user = np.repeat(np.arange(n), c)
+        pos = np.arange(c.sum()) - np.repeat(np.cumsum(c) - c, c)
+        idx = np.repeat(R.indptr[rows.start + sel], c) + pos
+        Yp = np.zeros((n, m, k))
+        Yp[user, pos] = Y[R.indices[idx]]
+        r = np.zeros((n, m))
+        r[user, pos] = R.data[idx]
+        conf = 1.0 + alpha * np.abs(r)
+        A = np.matmul(Yp.transpose(0, 2, 1) * (conf - 1.0)[:, None, :], Yp) + YtY + reg * np.eye(k)
+        b = np.einsum("nmk,nm->nk", Yp, conf * (r > 0))
+        out[sel] = np.linalg.solve(A, b[..., None])[..., 0]
+        start = end
+    return out
+
+
+def _fold(Yi: np.ndarray, r: np.ndarray, YtY: np.ndarray, eye: np.ndarray, alpha: float) -> np.ndarray:
+    conf = 1.0 + alpha * np.abs(r)
+    pref = (r > 0).astype(np.float64)
+    A = YtY + (Yi.T * (conf - 1.0)) @ Yi + eye
+    b = (Yi.T * conf) @ pref
+    return np.linalg.solve(A, b)
+
+
+def _als_step(R, Y, reg, alpha, pool, block):
+    YtY = Y.T @ Y
+    parts = [range(s, min(s + block, R.shape[0])) for s in range(0, R.shape[0], block)]
+    # Each block is a few large NumPy calls that release the GIL, so blocks run in parallel
+    return np.vstack(list(pool.map(lambda rows: _solve_rows(R, Y, YtY, rows, reg, alpha), parts)) or
+                     [np.zeros((0, Y.shape[1]))])
+
+
+@timed()
+def train(rows=None, factors: int = 32, iterations: int = 15, reg: float = 0.1, alpha: float = 10.0,
+          workers: Optional[int] = None, seed: int = 0, block: int = 256) -> dict:
+    """Fit ALS on `rows` (default: the whole ratings table) and return the arrays + metadata."""
+    trained_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    # Ratings past this rowid were written after the snapshot (only known for the whole table)
+    rating_rowid = None
+    if rows is None:
+        rating_rowid = last_rating_rowid()
+        rows = fetch_ratings()
+    R, user_ids, item_ids = _ratings_matrix(rows)
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 0.01, (R.shape[0], factors))
+    Y = rng.normal(0, 0.01, (R.shape[1], factors))
+    RT = R.T.tocsr()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        for _ in range(iterations):
+            X = _als_step(R, Y, reg, alpha, pool, block)
+            Y = _als_step(RT, X, reg, alpha, pool, block)
+    return {
+        "user_factors": X.astype(np.float32),
+        "item_factors": Y.astype(np.float32),
+        "user_ids": user_ids,
+        "item_ids": item_ids,
+        "meta": {"trained_at": trained_at, "rating_rowid": rating_rowid, "factors": factors, "iterations": iterations, "reg": reg,
+                 "alpha": alpha, "users": int(R.shape[0]), "items": int(R.shape[1]), "nnz": int(R.nnz)},
+    }
+
+
+def save(model: dict, model_dir: Path = None, keep: int = KEEP_VERSIONS) -> Path:
+    model_dir = Path(model_dir or MODEL_DIR)
+    version = time.strftime("%Y%m%d%H%M%S") + f"-{uuid.uuid4().hex[:8]}"
+    out = model_dir / version
+    out.mkdir(parents=True, exist_ok=True)
+    for name in ("user_factors", "item_factors", "user_ids", "item_ids"):
+        np.save(out / f"{name}.npy", model[name])
+    (out / "meta.json").write_text(json.dumps(model["meta"], indent=2))
+    # Readers follow CURRENT; os.replace makes the switch atomic
+    tmp = model_dir / f".CURRENT.{os.getpid()}"
+    tmp.write_text(version)
+    os.replace(tmp, model_dir / "CURRENT")
+    prune(model_dir, keep)
+    return out
+
+
+def prune(model_dir: Path = None, keep: int = KEEP_VERSIONS) -> int:
+    """Delete all but the newest `keep` versions (never CURRENT); returns how many were removed.
+
+    Processes serving an older version keep reading it: its arrays are already
+    memory-mapped and the files stay readable until unmapped.
+    """
+    model_dir = Path(model_dir or MODEL_DIR)
+    try:
+        current = (model_dir / "CURRENT").read_text().strip()
+    except OSError:
+        current = None
+    versions = sorted((p for p in model_dir.iterdir() if p.is_dir() and not p.name.startswith(".")),
+                      key=lambda p: (p.stat().st_mtime_ns, p.name), reverse=True)
+    removed = 0
+    for p in versions[max(keep, 1):]:
+        if p.name != current:
+            shutil.rmtree(p, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+class MFModel:
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text())
+        self.user_factors = np.load(path / "user_factors.npy", mmap_mode="r")
+        self.item_factors = np.load(path / "item_factors.npy", mmap_mode="r")
+        self.user_ids = np.load(path / "user_ids.npy")
+        self.item_ids = np.load(path / "item_ids.npy")
+        self._user_index = {int(u): n for n, u in enumerate(self.user_ids)}
+        self._item_index = {int(i): n for n, i in enumerate(self.item_ids)}
+        self._yty = None
+        self._eye = self.meta["reg"] * np.eye(self.item_factors.shape[1])
+
+    @property
+    def trained_at(self) -> str:
+        return self.meta["trained_at"]
+
+    def rated_since_training(self, user_id: int) -> bool:
+        rowid = self.meta.get("rating_rowid")
+        if rowid is None:
+            # Trained on a given row set (or by an older version): fall back to timestamps
+            return rated_since(user_id, self.trained_at)
+        return rated_after(user_id, rowid)
+
+    def has_user(self, user_id: int) -> bool:
+        return int(user_id) in self._user_index
+
+    def fold_in(self, item_ids: Iterable[int], ratings: Iterable[float]) -> np.ndarray:
+        """User vector from current ratings, solved against the fixed item factors."""
+        pairs = [(self._item_index[int(i)], float(r)) for i, r in zip(item_ids, ratings) if int(i) in self._item_index]
+        if not pairs:
+            return np.zeros(self.item_factors.shape[1], dtype=np.float32)
+        if self._yty is None:
+            Y = np.asarray(self.item_factors, dtype=np.float64)
+            self._yty = Y.T @ Y
+        idx = np.array([p[0] for p in pairs])
+        r = np.array([p[1] for p in pairs])
+        Yi = np.asarray(self.item_factors[idx], dtype=np.float64)
+        return _fold(Yi, r, self._yty, self._eye, self.meta["alpha"]).astype(np.float32)
+
+    def user_vector(self, user_id: int) -> np.ndarray:
+        return np.asarray(self.user_factors[self._user_index[int(user_id)]])
+
+    def recommend(self, vector: np.ndarray, top_k: int = 5, exclude: Iterable[int] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """(item_ids, scores) of the top_k items for a user vector."""
+        scores = self.item_factors @ vector
+        ex = [self._item_index[int(i)] for i in exclude if int(i) in self._item_index]
+        if ex:
+            scores[ex] = -np.inf
+        k = min(top_k, len(scores) - len(ex))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        part = np.argpartition(-scores, k - 1)[:k]
+        top = part[np.argsort(-scores[part], kind="stable")]
+        return self.item_ids[top], scores[top]
+
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def load_model(model_dir: Path = None) -> Optional[MFModel]:
+    """Current model (memory-mapped, cached until CURRENT changes), or None if untrained."""
+    model_dir = Path(model_dir or MODEL_DIR)
+    try:
+        version = (model_dir / "CURRENT").read_text().strip()
+    except OSError:
+        return None
+    key = (str(model_dir), version)
+    with _load_lock:
+        if key not in _loaded:
+            _loaded.clear()
+            _loaded[key] = MFModel(model_dir / version)
+        return _loaded[key]
+
+
+def user_vector(model: MFModel, user_id: int, item_ids, ratings) -> np.ndarray:
+    """Stored vector if it is still current, else a fold-in from the user's ratings."""
+    if model.has_user(user_id) and not model.rated_since_training(user_id):
+        return model.user_vector(user_id)
+    return model.fold_in(item_ids, ratings)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Train the ALS matrix-factorization model")
+    ap.add_argument("--factors", type=int, default=32)
+    ap.add_argument("--iterations", type=int, default=15)
+    ap.add_argument("--reg", type=float, default=0.1)
+    ap.add_argument("--alpha", type=float, default=10.0)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--model-dir", type=Path, default=MODEL_DIR)
+    ap.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="model versions kept on disk")
+    ap.add_argument("--db", type=Path, default=None)
+    args = ap.parse_args()
+    if args.db is not None:
+        db.DB_PATH = args.db
+    t0 = time.perf_counter()
+    model = train(factors=args.factors, iterations=args.iterations, reg=args.reg, alpha=args.alpha,
+                  workers=args.workers)
+    out = save(model, args.model_dir, args.keep)
+    print(json.dumps({**model["meta"], "path": str(out), "seconds": round(time.perf_counter() - t0, 2)}))
+
+
+if __name__ == "__main__":
+    main()
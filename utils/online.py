@@ -0,0 +1,304 @@
+"""Incremental recommendation state driven by rating events.
+
+utils.db.rate_item publishes every write (db.on_rating) and this module
+applies it in time proportional to the touched row, with no rebuild:
+
+- the user's content profile, kept as the running sum and count of the
+  TF-IDF rows of the items they like; their mean scores the whole catalog
+  in one sparse product,
+- the sparse user-item matrix, as per-user rows and per-item columns with
+  each user's squared rating norm, which user-user CF reads directly,
+- per-item like / skip counters, which feed the re-ranker's popularity.
+
+Rows and columns are loaded from the database the first time they are
+needed and kept current afterwards; past MAX_USERS / MAX_ITEMS the least
+recently used are dropped and reloaded on next use. Writes from other processes (bulk
+imports, another app instance) are caught up by sync(), which replays the
+ratings written after the last rowid it has seen.
+"""
+import math
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from . import recommender as rec
+from .db import (on_rating, ratings_for_users, ratings_for_items, rating_totals, rating_norms,
+                 ratings_after, last_rating_rowid)
+from .metrics import timed, incr
+
+# Most-similar co-raters used for user-user CF
+MAX_NEIGHBORS = 2000
+# Users / items whose ratings are held in memory
+MAX_USERS = 20_000
+MAX_ITEMS = 20_000
+# Norms kept for co-raters whose rows are not held
+MAX_NORMS = 200_000
+# Live likes - skips move an item by at most this share of the catalog popularity range,
+# saturating once the net count is a few times LIVE_POPULARITY_SCALE
+LIVE_POPULARITY_WEIGHT = 0.5
+LIVE_POPULARITY_SCALE = 20.0
+
+_EMPTY = (np.empty(0, dtype=np.int64), np.empty(0))
+
+
+class OnlineState:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Least recently used first
+        self._rows: "OrderedDict[int, Dict[int, float]]" = OrderedDict()   # user -> {item: rating}
+        self._cols: "OrderedDict[int, Dict[int, float]]" = OrderedDict()   # item -> {user: rating}
+        self._norm_sq: Dict[int, float] = {}                               # for users in _rows
+        self._co_norm_sq: "OrderedDict[int, float]" = OrderedDict()        # for users not in _rows
+        self._profiles: Dict[int, Tuple[sparse.csr_matrix, int]] = {}      # for users in _rows
+        self._generation = rec.catalog_generation()
+        self._counts: Optional[Dict[int, List[int]]] = None  # item -> [likes, skips]
+        self._applied: Set[int] = set()                      # rowids of events sync() will see again
+        self._last_rowid = last_rating_rowid()
+
+    # -------------------------
+    # Loading
+    # -------------------------
+    def _load_rows(self, user_ids: Iterable[int]):
+        missing = []
+        for u in user_ids:
+            if u in self._rows:
+                self._rows.move_to_end(u)
+            else:
+                missing.append(u)
+        if not missing:
+            return
+        for u in missing:
+            self._rows[u] = {}
+        for r in ratings_for_users(missing):
+            self._rows[r["user_id"]][r["item_id"]] = float(r["rating"])
+        for u in missing:
+            self._norm_sq[u] = sum(v * v for v in self._rows[u].values())
+            self._co_norm_sq.pop(u, None)
+
+    def _load_cols(self, item_ids: Iterable[int]):
+        missing = []
+        for i in item_ids:
+            if i in self._cols:
+                self._cols.move_to_end(i)
+            else:
+                missing.append(i)
+        if not missing:
+            return
+        for i in missing:
+            self._cols[i] = {}
+        for r in ratings_for_items(missing):
+            self._cols[r["item_id"]][r["user_id"]] = float(r["rating"])
+
+    def _norms(self, user_ids: Iterable[int]) -> Dict[int, float]:
+        """Squared rating norms, from held rows or the co-rater cache (fetched on a miss)."""
+        out, missing = {}, []
+        for u in user_ids:
+            if u in self._norm_sq:
+                out[u] = self._norm_sq[u]
+            elif u in self._co_norm_sq:
+                self._co_norm_sq.move_to_end(u)
+                out[u] = self._co_norm_sq[u]
+            else:
+                missing.append(u)
+        if missing:
+            fetched = {r["user_id"]: float(r["norm_sq"]) for r in rating_norms(missing)}
+            for u in missing:
+                out[u] = self._co_norm_sq[u] = fetched.get(u, 0.0)
+        return out
+
+    def _trim(self):
+        # Called once a read has copied what it needs, so nothing in use is dropped
+        while len(self._rows) > MAX_USERS:
+            u, _ = self._rows.popitem(last=False)
+            self._norm_sq.pop(u, None)
+            self._profiles.pop(u, None)
+        while len(self._cols) > MAX_ITEMS:
+            self._cols.popitem(last=False)
+        while len(self._co_norm_sq) > MAX_NORMS:
+            self._co_norm_sq.popitem(last=False)
+
+    def _row(self, user_id: int) -> Dict[int, float]:
+        self._load_rows([user_id])
+        return self._rows[user_id]
+
+    def _load_counts(self):
+        if self._counts is None:
+            self._counts = {r["item_id"]: [r["likes"], r["skips"]] for r in rating_totals()}
+
+    def _profile(self, user_id: int) -> Tuple[sparse.csr_matrix, int]:
+        gen = rec.catalog_generation()
+        if gen != self._generation:
+            # Catalog reloaded: vectors (and possibly vocabulary) changed
+            self._profiles.clear()
+            self._generation = gen
+        p = self._profiles.get(user_id)
+        if p is None:
+            rows = rec.item_rows([i for i, r in self._row(user_id).items() if r > 0])
+            p = self._profiles[user_id] = (rec.item_vector_sum(rows), len(rows))
+        return p
+
+    # -------------------------
+    # Updates
+    # -------------------------
+    def apply(self, user_id: int, item_id: int, rating: float, previous: Optional[float] = None,
+              known_previous: bool = True):
+        """Apply one rating write. `previous` is the rating it replaced (None if new)."""
+        rating = float(rating)
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is not None:
+                previous, known_previous = row.get(item_id), True
+                self._norm_sq[user_id] += rating * rating - (previous or 0.0) ** 2
+                row[item_id] = rating
+            elif user_id in self._co_norm_sq:
+                if known_previous:
+                    self._co_norm_sq[user_id] += rating * rating - (previous or 0.0) ** 2
+                else:
+                    self._co_norm_sq.pop(user_id)
+            col = self._cols.get(item_id)
+            if col is not None:
+                col[user_id] = rating
+            if previous == rating:
+                return
+            was_liked, liked = (previous or 0) > 0, rating > 0
+            if self._counts is not None:
+                if known_previous:
+                    c = self._counts.setdefault(item_id, [0, 0])
+                    c[0] += liked - was_liked
+                    c[1] += (rating < 0) - ((previous or 0) < 0)
+                else:
+                    # Unknown prior value: recount this one item
+                    self._counts.pop(item_id, None)
+                    for r in rating_totals([item_id]):
+                        self._counts[item_id] = [r["likes"], r["skips"]]
+            # Profiles only exist for loaded rows, so `previous` is exact here
+            p = self._profiles.get(user_id)
+            rows = rec.item_rows([item_id]) if p is not None and was_liked != liked else []
+            if len(rows):
+                delta = rec.item_vector_sum(rows)
+                self._profiles[user_id] = (p[0] + delta, p[1] + 1) if liked else (p[0] - delta, p[1] - 1)
+
+    def on_event(self, user_id: int, item_id: int, rating: int, previous: Optional[int], rowid: int):
+        with self._lock:
+            if rowid <= self._last_rowid:
+                # A sync that ran between the write and this event already replayed it
+                return
+            self.apply(user_id, item_id, rating, previous)
+            self._applied.add(rowid)
+        incr("online.events")
+
+    @timed("online.sync")
+    def sync(self):
+        """Replay ratings written since the last sync that did not arrive as events."""
+        with self._lock:
+            while True:
+                rows = ratings_after(self._last_rowid)
+                if not rows:
+                    break
+                for r in rows:
+                    if r["rowid"] in self._applied:
+                        self._applied.discard(r["rowid"])
+                    else:
+                        self.apply(r["user_id"], r["item_id"], r["rating"], known_previous=False)
+                self._last_rowid = rows[-1]["rowid"]
+            # Replaced before this sync read them, so they will not come round again
+            self._applied = {rowid for rowid in self._applied if rowid > self._last_rowid}
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def row(self, user_id: int) -> Dict[int, float]:
+        """Copy of the user's ratings, {item_id: rating}."""
+        with self._lock:
+            row = dict(self._row(user_id))
+            self._trim()
+        return row
+
+    def liked(self, user_id: int) -> List[int]:
+        with self._lock:
+            liked = [i for i, r in self._row(user_id).items() if r > 0]
+            self._trim()
+        return liked
+
+    def content_scores(self, user_id: int, top_k: int):
+        """(rows, scores) by mean cosine to the user's liked items."""
+        with self._lock:
+            profile, count = self._profile(user_id)
+            liked = [i for i, r in self._rows[user_id].items() if r > 0]
+            self._trim()
+        return rec._profile_scores(profile, count, top_k, exclude=rec.item_rows(liked))
+
+    def collab_scores(self, user_id: int, top_k: int, max_neighbors: int = MAX_NEIGHBORS):
+        """(rows, scores) from user-user cosine CF, equivalent to recommender.user_user_collab."""
+        # The lock only covers loading and copying, so rating events are not held up by the scoring
+        with self._lock:
+            row = dict(self._row(user_id))
+            nu = math.sqrt(self._norm_sq[user_id]) + 1e-9
+            if row:
+                self._load_cols(row)
+                cols = [(r, list(self._cols[i].items())) for i, r in row.items()]
+            self._trim()
+        if not row:
+            return _EMPTY
+        dots: Dict[int, float] = defaultdict(float)
+        for r, col in cols:
+            for v, rv in col:
+                if v != user_id:
+                    dots[v] += r * rv
+        dots = {v: d for v, d in dots.items() if d != 0.0}
+        if not dots:
+            return _EMPTY
+        if len(dots) > max_neighbors:
+            with self._lock:
+                norms = self._norms(dots)
+                self._trim()
+            # Rank by cosine, so users who rated everything don't crowd out closer neighbours
+            keep = sorted(dots, key=lambda v: -abs(dots[v]) / (math.sqrt(norms[v]) + 1e-9))[:max_neighbors]
+            dots = {v: dots[v] for v in keep}
+        with self._lock:
+            self._load_rows(dots)
+            neighbors = [(d, self._norm_sq[v], list(self._rows[v].items())) for v, d in dots.items()]
+            self._trim()
+        scores: Dict[int, float] = defaultdict(float)
+        for d, norm_sq, items in neighbors:
+            nv = math.sqrt(norm_sq) + 1e-9
+            w = d / (nu * nv) / nv
+            for j, rj in items:
+                scores[j] += w * rj
+        ids = np.fromiter(scores, dtype=np.int64, count=len(scores))
+        vals = np.fromiter(scores.values(), dtype=float, count=len(scores))
+        return rec._id_scores(ids, vals, top_k, exclude_ids=[i for i, r in row.items() if r > 0])
+
+    def popularity(self, item_ids) -> np.ndarray:
+        """Catalog popularity plus net live likes (likes - skips), scaled to it, for `item_ids`."""
+        ids = np.asarray(list(item_ids), dtype=np.int64)
+        with self._lock:
+            self._load_counts()
+            net = np.array([c[0] - c[1] for c in (self._counts.get(int(i), (0, 0)) for i in ids)], dtype=float)
+        rows = rec._id_index.get_indexer(ids)
+        base = np.where(rows >= 0, rec._popularity[np.maximum(rows, 0)], 0.0)
+        span = float(np.ptp(rec._popularity)) if len(rec._popularity) else 0.0
+        return base + LIVE_POPULARITY_WEIGHT * (span or 1.0) * np.tanh(net / LIVE_POPULARITY_SCALE)
+
+
+_state: Optional[OnlineState] = None
+_state_lock = threading.Lock()
+
+
+def get_state() -> OnlineState:
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = OnlineState()
+        return _state
+
+
+@on_rating
+def _on_rating(user_id: int, item_id: int, rating: int, previous: Optional[int], rowid: int):
+    # Nothing to keep current until something has read the state
+    if _state is not None:
+        _state.on_event(user_id, item_id, rating, previous, rowid)
+
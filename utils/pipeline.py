@@ -0,0 +1,308 @@
+"""Two-stage recommendation: concurrent candidate generation, then one re-rank.
+
+Stage 1 runs cheap candidate generators (content profile, user-user CF,
+matrix factorization, condition graph, trending) on a thread pool, each
+under its own timeout. A generator that is slow or raises is dropped from
+that request and counted (pipeline.timeout.<name> / pipeline.error.<name>)
+instead of failing it. While a
+timed-out call is still running, later requests skip that generator
+(pipeline.skipped.<name>) rather than queue more work behind it.
+
+Stage 2 fuses the surviving lists, drops excluded and already-rated items
+and applies context (timeslot, trending, live popularity) to the whole
+union with array operations, joining item metadata only for the top_k. If
+that leaves nothing, popularity fills in.
+
+Generators work on catalog row positions, which change whenever the
+catalog is reloaded or patched, so candidates cross between the stages as
+item ids, and each stage is repeated if a reload overlapped it.
+
+A bandit arm is a weighting of generators (ARMS), so every arm goes
+through the same re-ranker. Stages are timed as pipeline.prepare,
+pipeline.generate(.<name>) and pipeline.rerank, so the p99 of pipeline.run
+can be held to BUDGET_MS. Catching the online state and trending counters
+up with other processes' writes happens on a background refresher
+(pipeline.refresh), not in a request.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import online
+from . import recommender as rec
+from . import trending
+from .graph_rec import graph_recommend
+from .metrics import incr, timer
+
+DEFAULT_CONDITION = "hypertension"
+# Whole-request budget; each generator's timeout is capped by it
+BUDGET_MS = float(os.environ.get("HEALTHREC_PIPELINE_BUDGET_MS", "400"))
+TIMEOUTS_MS = {"content": 200, "collab": 300, "mf": 200, "graph": 200, "trending": 100}
+# How often the online state and trending counters catch up with the database
+REFRESH_SECONDS = float(os.environ.get("HEALTHREC_PIPELINE_REFRESH_SECONDS", "1.0"))
+# Generator weights per bandit arm
+ARMS = {
+    "content": {"content": 1.0, "trending": 0.2},
+    "collab": {"collab": 1.0, "trending": 0.2},
+    "mf": {"mf": 1.0, "trending": 0.2},
+    "hybrid": {"content": 0.6, "collab": 0.4, "trending": 0.2},
+    "graph": {"graph": 1.0},
+}
+# Candidates asked of each generator per item returned
+OVERFETCH = 4
+
+Candidates = Tuple[np.ndarray, np.ndarray]  # (item ids, scores), best first
+# Generators return (catalog rows, scores); one may add a third element, data it
+# produced for the response (graph: medicines)
+
+
+def _pinned(fn: Callable, finish: Callable = lambda out: out, attempts: int = 2):
+    """finish(fn()) with both seeing one catalog; repeated if a reload overlapped fn."""
+    for _ in range(attempts):
+        gen = rec.catalog_generation()
+        out = fn()
+        # Reloads install under this lock, so the generation can't move while finish() runs
+        with rec._load_lock:
+            if rec.catalog_generation() == gen:
+                return finish(out)
+        incr("pipeline.catalog_reloaded")
+    raise RuntimeError("catalog reloaded during every attempt")
+
+def _to_ids(out: tuple) -> tuple:
+    return (rec._id_index.to_numpy()[np.asarray(out[0], dtype=np.int64)],) + tuple(out[1:])
+
+
+def user_condition(liked: List[int]) -> str:
+    """Most common condition among the liked items, or a common default."""
+    if liked:
+        return rec.items_at(rec.item_rows(liked))["condition"].mode().iloc[0]
+    return DEFAULT_CONDITION
+
+
+@dataclass
+class Request:
+    user_id: int
+    k: int
+    ratings: Dict[int, float]
+
+    @property
+    def liked(self) -> List[int]:
+        return [i for i, r in self.ratings.items() if r > 0]
+
+
+@dataclass
+class Result:
+    items: pd.DataFrame
+    medicines: pd.DataFrame
+    degraded: List[str]
+
+
+# -------------------------
+# Stage 1: generators
+# -------------------------
+def _gen_content(req: Request) -> Candidates:
+    return online.get_state().content_scores(req.user_id, req.k)
+
+def _gen_collab(req: Request) -> Candidates:
+    return online.get_state().collab_scores(req.user_id, req.k)
+
+def _gen_mf(req: Request) -> Candidates:
+    own = pd.DataFrame({"user_id": req.user_id, "item_id": list(req.ratings), "rating": list(req.ratings.values())},
+                       columns=["user_id", "item_id", "rating"])
+    rows, scores = rec._mf_scores(own, req.user_id, req.k)
+    # No trained model yet (or nothing to fold in): memory-based CF instead
+    return (rows, scores) if len(rows) else _gen_collab(req)
+
+def _gen_graph(req: Request) -> Tuple[np.ndarray, np.ndarray, pd.DataFrame]:
+    items, medicines = graph_recommend(user_condition(req.liked), top_k=req.k)
+    rows = rec.item_rows(items["item_id"])
+    return rows, np.linspace(1, 0, len(rows)), medicines
+
+def _gen_trending(req: Request) -> Candidates:
+    ids, trend = trending.get_engine().top(req.k)
+    rows = rec._id_index.get_indexer(ids)
+    keep = rows >= 0
+    return rows[keep], trend[keep]
+
+GENERATORS: Dict[str, Callable[[Request], tuple]] = {
+    "content": _gen_content,
+    "collab": _gen_collab,
+    "mf": _gen_mf,
+    "graph": _gen_graph,
+    "trending": _gen_trending,
+}
+
+
+# -------------------------
+# Stage 2: re-rank
+# -------------------------
+_timeslots: Tuple[int, Optional[np.ndarray]] = (-1, None)
+
+def _catalog_timeslots() -> np.ndarray:
+    # Per-row timeslot, rebuilt only when the catalog reloads
+    global _timeslots
+    gen = rec.catalog_generation()
+    if _timeslots[0] != gen:
+        slots = pd.Series(rec.item_column("timeslot"), dtype=object).replace("", "any")
+        _timeslots = (gen, slots.str.lower().to_numpy())
+    return _timeslots[1]
+
+def rerank(lists: Dict[str, Candidates], weights: Dict[str, float], top_k: int, time_of_day: str = "any",
+           exclude_ids: Iterable[int] = (), popularity: Optional[Callable] = None, engine=None,
+           trending_weight: float = 0.2) -> pd.DataFrame:
+    """Fuse candidate lists (weighted linear rank scores), filter, apply context, return the top_k."""
+    lists = {n: c for n, c in lists.items() if len(c[0])}
+    if not lists:
+        return pd.DataFrame()
+    total = sum(weights[n] for n in lists)
+    ids = np.concatenate([c[0] for c in lists.values()]).astype(np.int64)
+    contrib = np.concatenate([weights[n] / total * np.linspace(1, 0, len(c[0])) for n, c in lists.items()])
+    item_ids, inv = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inv, weights=contrib, minlength=len(item_ids))
+
+    # Items deleted since they were proposed have no row
+    uniq = rec._id_index.get_indexer(item_ids)
+    keep = (uniq >= 0) & ~np.isin(item_ids, np.asarray(list(exclude_ids), dtype=np.int64))
+    item_ids, uniq, fused = item_ids[keep], uniq[keep], fused[keep]
+    if len(uniq) == 0:
+        return pd.DataFrame()
+
+    pop = popularity(item_ids) if popularity is not None else rec._popularity[uniq]
+    trend = affinity = None
+    if engine is not None:
+        trend, affinity = engine.lookup(item_ids, time_of_day)
+    time_boost, trend_boost = rec._context_boosts(_catalog_timeslots()[uniq], pop, time_of_day,
+                                                  trending_weight, trend, affinity)
+    score_adj = fused + time_boost + trend_boost
+    top = rec._top(score_adj, top_k)
+
+    out = rec.items_at(uniq[top], fused[top])
+    out["time_boost"], out["trend_boost"], out["score_adj"] = time_boost[top], trend_boost[top], score_adj[top]
+    # Which generators proposed each winner
+    out["sources"] = [",".join(n for n, c in lists.items() if i in c[0]) for i in item_ids[top]]
+    return out
+
+
+class Pipeline:
+    def __init__(self, max_workers: int = 8, budget_ms: float = BUDGET_MS,
+                 timeouts_ms: Optional[Dict[str, float]] = None, refresh_seconds: float = REFRESH_SECONDS):
+        # Separate from the service's pool so a request never waits on its own workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self.budget_ms = budget_ms
+        self.timeouts_ms = {**TIMEOUTS_MS, **(timeouts_ms or {})}
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._stragglers: Dict[str, Future] = {}  # name -> timed-out call still running
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _timeout(self, name: str) -> float:
+        return min(self.timeouts_ms.get(name, self.budget_ms), self.budget_ms) / 1000.0
+
+    @staticmethod
+    def _call(name: str, req: Request) -> tuple:
+        with timer(f"pipeline.generate.{name}"):
+            return _pinned(lambda: GENERATORS[name](req), _to_ids)
+
+    def _submit(self, name: str, req: Request) -> Optional[Future]:
+        # At most one straggler per generator holds a worker; until it finishes, skip that generator
+        with self._lock:
+            straggler = self._stragglers.get(name)
+            if straggler is not None:
+                if not straggler.done():
+                    return None
+                del self._stragglers[name]
+        return self._executor.submit(self._call, name, req)
+
+    def generate(self, req: Request, weights: Dict[str, float]
+                 ) -> Tuple[Dict[str, Candidates], List[str], Dict[str, object]]:
+        """Run the weighted generators concurrently.
+
+        Returns (lists, names that were skipped, timed out or failed, extra data by generator name).
+        """
+        start = time.perf_counter()
+        futures, degraded = {}, []
+        for name, w in weights.items():
+            if w <= 0:
+                continue
+            future = self._submit(name, req)
+            if future is None:
+                degraded.append(name)
+                incr(f"pipeline.skipped.{name}")
+            else:
+                futures[name] = future
+        lists, extras = {}, {}
+        for name in sorted(futures, key=self._timeout):
+            try:
+                out = futures[name].result(timeout=max(0.0, start + self._timeout(name) - time.perf_counter()))
+            except FutureTimeout:
+                # Left to finish in the background (it still warms caches), but not waited for
+                with self._lock:
+                    self._stragglers[name] = futures[name]
+                degraded.append(name)
+                incr(f"pipeline.timeout.{name}")
+                continue
+            except Exception:
+                degraded.append(name)
+                incr(f"pipeline.error.{name}")
+                continue
+            lists[name] = out[:2]
+            if len(out) > 2:
+                extras[name] = out[2]
+        return lists, degraded, extras
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                with timer("pipeline.refresh"):
+                    # Writes from other processes; this process's ratings already arrive as events
+                    online.get_state().sync()
+                    trending.get_engine().update()
+            except Exception:
+                incr("pipeline.refresh_error")
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is None and not self._stop.is_set():
+                self._refresher = threading.Thread(target=self._refresh_loop, daemon=True, name="pipeline-refresh")
+                self._refresher.start()
+
+    def run(self, user_id: int, algorithm: str = "hybrid", top_k: int = 5, time_of_day: str = "any",
+            exclude: Iterable[int] = (), trending_weight: float = 0.2) -> Result:
+        if algorithm not in ARMS:
+            raise ValueError(f"Unknown algorithm {algorithm!r}; expected one of {list(ARMS)}")
+        weights = ARMS[algorithm]
+        exclude = list(exclude)
+        with timer("pipeline.run"):
+            with timer("pipeline.prepare"):
+                state = online.get_state()
+                engine = trending.get_engine()
+                self._start_refresher()
+                req = Request(user_id, top_k * OVERFETCH + len(exclude), state.row(user_id))
+            with timer("pipeline.generate"):
+                lists, degraded, extras = self.generate(req, weights)
+            with timer("pipeline.rerank"):
+                # Rated items (liked or skipped) are never re-recommended
+                excluded = [*req.ratings, *exclude]
+
+                def rank(lists, weights):
+                    return _pinned(lambda: rerank(lists, weights, top_k, time_of_day, exclude_ids=excluded,
+                                                  popularity=state.popularity, engine=engine,
+                                                  trending_weight=trending_weight))
+                items = rank(lists, weights)
+                if items.empty:
+                    # Nothing usable in time, or only items already rated: popularity keeps the page populated
+                    incr("pipeline.fallback")
+                    popular = _pinned(lambda: rec._popular_scores(req.k + len(req.ratings)), _to_ids)
+                    items = rank({"popular": popular}, {"popular": 1.0})
+        return Result(items, extras.get("graph", pd.DataFrame()), degraded)
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
@@ -6,63 +6,288 @@ from sklearn.metrics.pairwise import cosine_similarity
 from scipy import sparse
 from typing import List, Dict, Optional
 import json
+import threading
+from . import catalog_store
+from . import db
+from .metrics import timed, timer, incr
 
 ROOT = Path(__file__).resolve().parents[1]
 ITEMS_CSV = ROOT / "data" / "items.csv"
 
-# Fit TF-IDF on startup (small data; OK to refit)
-_items = pd.read_csv(ITEMS_CSV)
-_items["text"] = (_items["title"].fillna("") + " " +
-                  _items["tags"].fillna("") + " " +
-                  _items["description"].fillna(""))
-_vectorizer = TfidfVectorizer(stop_words="english")
-_item_vectors = _vectorizer.fit_transform(_items["text"].values)
+# Blend methods accepted by hybrid_recommendation / blend()
+FUSION_METHODS = ("linear", "score", "rrf")
+RRF_K = 60
+_generation = 0
+_load_lock = threading.RLock()
+# Module globals set by load_items(); read through _ensure_loaded() / __getattr__.
+# _items holds only item_id and popularity; the text columns are StringColumns in
+# _text, decoded per row (mapped from the shared catalog when loaded from it)
+_CATALOG_GLOBALS = ("_items", "_text", "_vectorizer", "_item_vectors", "_id_index", "_popularity",
+                    "_catalog_version", "_db_version")
+
+@timed()
+def load_items(csv_path: Optional[Path] = None):
+    """(Re)load the item catalog.
+
+    By default this maps the shared binary catalog (utils.catalog_store), which
+    is rebuilt from the database's catalog tables in the background when they
+    change. An explicit `csv_path` loads and fits TF-IDF in-process instead
+    (benchmarks, experiments).
+    """
+    with _load_lock:
+        _load_items(csv_path)
+
+def _load_items(csv_path: Optional[Path]):
+    if csv_path is None and Path(ITEMS_CSV) == catalog_store.ITEMS_CSV:
+        _install_catalog(catalog_store.get_catalog())
+        return
+    items = pd.read_csv(csv_path or ITEMS_CSV)
+    vectorizer = TfidfVectorizer(stop_words="english")
+    vectors = vectorizer.fit_transform(catalog_store.item_text(items).values)
+    text = {c: catalog_store.StringColumn.from_values(items[c]) for c in catalog_store.ITEM_TEXT_COLS}
+    _install(items[["item_id", "popularity"]], text, vectorizer, vectors, None, None)
+
+def _install_catalog(cat: catalog_store.Catalog):
+    items = pd.DataFrame({"item_id": np.asarray(cat.item_ids), "popularity": np.asarray(cat.popularity)})
+    _install(items, cat.item_text, cat.vectorizer(), cat.item_vectors, cat.version, cat.db_version)
+
+def _install(items: pd.DataFrame, text: Dict, vectorizer, vectors, version: Optional[str],
+             db_version: Optional[int]):
+    global _items, _text, _vectorizer, _item_vectors, _id_index, _popularity, _catalog_version, _db_version, _generation
+    _items, _text, _vectorizer, _item_vectors = items.reset_index(drop=True), text, vectorizer, vectors
+    _catalog_version, _db_version = version, db_version
+    # item_id -> row position, and popularity as a plain array for the fast paths
+    _id_index = pd.Index(items["item_id"].to_numpy())
+    _popularity = items["popularity"].to_numpy(dtype=float)
+    # Bumped on every reload so derived state (utils.online profiles) can tell it is stale
+    _generation += 1
+
+def _ensure_loaded():
+    # The catalog is loaded on first use, not at import, so importing this module
+    # (e.g. by a CLI before it applies --db) never reads or seeds a database
+    if _generation == 0:
+        with _load_lock:
+            if _generation == 0:
+                _load_items(None)
+
+def __getattr__(name: str):
+    if name in _CATALOG_GLOBALS:
+        _ensure_loaded()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _patch_items(item_ids: List[int], db_version: int):
+    """Apply single-row item edits from the database without a rebuild or TF-IDF refit.
+
+    Edited text is vectorised with the current vocabulary until the background
+    rebuild swaps in a refitted catalog.
+    """
+    global _catalog_version, _db_version
+    ids = np.asarray(sorted(set(item_ids)), dtype=np.int64)
+    # A new version per patch, so slates built on the old rows are rebuilt
+    version = f"{(_catalog_version or '').split('+')[0]}+{db_version}"
+    if not len(ids):
+        # Medicine-only edits: nothing served from here changed
+        _catalog_version, _db_version = version, db_version
+        return
+    fresh = pd.DataFrame([tuple(r) for r in db.get_items(ids.tolist())], columns=db.ITEM_COLUMNS)
+    fresh["popularity"] = pd.to_numeric(fresh["popularity"], errors="coerce").fillna(0).astype(_items["popularity"].dtype)
+    keep = np.flatnonzero(~_id_index.isin(ids))
+    items = pd.concat([_items.iloc[keep], fresh[["item_id", "popularity"]]], ignore_index=True)
+    vectors = _item_vectors[keep]
+    if len(fresh) and vectors.shape[1]:
+        vectors = sparse.vstack([vectors, _vectorizer.transform(catalog_store.item_text(fresh).values)]).tocsr()
+    elif len(fresh):
+        # Catalog was empty, so there is no vocabulary yet
+        vectors = sparse.csr_matrix((len(keep) + len(fresh), 0))
+    # Same row order as a rebuilt catalog
+    order = np.argsort(items["item_id"].to_numpy(), kind="stable")
+    # Held in memory (not mapped) until the background rebuild is swapped in
+    text = {c: catalog_store.StringColumn.from_values(
+                np.concatenate([col.take(keep), fresh[c].fillna("").astype(str).to_numpy(dtype=object)])[order])
+            for c, col in _text.items()}
+    _install(items.iloc[order], text, _vectorizer, vectors[order], version, db_version)
+
+_swapping = False
+
+def _swap_in_background():
+    """Rebuild the shared catalog off the request path and install it once it is ready."""
+    global _swapping
+    with _load_lock:
+        if _swapping:
+            return
+        _swapping = True
+
+    def run():
+        global _swapping
+        try:
+            while True:
+                cat = catalog_store.get_catalog(wait=True)
+                # Build the vectorizer before taking the lock
+                cat.vectorizer()
+                with _load_lock:
+                    if cat.version != _catalog_version and (cat.db_version or 0) >= (_db_version or 0):
+                        _install_catalog(cat)
+                # Writes that landed during the build need another pass
+                if (cat.db_version or 0) >= db.catalog_version():
+                    break
+        except Exception:
+            incr("recommender.catalog_swap_error")
+        finally:
+            with _load_lock:
+                _swapping = False
+
+    threading.Thread(target=run, daemon=True, name="catalog-swap").start()
+
+# More single-row edits than this since the last refresh wait for the rebuild instead
+PATCH_MAX_CHANGES = 100
+
+def refresh_items() -> bool:
+    """Catch up with catalog writes; returns True if the served catalog changed.
+
+    Called on the request path, so it never rebuilds inline: a few single-row
+    item edits are patched in place, and a full rebuild (refitted TF-IDF) is
+    started in the background and swapped in when ready.
+    """
+    if _generation == 0:
+        _ensure_loaded()
+        return True
+    if _catalog_version is None:
+        return False
+    version = db.catalog_version()
+    if version == _db_version:
+        return False
+    _swap_in_background()
+    changes = db.catalog_changes(_db_version or 0)
+    patchable = (len(changes) == version - (_db_version or 0) and len(changes) <= PATCH_MAX_CHANGES
+                 and all(c["key"] is not None for c in changes))
+    if not patchable:
+        return False
+    with _load_lock:
+        if _db_version == version or _catalog_version is None:
+            return False
+        _patch_items([c["key"] for c in changes if c["table_name"] == "items"], version)
+    incr("recommender.catalog_patched")
+    return True
 
 def get_items_df() -> pd.DataFrame:
-    return _items.copy()
+    _ensure_loaded()
+    return items_at(np.arange(len(_items)))
 
+def item_column(name: str) -> np.ndarray:
+    """One text column for the whole catalog, in row order."""
+    _ensure_loaded()
+    return _text[name].to_numpy()
+
+def item_rows(item_ids) -> np.ndarray:
+    """Catalog row positions for `item_ids`; unknown ids are dropped."""
+    _ensure_loaded()
+    rows = _id_index.get_indexer(np.asarray(list(item_ids), dtype=np.int64))
+    return rows[rows >= 0]
+
+def catalog_generation() -> int:
+    return _generation
+
+def item_vector_sum(rows: np.ndarray) -> sparse.csr_matrix:
+    """Sum of the TF-IDF rows at `rows`, as a sparse 1 x n_features row."""
+    _ensure_loaded()
+    return sparse.csr_matrix(np.ones((1, len(rows)))) @ _item_vectors[rows]
+
+def items_at(rows: np.ndarray, scores: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """Item metadata for the given catalog rows (in order), with an optional score column."""
+    _ensure_loaded()
+    rows = np.asarray(rows, dtype=np.int64)
+    # Indexed by row position; text is decoded for these rows only
+    res = pd.DataFrame({"item_id": _items["item_id"].to_numpy()[rows]}, index=rows)
+    for col, values in _text.items():
+        res[col] = values.take(rows)
+    res["popularity"] = _items["popularity"].to_numpy()[rows]
+    if scores is not None:
+        res["score"] = scores
+    return res
+
+def similarity_to(item_id: int, item_ids) -> np.ndarray:
+    """Cosine similarity of `item_id` to each of `item_ids` (0 for unknown ids)."""
+    _ensure_loaded()
+    ids = np.asarray(list(item_ids), dtype=np.int64)
+    out = np.zeros(len(ids))
+    src = item_rows([item_id])
+    rows = _id_index.get_indexer(ids)
+    known = rows >= 0
+    if len(src) and known.any():
+        out[known] = (_item_vectors[rows[known]] @ _item_vectors[src[0]].T).toarray().ravel()
+    return out
+
+def _top(scores: np.ndarray, k: int, exclude: Optional[np.ndarray] = None) -> np.ndarray:
+    # argpartition then sort only the k winners
+    scores = scores.astype(float, copy=True)
+    if exclude is not None and len(exclude):
+        scores[exclude] = -np.inf
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+@timed()
 def content_similar_items(item_id: int, top_k: int = 5) -> pd.DataFrame:
-    idx = _items.index[_items["item_id"] == item_id]
-    if len(idx) == 0:
+    rows = item_rows([item_id])
+    if len(rows) == 0:
         return pd.DataFrame()
-    idx = idx[0]
+    idx = rows[0]
     sims = cosine_similarity(_item_vectors[idx], _item_vectors).flatten()
-    order = sims.argsort()[::-1]
     # Skip itself
-    order = [i for i in order if i != idx]
-    top_idx = order[:top_k]
-    res = _items.iloc[top_idx].copy()
-    res["score"] = sims[top_idx]
-    return res
+    top_idx = _top(sims, top_k, exclude=rows)
+    return items_at(top_idx, sims[top_idx])
 
-def content_based_for_user(liked_item_ids: List[int], top_k: int = 5) -> pd.DataFrame:
-    if not liked_item_ids:
-        # fallback to popularity
-        res = _items.sort_values("popularity", ascending=False).head(top_k).copy()
-        res["score"] = (res["popularity"] - res["popularity"].min()) / ((res["popularity"].max() - res["popularity"].min()) + 1e-6)
-        return res
-    sims = np.zeros(_items.shape[0])
-    for iid in liked_item_ids:
-        idx = _items.index[_items["item_id"] == iid]
-        if len(idx) == 0: 
-            continue
-        idx = idx[0]
-        s = cosine_similarity(_item_vectors[idx], _item_vectors).flatten()
-        sims = np.maximum(sims, s)  # max-pool across liked items
-    order = sims.argsort()[::-1]
+def _content_scores(liked_item_ids: List[int], top_k: int):
+    """(rows, scores) of the best unseen items by max cosine to any liked item."""
+    rows = item_rows(liked_item_ids)
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    # TF-IDF rows are L2-normalised, so one sparse product gives every cosine
+    sims = (_item_vectors[rows] @ _item_vectors.T).max(axis=0).toarray().ravel()  # max-pool across liked items
     # remove liked ones
-    kept = [i for i in order if _items.iloc[i]["item_id"] not in liked_item_ids]
-    top_idx = kept[:top_k]
-    res = _items.iloc[top_idx].copy()
-    res["score"] = sims[top_idx]
-    return res
+    top_idx = _top(sims, top_k, exclude=rows)
+    return top_idx, sims[top_idx]
 
+def _profile_scores(profile: sparse.csr_matrix, count: int, top_k: int, exclude: Optional[np.ndarray] = None):
+    """(rows, scores) by mean cosine to the liked items, given the sum of their TF-IDF rows."""
+    _ensure_loaded()
+    if count <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    # Cosine is linear in the liked vector, so the mean of cosines is one product with the sum
+    sims = (_item_vectors @ profile.T).toarray().ravel() / count
+    top_idx = _top(sims, top_k, exclude=exclude)
+    return top_idx, sims[top_idx]
 
+def _id_scores(item_ids: np.ndarray, scores: np.ndarray, top_k: int, exclude_ids=()):
+    """(rows, scores) of the best of `item_ids` that are in the catalog and not excluded."""
+    _ensure_loaded()
+    rows = _id_index.get_indexer(np.asarray(item_ids, dtype=np.int64))
+    drop = (rows < 0) | np.isin(item_ids, np.asarray(list(exclude_ids), dtype=np.int64))
+    top = _top(scores, top_k, exclude=np.flatnonzero(drop))
+    return rows[top], scores[top]
 
-def user_user_collab(rating_df: pd.DataFrame, user_id: int, top_k: int = 5) -> pd.DataFrame:
-    if rating_df is None or rating_df.empty:
-        return pd.DataFrame()
+def _popular_scores(top_k: int):
+    """(rows, min-max normalised popularity) of the most popular items."""
+    _ensure_loaded()
+    top_idx = _top(_popularity, top_k)
+    pop = _popularity[top_idx]
+    return top_idx, ((pop - pop.min()) / ((pop.max() - pop.min()) + 1e-6) if len(pop) else pop)
 
+def _popular(top_k: int) -> pd.DataFrame:
+    return items_at(*_popular_scores(top_k))
+
+@timed()
+def content_based_for_user(liked_item_ids: List[int], top_k: int = 5) -> pd.DataFrame:
+    if not liked_item_ids:
+        # fallback to popularity
+        return _popular(top_k)
+    top_idx, scores = _content_scores(liked_item_ids, top_k)
+    return items_at(top_idx, scores)
+
+def _normalize_ratings(rating_df: pd.DataFrame) -> pd.DataFrame:
     # tolerant rename
     rename_map = {}
     for c in list(rating_df.columns):
@@ -75,137 +300,193 @@ def user_user_collab(rating_df: pd.DataFrame, user_id: int, top_k: int = 5) -> p
             rename_map[c] = "rating"
     if rename_map:
         rating_df = rating_df.rename(columns=rename_map)
+    return rating_df
+
+def _collab_scores(rating_df: pd.DataFrame, user_id: int, top_k: int):
+    """(rows, scores) of the best items rated by similar users (user-user cosine CF)."""
+    _ensure_loaded()
+    empty = (np.empty(0, dtype=np.int64), np.empty(0))
+    if rating_df is None or rating_df.empty:
+        return empty
+    rating_df = _normalize_ratings(rating_df)
 
     # Require the three core columns
     if not {"user_id", "item_id", "rating"}.issubset(rating_df.columns):
-        return pd.DataFrame()
+        return empty
 
     # Force numeric types (safe conversion)
-    rating_df["user_id"] = pd.to_numeric(rating_df["user_id"], errors="coerce").fillna(0).astype(int)
-    rating_df["item_id"] = pd.to_numeric(rating_df["item_id"], errors="coerce").fillna(0).astype(int)
-    rating_df["rating"] = pd.to_numeric(rating_df["rating"], errors="coerce").fillna(0.0).astype(float)
+    rating_df = pd.DataFrame({
+        "user_id": pd.to_numeric(rating_df["user_id"], errors="coerce").fillna(0).astype(int),
+        "item_id": pd.to_numeric(rating_df["item_id"], errors="coerce").fillna(0).astype(int),
+        "rating": pd.to_numeric(rating_df["rating"], errors="coerce").fillna(0.0).astype(float),
+    })
 
     # If user not present, return empty
-    if user_id not in rating_df["user_id"].unique():
-        return pd.DataFrame()
-
-
-
+    if not (rating_df["user_id"] == user_id).any():
+        return empty
 
     # Pivot to user-item matrix
-    mat = rating_df.pivot_table(index="user_id", columns="item_id", values="rating", fill_value=0)
+    with timer("recommender.user_user_collab.pivot"):
+        mat = rating_df.pivot_table(index="user_id", columns="item_id", values="rating", fill_value=0)
     if user_id not in mat.index:
+        return empty
+
+    with timer("recommender.user_user_collab.score"):
+        # Cosine similarity between target user and others
+        A = mat.values
+        # Normalize rows
+        norms = np.linalg.norm(A, axis=1, keepdims=True) + 1e-9
+        A_norm = A / norms
+        target = A_norm[mat.index.get_loc(user_id)]
+        sims = A_norm @ target
+        # Zero self
+        sims[mat.index.get_loc(user_id)] = 0.0
+        # Weighted sum of others' ratings
+        scores = sims @ A_norm
+    # Exclude items already rated by user, and items missing from the catalog
+    rated = np.flatnonzero(mat.loc[user_id].to_numpy() > 0)
+    cols = _id_index.get_indexer(mat.columns.to_numpy())
+    rated = np.union1d(rated, np.flatnonzero(cols < 0))
+    top = _top(scores, top_k, exclude=rated)
+    return cols[top], scores[top]
+
+@timed()
+def user_user_collab(rating_df: pd.DataFrame, user_id: int, top_k: int = 5) -> pd.DataFrame:
+    top_idx, scores = _collab_scores(rating_df, user_id, top_k)
+    if len(top_idx) == 0:
         return pd.DataFrame()
-    
-    # Cosine similarity between target user and others
-    A = mat.values
-    # Normalize rows
-    norms = np.linalg.norm(A, axis=1, keepdims=True) + 1e-9
-    A_norm = A / norms
-    target = A_norm[mat.index.get_loc(user_id)]
-    sims = A_norm @ target
-    # Zero self
-    sims[mat.index.get_loc(user_id)] = 0.0
-    # Weighted sum of others' ratings
-    weights = sims.reshape(-1, 1)
-    scores = (A_norm * weights).sum(axis=0)
-    # Exclude items already rated by user
-    rated_items = set(mat.columns[mat.loc[user_id] > 0].tolist())
-    candidates = [(item_id, scores[i]) for i, item_id in enumerate(mat.columns) if item_id not in rated_items]
-    candidates.sort(key=lambda x: x[1], reverse=True)
-    top = candidates[:top_k]
-    if not top:
+    return items_at(top_idx, scores)
+
+def _mf_scores(rating_df: pd.DataFrame, user_id: int, top_k: int):
+    """(rows, scores) from the matrix-factorization model; empty if no model is trained."""
+    from . import mf
+    _ensure_loaded()
+    empty = (np.empty(0, dtype=np.int64), np.empty(0))
+    model = mf.load_model()
+    if model is None:
+        return empty
+    own = pd.DataFrame(columns=["item_id", "rating"])
+    if rating_df is not None and not rating_df.empty:
+        rating_df = _normalize_ratings(rating_df)
+        if {"user_id", "item_id", "rating"}.issubset(rating_df.columns):
+            own = rating_df.loc[rating_df["user_id"] == user_id, ["item_id", "rating"]]
+    if own.empty and not model.has_user(user_id):
+        return empty
+    vec = mf.user_vector(model, user_id, own["item_id"].tolist(), own["rating"].tolist())
+    # Over-fetch a little so items missing from the catalog can be dropped
+    ids, scores = model.recommend(vec, top_k + len(own) + 5, exclude=own.loc[own["rating"] > 0, "item_id"].tolist())
+    rows = _id_index.get_indexer(ids.astype(np.int64))
+    keep = rows >= 0
+    return rows[keep][:top_k], scores[keep][:top_k].astype(float)
+
+@timed()
+def mf_collab(rating_df: pd.DataFrame, user_id: int, top_k: int = 5) -> pd.DataFrame:
+    top_idx, scores = _mf_scores(rating_df, user_id, top_k)
+    if len(top_idx) == 0:
         return pd.DataFrame()
-    # Map to items
-    items = pd.read_csv(ITEMS_CSV)
-    df = items[items["item_id"].isin([i for i, _ in top])].copy()
-    score_map = {i:s for i,s in top}
-    df["score"] = df["item_id"].map(score_map).fillna(0.0)
-    df = df.sort_values("score", ascending=False)
-    return df
-
-def hybrid_recommendation(liked_item_ids: List[int], rating_df: pd.DataFrame, user_id: int, top_k: int = 5, alpha: float = 0.6) -> pd.DataFrame:
-    
-    # standardize column names
-    if rating_df is None:
-        rating_df = pd.DataFrame()
-
-    # Normalize rating_df columns
-    if not rating_df.empty:
-        rename_map = {}
-        for c in rating_df.columns:
-            col_lower = str(c).lower()
-            if col_lower in ("user_id", "userid", "uid", "user", "id"):
-                rename_map[c] = "user_id"
-            elif col_lower in ("item_id", "itemid", "item", "iid"):
-                rename_map[c] = "item_id"
-            elif col_lower in ("rating", "rate", "r", "score"):
-                rename_map[c] = "rating"
-        if rename_map:
-            rating_df = rating_df.rename(columns=rename_map)
-
-    # Call recommenders
-    cb = content_based_for_user(liked_item_ids, top_k=top_k * 2)
-    cf = user_user_collab(rating_df, user_id, top_k=top_k * 2)
+    return items_at(top_idx, scores)
+
+def blend(cb_rows: np.ndarray, cb_scores: np.ndarray, cf_rows: np.ndarray, cf_scores: np.ndarray,
+          top_k: int = 5, alpha: float = 0.6, method: str = "linear"):
+    """Fuse two ranked candidate lists of catalog rows; returns (rows, scores) of the top_k.
+
+    linear: alpha-weighted sum of linear rank scores (1 for first .. 0 for last)
+    score:  alpha-weighted sum of min-max normalised raw scores
+    rrf:    alpha-weighted reciprocal rank fusion, 1 / (RRF_K + rank)
+    """
+    def contrib(rows, scores):
+        n = len(rows)
+        if method == "linear":
+            return np.linspace(1, 0, n)
+        if method == "score":
+            lo, hi = (scores.min(), scores.max()) if n else (0.0, 0.0)
+            return (scores - lo) / (hi - lo) if hi > lo else np.ones(n)
+        if method == "rrf":
+            return 1.0 / (RRF_K + np.arange(1, n + 1))
+        raise ValueError(f"Unknown fusion method {method!r}; expected one of {FUSION_METHODS}")
+
+    rows = np.concatenate([cb_rows, cf_rows]).astype(np.int64)
+    weights = np.concatenate([alpha * contrib(cb_rows, cb_scores), (1 - alpha) * contrib(cf_rows, cf_scores)])
+    uniq, inv = np.unique(rows, return_inverse=True)
+    fused = np.bincount(inv, weights=weights, minlength=len(uniq))
+    top = _top(fused, top_k)
+    return uniq[top], fused[top]
 
+@timed()
+def hybrid_recommendation(liked_item_ids: List[int], rating_df: pd.DataFrame, user_id: int, top_k: int = 5,
+                          alpha: float = 0.6, method: str = "linear", cf: str = "user") -> pd.DataFrame:
+    """Content + collaborative blend; `cf` is "user" (user-user cosine) or "mf" (matrix factorization)."""
+    # Candidate lists as (catalog rows, scores)
+    with timer("recommender.hybrid_recommendation.content"):
+        # content_based_for_user falls back to popularity for users without likes
+        cb_rows, cb_scores = _content_scores(liked_item_ids, top_k * 2) if liked_item_ids else _popular_scores(top_k * 2)
+    with timer("recommender.hybrid_recommendation.collab"):
+        cf_rows, cf_scores = (_mf_scores if cf == "mf" else _collab_scores)(rating_df, user_id, top_k * 2)
+    return _hybrid(cb_rows, cb_scores, cf_rows, cf_scores, top_k, alpha, method)
+
+def _hybrid(cb_rows: np.ndarray, cb_scores: np.ndarray, cf_rows: np.ndarray, cf_scores: np.ndarray,
+            top_k: int, alpha: float = 0.6, method: str = "linear") -> pd.DataFrame:
     # Fallback to popularity
-    if (cb is None or cb.empty) and (cf is None or cf.empty):
-        df = get_items_df().sort_values("popularity", ascending=False).head(top_k).copy()
-        if not df.empty:
-            pop = df["popularity"].astype(float)
-            denom = (pop.max() - pop.min()) or 1.0
-            df["score"] = (pop - pop.min()) / (denom + 1e-9)
-        else:
-            df["score"] = 0.0
-        return df
-
-    if cb is None or cb.empty:
-        return cf.head(top_k)
-    if cf is None or cf.empty:
-        return cb.head(top_k)
-
-    # Blend
-    cb = cb.reset_index(drop=True)
-    cf = cf.reset_index(drop=True)
-    cb["cb_rank"] = np.linspace(1, 0, len(cb))
-    cf["cf_rank"] = np.linspace(1, 0, len(cf))
-
-    merged = pd.merge(cb[["item_id", "cb_rank"]],
-                      cf[["item_id", "cf_rank"]],
-                      on="item_id", how="outer")
-    merged["cb_rank"] = merged["cb_rank"].fillna(0)
-    merged["cf_rank"] = merged["cf_rank"].fillna(0)
-    merged["score"] = alpha * merged["cb_rank"] + (1 - alpha) * merged["cf_rank"]
-
-    items_df = get_items_df()
-    out = pd.merge(merged, items_df, on="item_id", how="left").drop_duplicates("item_id")
-    out = out.sort_values("score", ascending=False).head(top_k)
-
-    return out[items_df.columns.tolist() + ["score"] if not items_df.empty else ["item_id", "score"]]
-
-def context_adjust(recs: pd.DataFrame, time_of_day: str = "any", trending_weight: float = 0.2) -> pd.DataFrame:
-    if recs.empty:
-        return recs
-    recs = recs.copy()
+    if len(cb_rows) == 0 and len(cf_rows) == 0:
+        return _popular(top_k)
+    if len(cb_rows) == 0:
+        return items_at(cf_rows[:top_k], cf_scores[:top_k])
+    if len(cf_rows) == 0:
+        return items_at(cb_rows[:top_k], cb_scores[:top_k])
+
+    # Blend, then join metadata for the winners only
+    with timer("recommender.hybrid_recommendation.merge"):
+        rows, scores = blend(cb_rows, cb_scores, cf_rows, cf_scores, top_k=top_k, alpha=alpha, method=method)
+        return items_at(rows, scores)
+
+def _context_boosts(timeslots: np.ndarray, popularity: np.ndarray, time_of_day: str = "any",
+                    trending_weight: float = 0.2, trend: Optional[np.ndarray] = None,
+                    affinity: Optional[np.ndarray] = None):
+    """(time_boost, trend_boost) arrays for candidates with the given timeslots and popularity."""
     # Boost if timeslot matches
-    recs["time_boost"] = (recs["timeslot"].fillna("any").str.lower().eq(time_of_day.lower())).astype(float) * 0.1
+    time_boost = (np.char.lower(timeslots.astype(str)) == time_of_day.lower()).astype(float) * 0.1
+    if affinity is not None:
+        time_boost = time_boost + 0.1 * affinity
+    pop = np.asarray(popularity, dtype=float)
+    if trend is not None and trend.any():
+        pop = trend
     # Normalize popularity
-    pop = recs["popularity"].astype(float)
     pop_norm = (pop - pop.min()) / (pop.max() - pop.min() + 1e-9)
-    recs["trend_boost"] = trending_weight * pop_norm
+    return time_boost, trending_weight * pop_norm
+
+@timed()
+def context_adjust(recs: pd.DataFrame, time_of_day: str = "any", trending_weight: float = 0.2,
+                   popularity: Optional[np.ndarray] = None, trending=None) -> pd.DataFrame:
+    """Re-rank by timeslot and popularity.
+
+    `popularity` overrides the catalog column (aligned with recs). With a
+    `trending` engine (utils.trending), decayed activity replaces popularity
+    whenever any candidate has some, and the items' observed time-of-day
+    affinity adds to the timeslot boost.
+    """
+    if recs.empty:
+        return recs
+    recs = recs.copy()
+    pop = recs["popularity"].to_numpy(dtype=float) if popularity is None else popularity
+    trend = affinity = None
+    if trending is not None:
+        trend, affinity = trending.lookup(recs["item_id"].to_numpy(), time_of_day)
+    recs["time_boost"], recs["trend_boost"] = _context_boosts(
+        recs["timeslot"].fillna("any").to_numpy(), pop, time_of_day, trending_weight, trend, affinity)
     recs["score_adj"] = recs.get("score", 0.5) + recs["time_boost"] + recs["trend_boost"]
     recs = recs.sort_values("score_adj", ascending=False)
     return recs
 
+@timed()
 def simple_search(query: str, top_k: int = 10) -> pd.DataFrame:
+    _ensure_loaded()
     q = query.strip().lower()
-    items = get_items_df()
-    mask = items["title"].str.lower().str.contains(q) | items["tags"].str.lower().str.contains(q) | items["description"].str.lower().str.contains(q)
-    df = items[mask].copy()
-    if df.empty:
-        return df
-    vecs = _vectorizer.transform(df["title"].fillna("") + " " + df["tags"].fillna("") + " " + df["description"].fillna(""))
+    mask = _text["title"].contains(q) | _text["tags"].contains(q) | _text["description"].contains(q)
+    rows = np.flatnonzero(mask)
+    if len(rows) == 0 or _item_vectors.shape[1] == 0:
+        return items_at(rows[:top_k])
+    # Matched rows already have their TF-IDF vectors; only the query needs transforming
     qvec = _vectorizer.transform([q])
-    sims = cosine_similarity(qvec, vecs).flatten()
-    df["score"] = sims
-    return df.sort_values("score", ascending=False).head(top_k)
+    sims = cosine_similarity(qvec, _item_vectors[rows]).flatten()
+    top = _top(sims, top_k)
+    return items_at(rows[top], sims[top])
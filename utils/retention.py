@@ -0,0 +1,233 @@
+"""Retention for the activities table.
+
+Raw activities older than the retention window are compacted in bounded
+chunks. Each chunk is one short write transaction that
+
+- adds its per-day (item, type) counts to activity_rollups,
+- optionally copies the raw rows into a per-month archive database
+  (data/archive/activities-YYYY-MM.db), attached only while that month is
+  being moved,
+- deletes the rows from the hot table.
+
+Other writers get the lock between chunks, so compaction can run while
+the app is live. Freed pages are then returned with incremental vacuum.
+Old archive months are separate files, so dropping one (drop_partition) is
+a file delete rather than a DELETE + VACUUM on the live database.
+
+    python -m utils.retention --days 90 --mode both
+    python -m utils.retention --list
+    python -m utils.retention --drop 2024-01
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import db
+from .metrics import timed
+
+RETENTION_DAYS = float(os.environ.get("HEALTHREC_ACTIVITY_RETENTION_DAYS", "90"))
+BATCH_SIZE = 2000
+# Minimum pause between chunks; each pause is at least as long as the chunk held
+# the write lock, so other writers' busy handlers get a real window
+PAUSE_SECONDS = 0.01
+MODES = ("rollup", "archive", "both")
+_MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+
+def archive_dir() -> Path:
+    return Path(db.DB_PATH).parent / "archive"
+
+
+def partition_path(month: str) -> Path:
+    if not _MONTH.match(month):
+        raise ValueError(f"month must look like YYYY-MM, got {month!r}")
+    return archive_dir() / f"activities-{month}.db"
+
+
+def cutoff_for(days: float, now: Optional[datetime] = None) -> str:
+    """activities.timestamp value (UTC, SQLite format) `days` before now."""
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _next_month(month: str) -> str:
+    y, m = map(int, month.split("-"))
+    return f"{y + m // 12:04d}-{m % 12 + 1:02d}"
+
+
+def _compact_range(conn: sqlite3.Connection, lo: str, hi: str, archive: bool, rollup: bool,
+                   batch_size: int, pause: float) -> int:
+    """Move activities with lo <= timestamp < hi, one chunk per transaction; returns rows removed."""
+    moved = 0
+    while True:
+        t0 = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM temp.compact_ids")
+            conn.execute("INSERT INTO temp.compact_ids SELECT id FROM activities "
+                         "WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp LIMIT ?", (lo, hi, batch_size))
+            n = conn.execute("SELECT COUNT(*) FROM temp.compact_ids").fetchone()[0]
+            if n == 0:
+                conn.execute("COMMIT")
+                return moved
+            if rollup:
+                conn.execute("""
+                    INSERT INTO activity_rollups(day, item_id, type, n)
+                    SELECT date(timestamp), COALESCE(item_id, 0), COALESCE(type, ''), COUNT(*)
+                    FROM activities WHERE id IN (SELECT id FROM temp.compact_ids)
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT(day, item_id, type) DO UPDATE SET n = n + excluded.n
+                """)
+            if archive:
+                conn.execute("INSERT OR IGNORE INTO arch.activities SELECT * FROM main.activities "
+                             "WHERE id IN (SELECT id FROM temp.compact_ids)")
+            conn.execute("DELETE FROM activities WHERE id IN (SELECT id FROM temp.compact_ids)")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        moved += n
+        if pause:
+            time.sleep(max(pause, time.perf_counter() - t0))
+
+
+@timed()
+def compact(days: float = RETENTION_DAYS, mode: str = "rollup", batch_size: int = BATCH_SIZE,
+            pause: float = PAUSE_SECONDS, vacuum: bool = True) -> Dict:
+    """Compact activities older than `days`; returns counts per month and pages vacuumed."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}; expected one of {MODES}")
+    cutoff = cutoff_for(days)
+    rollup, archive = mode in ("rollup", "both"), mode in ("archive", "both")
+    conn = db.get_conn()
+    # Explicit BEGIN/COMMIT per chunk
+    conn.isolation_level = None
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS compact_ids(id INTEGER PRIMARY KEY)")
+        months = [r[0] for r in conn.execute(
+            "SELECT DISTINCT substr(timestamp, 1, 7) FROM activities WHERE timestamp < ? ORDER BY 1", (cutoff,))]
+        moved = {}
+        for month in months:
+            lo, hi = f"{month}-01 00:00:00", min(f"{_next_month(month)}-01 00:00:00", cutoff)
+            if archive:
+                path = partition_path(month)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                conn.execute("ATTACH DATABASE ? AS arch", (str(path),))
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS arch.activities(
+                        id INTEGER PRIMARY KEY, user_id INTEGER, type TEXT, item_id INTEGER,
+                        timestamp DATETIME, meta TEXT)
+                """)
+            try:
+                moved[month] = _compact_range(conn, lo, hi, archive, rollup, batch_size, pause)
+            finally:
+                if archive:
+                    conn.execute("DETACH DATABASE arch")
+        pages = incremental_vacuum(conn=conn) if vacuum else 0
+    finally:
+        conn.close()
+    return {"cutoff": cutoff, "mode": mode, "moved": moved, "total": sum(moved.values()), "vacuumed_pages": pages}
+
+
+def incremental_vacuum(pages: Optional[int] = None, conn: Optional[sqlite3.Connection] = None) -> int:
+    """Return up to `pages` free pages (all by default) to the OS; 0 unless auto_vacuum is INCREMENTAL."""
+    with db._use_conn(conn) as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # execute() steps the pragma once (one page); executescript runs it to completion
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages) if pages else 0});")
+        return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def enable_incremental_vacuum() -> bool:
+    """Switch an existing database to auto_vacuum=INCREMENTAL (a one-off full VACUUM)."""
+    conn = db.get_conn()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+
+# -------------------------
+# Archive partitions
+# -------------------------
+def list_partitions() -> List[Dict]:
+    out = []
+    for path in sorted(archive_dir().glob("activities-*.db")):
+        month = path.stem.split("-", 1)[1]
+        out.append({"month": month, "path": str(path), "bytes": path.stat().st_size})
+    return out
+
+
+def read_partition(month: str, limit: Optional[int] = None) -> List[sqlite3.Row]:
+    path = partition_path(month)
+    if not path.exists():
+        return []
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        sql = "SELECT * FROM activities ORDER BY id" + (" LIMIT ?" if limit else "")
+        return conn.execute(sql, (limit,) if limit else ()).fetchall()
+    finally:
+        conn.close()
+
+
+def drop_partition(month: str) -> bool:
+    """Delete an archived month; the hot database is not touched."""
+    path = partition_path(month)
+    if not path.exists():
+        return False
+    path.unlink()
+    return True
+
+
+def rollups(since: Optional[str] = None, item_ids: Optional[List[int]] = None) -> List[sqlite3.Row]:
+    """Per-day counts of compacted activities, optionally from `since` (YYYY-MM-DD) / for `item_ids`."""
+    sql, args = "SELECT day, item_id, type, n FROM activity_rollups WHERE day >= ?", [since or ""]
+    if item_ids:
+        sql += f" AND item_id IN ({','.join('?' * len(item_ids))})"
+        args += [int(i) for i in item_ids]
+    with db._use_conn() as conn:
+        return conn.execute(sql + " ORDER BY day, item_id, type", args).fetchall()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compact old activities into rollups and/or monthly archives")
+    ap.add_argument("--days", type=float, default=RETENTION_DAYS, help="keep raw activities this many days")
+    ap.add_argument("--mode", choices=MODES, default="rollup")
+    ap.add_argument("--batch", type=int, default=BATCH_SIZE)
+    ap.add_argument("--pause", type=float, default=PAUSE_SECONDS)
+    ap.add_argument("--no-vacuum", action="store_true")
+    ap.add_argument("--enable-incremental-vacuum", action="store_true",
+                    help="one-off VACUUM switching an existing database to incremental vacuum")
+    ap.add_argument("--list", action="store_true", help="list archive partitions and exit")
+    ap.add_argument("--drop", metavar="YYYY-MM", help="delete an archived month and exit")
+    ap.add_argument("--db", type=Path, default=None)
+    args = ap.parse_args()
+    if args.db is not None:
+        db.DB_PATH = args.db
+    if args.list:
+        print(json.dumps(list_partitions(), indent=2))
+        return
+    if args.drop:
+        print(json.dumps({"month": args.drop, "dropped": drop_partition(args.drop)}))
+        return
+    db.init_db()
+    if args.enable_incremental_vacuum:
+        print(json.dumps({"incremental_vacuum_enabled": enable_incremental_vacuum()}))
+    print(json.dumps(compact(args.days, args.mode, args.batch, args.pause, vacuum=not args.no_vacuum), indent=2))
+
+
+if __name__ == "__main__":
+    main()
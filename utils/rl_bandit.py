@@ -1,8 +1,9 @@
 from dataclasses import dataclass
 import random
 from .db import bandit_update
+from .metrics import incr, timed
 
-ALGORITHMS = ["content", "collab", "hybrid", "graph"]
+ALGORITHMS = ["content", "collab", "hybrid", "graph", "mf"]
 
 @dataclass
 class EpsilonGreedy:
@@ -10,9 +11,14 @@ class EpsilonGreedy:
 
     def choose(self) -> str:
         if random.random() < self.epsilon:
-            return random.choice(ALGORITHMS)
-        # Exploit: simple heuristic order
-        return "hybrid"
+            algo = random.choice(ALGORITHMS)
+        else:
+            # Exploit: simple heuristic order
+            algo = "hybrid"
+        incr(f"bandit.choose.{algo}")
+        return algo
 
-    def update(self, algorithm: str, clicked: bool):
-        bandit_update(algorithm, clicked)
+    @timed("rl_bandit.update")
+    def update(self, algorithm: str, clicked: bool, conn=None):
+        incr(f"bandit.{'win' if clicked else 'loss'}.{algorithm}")
+        bandit_update(algorithm, clicked, conn=conn)
@@ -0,0 +1,287 @@
+"""Headless recommendation service.
+
+`RecommendationService` wraps utils.recommender, utils.graph_rec and
+utils.rl_bandit behind plain methods that return JSON-friendly data, so
+recommendations can be served without rendering a Streamlit page. Every
+method has an `a`-prefixed coroutine twin that runs on the service's
+thread pool, and `make_asgi_app()` exposes the same endpoints over ASGI
+with no extra dependencies:
+
+    uvicorn utils.service:app
+"""
+import asyncio
+import inspect
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import recommender as rec
+from .db import ConnectionPool, init_db, rate_item, log_activity
+from .graph_rec import graph_recommend, build_graph
+from .metrics import timed, incr
+from .pipeline import Pipeline, user_condition
+from .rl_bandit import ALGORITHMS, EpsilonGreedy
+
+_OUT_COLS = ["item_id", "title", "tags", "description", "condition", "timeslot", "popularity"]
+
+
+class ValidationError(ValueError):
+    """Bad client input; the ASGI app answers it with a 400 (any other error is a 500)."""
+
+
+def _int(name: str, value, minimum: Optional[int] = None) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, np.integer)):
+        raise ValidationError(f"{name} must be an integer")
+    if minimum is not None and value < minimum:
+        raise ValidationError(f"{name} must be >= {minimum}")
+    return int(value)
+
+
+def _algorithm(algorithm: Optional[str]) -> Optional[str]:
+    if algorithm is not None and algorithm not in ALGORITHMS:
+        raise ValidationError(f"Unknown algorithm {algorithm!r}; expected one of {ALGORITHMS}")
+    return algorithm
+
+
+def _records(df: Optional[pd.DataFrame], score_col: str = "score") -> List[Dict]:
+    if df is None or df.empty:
+        return []
+    cols = [c for c in _OUT_COLS if c in df.columns]
+    out = df[cols].copy()
+    if score_col in df.columns:
+        out["score"] = df[score_col].astype(float)
+    out = out.replace({np.nan: None})
+    return [{k: (v.item() if isinstance(v, np.generic) else v) for k, v in r.items()}
+            for r in out.to_dict("records")]
+
+
+class RecommendationService:
+    def __init__(self, max_workers: int = 8, db_pool_size: int = 4, epsilon: float = 0.2):
+        # Headless processes never run the Streamlit pages, which otherwise create the schema
+        init_db()
+        self.pool = ConnectionPool(size=db_pool_size)
+        self.bandit = EpsilonGreedy(epsilon=epsilon)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recsvc")
+        # Batch members fan out here; a separate pool so a batch never waits on its own worker
+        self._batch_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recsvc-batch")
+        self.pipeline = Pipeline(max_workers=max_workers)
+        # Warm the shared models: TF-IDF is fitted at import, the graph on first build
+        build_graph()
+
+    # -------------------------
+    # Data access
+    # -------------------------
+    @staticmethod
+    def _liked(ratings: pd.DataFrame, user_id: int) -> List[int]:
+        if ratings.empty:
+            return []
+        mask = (ratings["user_id"] == user_id) & (ratings["rating"] > 0)
+        return ratings.loc[mask, "item_id"].astype(int).tolist()
+
+    # -------------------------
+    # Core
+    # -------------------------
+    @timed("service.recommend_frame")
+    def recommend_frame(self, user_id: int, algorithm: Optional[str] = None, top_k: int = 5,
+                        time_of_day: str = "any", ratings: Optional[pd.DataFrame] = None
+                        ) -> Tuple[str, pd.DataFrame, pd.DataFrame]:
+        """Return (algorithm, context-adjusted items, graph medicines) for one user.
+
+        Served by the two-stage utils.pipeline unless an explicit `ratings`
+        frame is given, in which case each arm is computed from that frame.
+        """
+        rec.refresh_items()
+        return self._frame(user_id, algorithm, top_k, time_of_day, ratings)
+
+    def _frame(self, user_id: int, algorithm: Optional[str], top_k: int, time_of_day: str,
+               ratings: Optional[pd.DataFrame] = None) -> Tuple[str, pd.DataFrame, pd.DataFrame]:
+        user_id, top_k = _int("user_id", user_id), _int("top_k", top_k, minimum=1)
+        algo = _algorithm(algorithm) or self.bandit.choose()
+        meds = pd.DataFrame()
+        if ratings is None:
+            # Incrementally maintained state: no per-request ratings read or matrix build
+            res = self.pipeline.run(user_id, algo, top_k=top_k, time_of_day=time_of_day)
+            return algo, res.items, res.medicines
+        liked = self._liked(ratings, user_id)
+        if algo == "content":
+            recs = rec.content_based_for_user(liked, top_k=top_k)
+        elif algo == "collab":
+            recs = rec.user_user_collab(ratings, user_id=user_id, top_k=top_k)
+        elif algo == "mf":
+            recs = rec.mf_collab(ratings, user_id=user_id, top_k=top_k)
+            if recs.empty:
+                # No trained model yet (or nothing to fold in): memory-based CF instead
+                recs = rec.user_user_collab(ratings, user_id=user_id, top_k=top_k)
+        elif algo == "graph":
+            recs, meds = graph_recommend(user_condition(liked), top_k=top_k)
+        else:
+            recs = rec.hybrid_recommendation(liked, ratings, user_id=user_id, top_k=top_k, alpha=0.6)
+        recs = rec.context_adjust(recs, time_of_day=time_of_day)
+        return algo, recs, meds
+
+    def recommend(self, user_id: int, algorithm: Optional[str] = None, top_k: int = 5,
+                  time_of_day: str = "any") -> Dict:
+        algo, recs, meds = self.recommend_frame(user_id, algorithm, top_k, time_of_day)
+        return {"user_id": user_id, "algorithm": algo,
+                "items": _records(recs, "score_adj"), "medicines": _records(meds)}
+
+    @timed("service.recommend_batch")
+    def recommend_batch(self, user_ids: List[int], algorithm: Optional[str] = None, top_k: int = 5,
+                        time_of_day: str = "any") -> List[Dict]:
+        """recommend() for each of `user_ids`, run concurrently after one shared catalog refresh."""
+        if not isinstance(user_ids, list):
+            raise ValidationError("user_ids must be a list of integers")
+        user_ids = [_int("user_ids[]", u) for u in user_ids]
+        _algorithm(algorithm)
+        rec.refresh_items()
+
+        def one(uid: int) -> Dict:
+            algo, recs, meds = self._frame(uid, algorithm, top_k, time_of_day)
+            return {"user_id": uid, "algorithm": algo,
+                    "items": _records(recs, "score_adj"), "medicines": _records(meds)}
+        return list(self._batch_executor.map(one, user_ids))
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict]:
+        if not isinstance(query, str):
+            raise ValidationError("query must be a string")
+        top_k = _int("top_k", top_k, minimum=1)
+        return _records(rec.simple_search(query, top_k=top_k))
+
+    def similar_items(self, item_id: int, top_k: int = 5) -> List[Dict]:
+        item_id, top_k = _int("item_id", item_id), _int("top_k", top_k, minimum=1)
+        return _records(rec.content_similar_items(item_id, top_k=top_k))
+
+    def graph_recommend(self, condition: str, top_k: int = 5) -> Dict:
+        if not isinstance(condition, str):
+            raise ValidationError("condition must be a string")
+        top_k = _int("top_k", top_k, minimum=1)
+        items, meds = graph_recommend(condition, top_k=top_k)
+        return {"condition": condition, "items": _records(items), "medicines": _records(meds)}
+
+    def feedback(self, user_id: int, item_id: int, action: str, algorithm: Optional[str] = None) -> Dict:
+        """Record a like / skip / view, crediting `algorithm` in the bandit if given."""
+        user_id, item_id = _int("user_id", user_id), _int("item_id", item_id)
+        if action not in ("like", "skip", "view"):
+            raise ValidationError("action must be one of 'like', 'skip', 'view'")
+        # Only real arms are credited, so clients can't add rows to the bandit table
+        _algorithm(algorithm)
+        with self.pool.connection() as conn:
+            if action in ("like", "skip"):
+                rate_item(user_id, item_id, 1 if action == "like" else -1, conn=conn)
+                if algorithm:
+                    self.bandit.update(algorithm, action == "like", conn=conn)
+            log_activity(user_id, action, item_id, conn=conn)
+        return {"ok": True}
+
+    # -------------------------
+    # Async wrappers
+    # -------------------------
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def arecommend(self, *args, **kwargs):
+        return await self._run(self.recommend, *args, **kwargs)
+
+    async def arecommend_batch(self, *args, **kwargs):
+        return await self._run(self.recommend_batch, *args, **kwargs)
+
+    async def asearch(self, *args, **kwargs):
+        return await self._run(self.search, *args, **kwargs)
+
+    async def asimilar_items(self, *args, **kwargs):
+        return await self._run(self.similar_items, *args, **kwargs)
+
+    async def agraph_recommend(self, *args, **kwargs):
+        return await self._run(self.graph_recommend, *args, **kwargs)
+
+    async def afeedback(self, *args, **kwargs):
+        return await self._run(self.feedback, *args, **kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._batch_executor.shutdown(wait=False)
+        self.pipeline.close()
+        self.pool.close()
+
+
+_service: Optional[RecommendationService] = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> RecommendationService:
+    """Process-wide shared service instance."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RecommendationService()
+        return _service
+
+
+# -------------------------
+# ASGI
+# -------------------------
+_ROUTES = {
+    "/recommend": ("arecommend", ("user_id", "algorithm", "top_k", "time_of_day")),
+    "/recommend/batch": ("arecommend_batch", ("user_ids", "algorithm", "top_k", "time_of_day")),
+    "/search": ("asearch", ("query", "top_k")),
+    "/similar": ("asimilar_items", ("item_id", "top_k")),
+    "/graph": ("agraph_recommend", ("condition", "top_k")),
+    "/feedback": ("afeedback", ("user_id", "item_id", "action", "algorithm")),
+}
+
+
+def make_asgi_app(service: Optional[RecommendationService] = None):
+    """Minimal ASGI app: POST a JSON object of keyword arguments to one of _ROUTES."""
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            msg = await receive()
+            body += msg.get("body", b"")
+            if not msg.get("more_body"):
+                break
+        status, payload = 200, None
+        route = _ROUTES.get(scope["path"])
+        if route is None:
+            status, payload = 404, {"error": "not found"}
+        elif scope["method"] != "POST":
+            status, payload = 405, {"error": "use POST"}
+        else:
+            method, allowed = route
+            try:
+                try:
+                    args = json.loads(body or b"{}")
+                except ValueError:
+                    raise ValidationError("request body is not valid JSON")
+                if not isinstance(args, dict):
+                    raise ValidationError("request body must be a JSON object")
+                kwargs = {k: v for k, v in args.items() if k in allowed}
+                svc = service or get_service()
+                try:
+                    # Missing / unexpected arguments are the client's error, raised before running
+                    inspect.signature(getattr(svc, method[1:])).bind(**kwargs)
+                except TypeError as e:
+                    raise ValidationError(str(e))
+                payload = await getattr(svc, method)(**kwargs)
+            except ValidationError as e:
+                status, payload = 400, {"error": str(e)}
+            except Exception:
+                # Always answer with JSON; details stay server-side
+                incr(f"service.error.{method}")
+                status, payload = 500, {"error": "internal server error"}
+        data = json.dumps(payload).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": data})
+
+    return app
+
+
+app = make_asgi_app()
@@ -0,0 +1,30 @@
+from typing import Optional, Dict, Iterable
+import streamlit as st
+from .auth import decode_jwt
+
+def logout():
+    for k in ["token", "user"]:
+        st.session_state.pop(k, None)
+
+def current_user(roles: Optional[Iterable[str]] = None) -> Optional[Dict]:
+    """Return the logged-in user from the session token, or None.
+
+    The token is re-checked on every rerun (cheap thanks to the verified-token
+    cache), so expired tokens and rotated keys log the user out.
+    """
+    claims = decode_jwt(st.session_state.get("token"))
+    if not claims:
+        logout()
+        return None
+    user = {"id": int(claims["sub"]), "email": claims.get("email"), "role": claims.get("role")}
+    st.session_state["user"] = user
+    if roles is not None and user["role"] not in roles:
+        return None
+    return user
+
+def require_user(roles: Optional[Iterable[str]] = None, message: str = "Please login first (left sidebar → Login / Signup).") -> Dict:
+    user = current_user(roles)
+    if not user:
+        st.warning(message)
+        st.stop()
+    return user
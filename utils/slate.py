@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from typing import MutableMapping, Optional
+import time
+import pandas as pd
+from . import recommender as rec
+from .metrics import incr
+
+# Candidates kept per slate; removals backfill from here instead of recomputing
+POOL_FACTOR = 3
+# Score bump for items similar to one the user just liked
+LIKE_SIMILARITY_BOOST = 0.3
+
+@dataclass
+class Slate:
+    """A user's current recommendations, kept in session state across reruns."""
+    user_id: int
+    algorithm: str
+    time_of_day: str
+    top_k: int
+    candidates: pd.DataFrame
+    medicines: pd.DataFrame = field(default_factory=pd.DataFrame)
+    catalog_version: Optional[str] = None
+    version: int = 1
+    created_at: float = field(default_factory=time.time)
+    # Candidates the service returned; can be fewer than top_k for a small catalog
+    pool_size: int = 0
+
+    @property
+    def items(self) -> pd.DataFrame:
+        return self.candidates.head(self.top_k)
+
+    @property
+    def exhausted(self) -> bool:
+        """Nothing left to show, or feedback used up the pool so a full slate can no longer be filled.
+
+        An empty slate always counts, so one built before the user had any
+        candidates is retried on the next rerun instead of sticking.
+        """
+        left = len(self.candidates)
+        return left == 0 or left < self.top_k <= self.pool_size
+
+def _key(user_id: int) -> str:
+    return f"slate:{user_id}"
+
+def get_slate(state: MutableMapping, service, user_id: int, time_of_day: str = "any",
+              top_k: int = 5, refresh: bool = False) -> Slate:
+    """Return the session's slate, computing a new one only when needed.
+
+    A new slate is built on first use, when the context or catalog changed, when
+    the slate is empty or feedback has used up the candidate pool, or when
+    `refresh` is set.
+    """
+    old: Optional[Slate] = state.get(_key(user_id))
+    if (not refresh and old is not None and old.time_of_day == time_of_day and old.top_k == top_k
+            and old.catalog_version == rec._catalog_version and not old.exhausted):
+        incr("slate.reused")
+        return old
+    algo, recs, meds = service.recommend_frame(user_id, top_k=top_k * POOL_FACTOR, time_of_day=time_of_day)
+    if not recs.empty and "score_adj" not in recs.columns:
+        recs = recs.assign(score_adj=recs.get("score", 0.5))
+    slate = Slate(user_id=user_id, algorithm=algo, time_of_day=time_of_day, top_k=top_k,
+                  candidates=recs.reset_index(drop=True), medicines=meds,
+                  catalog_version=rec._catalog_version, version=(old.version + 1) if old else 1,
+                  pool_size=len(recs))
+    state[_key(user_id)] = slate
+    incr("slate.computed")
+    return slate
+
+def apply_feedback(slate: Slate, item_id: int, action: str) -> Slate:
+    """Update the slate in place for a like / skip / view, without recomputing it.
+
+    Like and skip remove the item (it is now rated). A like also lifts the
+    remaining candidates by their similarity to the liked item and re-sorts.
+    """
+    cands = slate.candidates
+    if action in ("like", "skip"):
+        cands = cands[cands["item_id"] != item_id]
+    if action == "like" and not cands.empty:
+        sims = rec.similarity_to(item_id, cands["item_id"])
+        cands = cands.assign(score_adj=cands["score_adj"] + LIKE_SIMILARITY_BOOST * sims)
+        cands = cands.sort_values("score_adj", ascending=False, kind="stable")
+    if action in ("like", "skip"):
+        slate.candidates = cands.reset_index(drop=True)
+        slate.version += 1
+    return slate
@@ -0,0 +1,256 @@
+"""Time-decayed trending counts over the activities table.
+
+Every view / like / skip adds to an exponentially decayed counter for its
+item and for the time of day it happened in (morning, afternoon, evening,
+night). Counters live in one float array of shape (items, actions, slots),
+stored relative to a reference time so that decaying everything is a
+single scalar at read time. update() folds in activities by id since the
+last call, and the arrays are checkpointed to SQLite (from a background
+thread, off the request path) so a restart resumes from the checkpoint
+instead of rescanning the table.
+
+context_adjust reads two numbers per candidate via lookup(): the global
+trend (weighted decayed engagement) and the item's affinity for the
+requested time of day.
+"""
+import io
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .db import activities_after, load_trending_checkpoint, save_trending_checkpoint
+from .metrics import timed, incr
+
+HALF_LIFE_HOURS = float(os.environ.get("HEALTHREC_TRENDING_HALF_LIFE_HOURS", "72"))
+ACTIONS = ("view", "like", "skip")
+ACTION_WEIGHTS = np.array([1.0, 3.0, -2.0])
+SLOTS = ("morning", "afternoon", "evening", "night")
+# Checkpoint after this many new activities or seconds, whichever comes first
+CHECKPOINT_EVERY = 500
+CHECKPOINT_SECONDS = 60.0
+# Rebase the stored counts before exp() of the offset can overflow float32
+_MAX_EXPONENT = 60.0
+
+
+def slot_of(hour: int) -> int:
+    if 5 <= hour < 12:
+        return 0
+    if 12 <= hour < 17:
+        return 1
+    if 17 <= hour < 22:
+        return 2
+    return 3
+
+
+def _parse_ts(ts) -> float:
+    # activities.timestamp is SQLite's CURRENT_TIMESTAMP, i.e. UTC
+    try:
+        dt = datetime.fromisoformat(str(ts))
+    except ValueError:
+        return time.time()
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class TrendingEngine:
+    def __init__(self, half_life_hours: float = HALF_LIFE_HOURS):
+        self.half_life_hours = half_life_hours
+        self._rate = math.log(2) / (half_life_hours * 3600.0)
+        self._lock = threading.Lock()
+        # One updater at a time; reads only wait on _lock while a batch is folded in
+        self._update_lock = threading.Lock()
+        self._index: Dict[int, int] = {}   # item_id -> row in _counts
+        self._item_ids = np.empty(0, dtype=np.int64)
+        self._counts = np.zeros((0, len(ACTIONS), len(SLOTS)), dtype=np.float32)
+        self._ref = time.time()
+        self.last_activity_id = 0
+        self._pending = 0
+        self._checkpointed_at = time.monotonic()
+        self._checkpointing = False
+
+    # -------------------------
+    # Updates
+    # -------------------------
+    def _row(self, item_id: int) -> int:
+        row = self._index.get(item_id)
+        if row is None:
+            row = self._index[item_id] = len(self._index)
+            if row >= len(self._counts):
+                # Grow by doubling so inserts stay amortised O(1)
+                cap = max(64, 2 * len(self._counts))
+                counts = np.zeros((cap,) + self._counts.shape[1:], dtype=np.float32)
+                counts[:len(self._counts)] = self._counts
+                ids = np.zeros(cap, dtype=np.int64)
+                ids[:len(self._item_ids)] = self._item_ids
+                self._counts, self._item_ids = counts, ids
+            self._item_ids[row] = item_id
+        return row
+
+    def _rebase(self, t: float):
+        self._counts *= np.float32(math.exp(-self._rate * (t - self._ref)))
+        self._ref = t
+
+    def _add(self, item_id: int, action: int, ts: float, weight: float = 1.0):
+        exponent = self._rate * (ts - self._ref)
+        if exponent > _MAX_EXPONENT:
+            self._rebase(ts)
+            exponent = 0.0
+        row = self._row(int(item_id))  # may grow (replace) _counts
+        self._counts[row, action, slot_of(datetime.fromtimestamp(ts, timezone.utc).hour)] += weight * math.exp(exponent)
+
+    @timed("trending.update")
+    def update(self, batch: int = 10_000) -> int:
+        """Fold in activities logged since the last update; returns how many were read."""
+        n = 0
+        with self._update_lock:
+            while True:
+                rows = activities_after(self.last_activity_id, limit=batch)
+                with self._lock:
+                    for r in rows:
+                        self._add(r["item_id"], ACTIONS.index(r["type"]), _parse_ts(r["timestamp"]))
+                    if rows:
+                        self.last_activity_id = rows[-1]["id"]
+                    self._pending += len(rows)
+                n += len(rows)
+                if len(rows) < batch:
+                    break
+        with self._lock:
+            due = self._pending >= CHECKPOINT_EVERY or (
+                self._pending and time.monotonic() - self._checkpointed_at >= CHECKPOINT_SECONDS)
+        if due:
+            self.checkpoint_async()
+        if n:
+            incr("trending.activities", n)
+        return n
+
+    # -------------------------
+    # Checkpoints
+    # -------------------------
+    def _snapshot(self) -> tuple:
+        # Caller holds the lock; copies so the arrays can be serialised without it
+        n = len(self._index)
+        self._pending = 0
+        self._checkpointed_at = time.monotonic()
+        return self.last_activity_id, self._ref, self._item_ids[:n].copy(), self._counts[:n].copy()
+
+    def _save(self, snapshot: tuple):
+        last_activity_id, ref, item_ids, counts = snapshot
+        buf = io.BytesIO()
+        np.savez(buf, item_ids=item_ids, counts=counts)
+        save_trending_checkpoint(last_activity_id, ref, self.half_life_hours, buf.getvalue())
+
+    def checkpoint(self):
+        with self._lock:
+            snapshot = self._snapshot()
+        self._save(snapshot)
+
+    def checkpoint_async(self) -> bool:
+        """Checkpoint from a background thread; False if one is already running."""
+        with self._lock:
+            if self._checkpointing:
+                return False
+            self._checkpointing = True
+            snapshot = self._snapshot()
+
+        def run():
+            try:
+                self._save(snapshot)
+            except Exception:
+                incr("trending.checkpoint_error")
+                with self._lock:
+                    # Retried once CHECKPOINT_SECONDS have passed
+                    self._pending += 1
+            finally:
+                with self._lock:
+                    self._checkpointing = False
+
+        threading.Thread(target=run, daemon=True, name="trending-checkpoint").start()
+        return True
+
+    def restore(self) -> bool:
+        """Load the saved checkpoint; False if there is none or it used another half-life."""
+        row = load_trending_checkpoint()
+        if row is None or row["half_life_hours"] != self.half_life_hours:
+            return False
+        with np.load(io.BytesIO(row["state"])) as z:
+            item_ids, counts = z["item_ids"], z["counts"]
+        with self._lock:
+            self._item_ids, self._counts = item_ids.astype(np.int64), counts.astype(np.float32)
+            self._index = {int(i): r for r, i in enumerate(self._item_ids)}
+            self._ref = row["ref_time"]
+            self.last_activity_id = row["last_activity_id"]
+        return True
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def lookup(self, item_ids, time_of_day: str = "any", now: Optional[float] = None
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """(trend, time-of-day affinity) for each of `item_ids`; zeros for items never seen.
+
+        trend is the decayed, action-weighted engagement; affinity is the smoothed
+        share of the item's views and likes that fall in `time_of_day` (0 for "any").
+        """
+        ids = np.asarray(list(item_ids), dtype=np.int64)
+        trend, affinity = np.zeros(len(ids)), np.zeros(len(ids))
+        with self._lock:
+            rows = np.array([self._index.get(int(i), -1) for i in ids], dtype=np.int64)
+            known = rows >= 0
+            if not known.any():
+                return trend, affinity
+            decay = math.exp(-self._rate * ((now or time.time()) - self._ref))
+            c = self._counts[rows[known]].astype(float) * decay
+        trend[known] = np.einsum("a,nas->n", ACTION_WEIGHTS, c)
+        tod = time_of_day.lower()
+        if tod in SLOTS:
+            engaged = c[:, 0, :] + c[:, 1, :]
+            # +1 prior spread evenly over slots keeps one-off events from reading as 100%
+            affinity[known] = (engaged[:, SLOTS.index(tod)] + 1.0 / len(SLOTS)) / (engaged.sum(axis=1) + 1.0)
+        return trend, affinity
+
+    def top(self, k: int = 10, now: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(item_ids, trend) of the `k` most trending items."""
+        with self._lock:
+            n = len(self._index)
+            ids = self._item_ids[:n].copy()
+            decay = math.exp(-self._rate * ((now or time.time()) - self._ref))
+            trend = np.einsum("a,nas->n", ACTION_WEIGHTS, self._counts[:n].astype(float)) * decay
+        k = min(k, n)
+        if k <= 0:
+            return ids[:0], trend[:0]
+        part = np.argpartition(-trend, k - 1)[:k]
+        order = part[np.argsort(-trend[part], kind="stable")]
+        return ids[order], trend[order]
+
+
+_engine: Optional[TrendingEngine] = None
+_engine_lock = threading.Lock()
+
+
+def _catch_up(engine: TrendingEngine):
+    try:
+        engine.update()
+    except Exception:
+        incr("trending.update_error")
+
+
+def get_engine() -> TrendingEngine:
+    """Process-wide engine, restored from the checkpoint.
+
+    Activities since the checkpoint (the whole table when there is none) are
+    folded in from a background thread, so the first request is not held up
+    by the scan; reads see the counts grow batch by batch until it finishes.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = TrendingEngine()
+            _engine.restore()
+            threading.Thread(target=_catch_up, args=(_engine,), daemon=True, name="trending-catch-up").start()
+        return _engine